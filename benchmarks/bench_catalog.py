@@ -0,0 +1,125 @@
+"""
+Benchmark the flow catalog of past capture runs.
+
+Writes an archive of capture runs laid out like DEFAULT_PCAP_DIR ({service}/{env}/{timestamp}/,
+one capture per task, distinct calls in every run), then backfills the catalog with
+utils.flow_catalog.catalog_runs using a growing number of processes, times an incremental pass
+after one more run is captured and the queries of `pcap_tools.py find`. With --baseline, the
+Call-ID is also searched by opening every capture of the archive, one by one.
+
+Usage:
+    python benchmarks/bench_catalog.py [--runs 300] [--tasks 2] [--calls 20] [--workers 1 2 4] [--baseline]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from synthetic_pcap import sip_call, write_pcap
+import repo_path  # noqa: F401  (puts the repository root on sys.path)
+from utils.flow_catalog import catalog_runs, query_flows
+from utils.pcap_merge import PcapReader
+
+DAY = 86400
+
+
+def write_run(archive, run, tasks, calls, rtp_packets):
+    """Write the per-task captures of one run. Returns the number of packets written."""
+    folder = os.path.join(archive, "PCSCF", "prod", time.strftime("%Y-%m-%d-%H-%M", time.gmtime(1_700_000_000 + run * DAY)))
+    os.makedirs(folder)
+    written = 0
+    for task in range(tasks):
+        packets = []
+        for call in range(calls):
+            index = (run * tasks + task) * calls + call
+            packets.extend(sip_call(index, 1_700_000_000 + run * DAY + call * 0.05, rtp_packets=rtp_packets))
+        packets.sort(key=lambda packet: packet[0])
+        write_pcap(os.path.join(folder, f"tcpdump_task{task:03d}.pcap"), packets)
+        written += len(packets)
+    return written
+
+
+def baseline(archive, call_id):
+    """Open every capture of the archive and look for the Call-ID in its packets."""
+    start = time.perf_counter()
+    needle = call_id.encode()
+    found = []
+    for folder, _, files in os.walk(archive):
+        for name in sorted(files):
+            if not name.startswith("tcpdump_"):
+                continue
+            with PcapReader(os.path.join(folder, name)) as reader:
+                if any(needle in data for _, _, _, _, _, data, _, _ in reader):
+                    found.append(name)
+    return time.perf_counter() - start, len(found)
+
+
+def time_query(catalog, repeat, **query):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        flows = query_flows(catalog, **query)
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds), len(flows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=300)
+    parser.add_argument("--tasks", type=int, default=2, help="Captures per run")
+    parser.add_argument("--calls", type=int, default=20, help="Calls per capture")
+    parser.add_argument("--rtp-packets", type=int, default=50, help="RTP packets per call and direction")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeat", type=int, default=20, help="Times each query runs")
+    parser.add_argument("--baseline", action="store_true", help="Also search a Call-ID by opening every capture")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="ecx-catalog-bench-")
+    try:
+        archive = os.path.join(work_dir, "Pcaps")
+        catalog = os.path.join(work_dir, "flow_catalog.sqlite")
+        packets = sum(write_run(archive, run, args.tasks, args.calls, args.rtp_packets) for run in range(args.runs))
+        print(f"{args.runs} runs, {args.runs * args.tasks} captures, {packets} packets, {os.cpu_count()} CPUs")
+
+        print(f"{'workers':>8} {'seconds':>8} {'pkt/s':>10} {'flows':>8} {'speedup':>8}")
+        first = None
+        for workers in args.workers:
+            for path in (catalog, catalog + "-wal", catalog + "-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+            stats = catalog_runs([archive], catalog, workers)
+            first = first or stats["seconds"]
+            print(f"{stats['workers']:>8} {stats['seconds']:>8.2f} {packets / stats['seconds']:>10.0f} {stats['flows']:>8} "
+                  f"{first / stats['seconds']:>7.1f}x")
+
+        stats = catalog_runs([archive], catalog)
+        print(f"incremental, nothing new: {stats['seconds'] * 1000:.0f} ms ({stats['unchanged']} files unchanged)")
+        write_run(archive, args.runs, args.tasks, args.calls, args.rtp_packets)
+        stats = catalog_runs([archive], catalog)
+        print(f"incremental, one new run: {stats['seconds'] * 1000:.0f} ms ({stats['indexed']} files indexed)")
+
+        first_call = "call-0@ecx"
+        queries = {
+            "Call-ID, oldest run": {"call_id": first_call},
+            "Call-ID, newest run": {"call_id": f"call-{args.runs * args.tasks * args.calls}@ecx"},
+            "RTP port": {"port": 20000 + 2 * (args.calls + 1)},
+            "IP, latest 200 flows": {"ip": "10.0.2.20"},
+            "IP + port + window": {"ip": "10.0.1.10", "port": 5060, "start_ns": (1_700_000_000 + 10 * DAY) * 10 ** 9,
+                                   "end_ns": (1_700_000_000 + 11 * DAY) * 10 ** 9},
+        }
+        print(f"{'query':<24} {'ms':>8} {'flows':>6}")
+        for name, query in queries.items():
+            seconds, flows = time_query(catalog, args.repeat, **query)
+            print(f"{name:<24} {seconds * 1000:>8.2f} {flows:>6}")
+
+        if args.baseline:
+            seconds, found = baseline(archive, first_call)
+            print(f"baseline: Call-ID found in {found} captures by opening all of them in {seconds:.2f}s")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark ECS discovery time against task count.
+
+Runs `get_ecs_clusters` against a stubbed ECS API with a fixed per-call
+latency, and compares it with the previous serial, unbatched algorithm.
+
+Usage:
+    python benchmarks/bench_discovery.py [--latency 0.05] [--tasks 10 100 400]
+"""
+import argparse
+import time
+
+import boto3
+
+import repo_path  # noqa: F401  (puts the repository root on sys.path)
+from fake_aws import FakeECSClient, install_fake_session
+from utils import aws_services
+
+
+def serial_discovery(session, regions, cluster_key_name):
+    # Previous algorithm: regions one by one, one describe_tasks per task
+    clusters = {}
+    for region in regions:
+        ecs_client = session.client('ecs', region_name=region)
+        clusters[region] = {}
+        for cluster in ecs_client.list_clusters()['clusterArns']:
+            if cluster_key_name.lower() in cluster.lower():
+                tasks = ecs_client.list_tasks(cluster=cluster)['taskArns']
+                for task_arn in tasks:
+                    ecs_client.describe_tasks(cluster=cluster, tasks=[task_arn])
+                clusters[region][cluster.split("/")[1]] = {"tasks": [t.split('/')[2] for t in tasks]}
+    return clusters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated latency per API call in seconds")
+    parser.add_argument("--clusters", type=int, default=2, help="Matching clusters per region")
+    parser.add_argument("--regions", nargs="+", default=["us-east-2", "us-west-2"])
+    parser.add_argument("--tasks", type=int, nargs="+", default=[10, 50, 100, 250, 500],
+                        help="Tasks per cluster to benchmark")
+    args = parser.parse_args()
+
+    print(f"{'tasks':>8} {'serial (s)':>12} {'calls':>7} {'concurrent (s)':>15} {'calls':>7} {'speedup':>8}")
+    for tasks in args.tasks:
+        factories = {"ecs": lambda region: FakeECSClient(region, args.latency, args.clusters, tasks)}
+        last_session = install_fake_session(factories)
+
+        session = boto3.Session()
+        start = time.perf_counter()
+        serial_discovery(session, args.regions, "kamailio-test")
+        serial_time = time.perf_counter() - start
+        serial_calls = session.api_calls
+
+        start = time.perf_counter()
+        clusters = aws_services.get_ecs_clusters("bench", args.regions, "kamailio-test")
+        concurrent_time = time.perf_counter() - start
+        concurrent_calls = last_session().api_calls
+
+        found = sum(len(c["tasks"]) for region in clusters.values() for c in region.values())
+        assert found == tasks * args.clusters * len(args.regions)
+
+        total_tasks = tasks * args.clusters * len(args.regions)
+        print(f"{total_tasks:>8} {serial_time:>12.3f} {serial_calls:>7} {concurrent_time:>15.3f} "
+              f"{concurrent_calls:>7} {serial_time / concurrent_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
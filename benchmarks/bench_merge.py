@@ -0,0 +1,79 @@
+"""
+Benchmark the native streaming pcap merge.
+
+Writes N synthetic per-target pcaps of a configurable size, merges them with
+utils.pcap_merge.merge_pcaps in a child process and reports throughput and
+the child's peak RSS. Runs mergecap too when it is installed.
+
+Usage:
+    python benchmarks/bench_merge.py [--files 8] [--size-mb 16 64]
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_pcap import random_udp_stream, write_pcap
+import repo_path  # noqa: F401  (puts the repository root on sys.path)
+from utils.pcap_merge import merge_pcaps
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def merge_in_child(input_files, output_file, queue):
+    baseline = peak_rss_mb()
+    stats = merge_pcaps(input_files, output_file)
+    stats["peak_rss_mb"] = peak_rss_mb()
+    stats["baseline_rss_mb"] = baseline
+    queue.put(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--size-mb", type=float, nargs="+", default=[4, 16])
+    parser.add_argument("--payload", type=int, default=200, help="UDP payload size in bytes")
+    args = parser.parse_args()
+
+    frame_size = args.payload + 44 + 16
+    print(f"{'input MB':>9} {'packets':>9} {'seconds':>8} {'MB/s':>7} {'pkt/s':>9} {'peak RSS MB':>12} {'mergecap s':>11}")
+
+    for size_mb in args.size_mb:
+        work_dir = tempfile.mkdtemp(prefix="ecx-merge-bench-")
+        try:
+            per_file = int(size_mb * 1024 * 1024 / args.files / frame_size)
+            inputs = []
+            for i in range(args.files):
+                path = os.path.join(work_dir, f"tcpdump_{i}.pcap")
+                write_pcap(path, random_udp_stream(per_file, payload_size=args.payload, seed=i, host=i + 1))
+                inputs.append(path)
+
+            queue = multiprocessing.Queue()
+            child = multiprocessing.Process(target=merge_in_child, args=(inputs, os.path.join(work_dir, "merged.pcap"), queue))
+            child.start()
+            stats = queue.get()
+            child.join()
+
+            mergecap_time = "n/a"
+            if shutil.which("mergecap"):
+                start = time.perf_counter()
+                subprocess.run(["mergecap", "-F", "pcap", "-w", os.path.join(work_dir, "mergecap.pcap"), *inputs], check=True)
+                mergecap_time = f"{time.perf_counter() - start:.2f}"
+
+            mb = stats["bytes"] / 1024 / 1024
+            print(f"{mb:>9.1f} {stats['packets']:>9} {stats['seconds']:>8.2f} {mb / stats['seconds']:>7.1f} "
+                  f"{stats['packets'] / stats['seconds']:>9.0f} {stats['peak_rss_mb']:>12.1f} {mergecap_time:>11}")
+        finally:
+            shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
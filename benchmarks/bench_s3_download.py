@@ -0,0 +1,86 @@
+"""
+Benchmark pcap downloads from S3 against a local stand-in (moto).
+
+Compares the previous approach (a new session and client per file, files one
+after another) with S3DownloadManager. A per-request latency can be injected
+to mimic the round trip to a real bucket.
+
+Usage:
+    pip install "moto[s3]"
+    python benchmarks/bench_s3_download.py [--files 40] [--size-mb 8] [--latency 0.02]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import repo_path  # noqa: F401  (puts the repository root on sys.path)
+import boto3
+from moto import mock_aws
+
+from utils import aws_services
+
+BUCKET = "capture-pcaps-bench"
+REGION = "us-east-1"
+
+
+def add_latency(events, latency):
+    if latency:
+        events.register("before-send.s3", lambda **kwargs: time.sleep(latency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated latency per S3 request in seconds")
+    parser.add_argument("--chunksize-mb", type=int, default=4)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    real_session = boto3.Session
+
+    with mock_aws():
+        s3 = boto3.client("s3", region_name=REGION)
+        s3.create_bucket(Bucket=BUCKET)
+        payload = os.urandom(int(args.size_mb * 1024 * 1024))
+        keys = [f"tcpdump_{i:032x}.pcap" for i in range(args.files)]
+        for key in keys:
+            s3.put_object(Bucket=BUCKET, Key=key, Body=payload)
+
+        def session_with_latency(**kwargs):
+            session = real_session(**kwargs)
+            add_latency(session.events, args.latency)
+            return session
+
+        boto3.Session = session_with_latency
+        total_mb = args.files * args.size_mb
+        work_dir = tempfile.mkdtemp(prefix="ecx-bench-")
+        try:
+            serial_dir = os.path.join(work_dir, "serial")
+            start = time.perf_counter()
+            for key in keys:
+                aws_services.get_pcap_from_s3(None, BUCKET, key, REGION, serial_dir)
+            serial_time = time.perf_counter() - start
+
+            manager_dir = os.path.join(work_dir, "manager")
+            config = {"multipartChunksizeMB": args.chunksize_mb}
+            with aws_services.S3DownloadManager(None, BUCKET, REGION, manager_dir, config) as downloader:
+                start = time.perf_counter()
+                for future in [downloader.submit(key) for key in keys]:
+                    future.result()
+                manager_time = time.perf_counter() - start
+            assert downloader.files_downloaded == args.files
+        finally:
+            shutil.rmtree(work_dir)
+
+    print(f"\n{args.files} files x {args.size_mb} MB, {args.latency * 1000:.0f} ms per request")
+    print(f"serial, client per file : {serial_time:7.2f}s  {total_mb / serial_time:8.1f} MB/s")
+    print(f"S3DownloadManager       : {manager_time:7.2f}s  {total_mb / manager_time:8.1f} MB/s  "
+          f"({serial_time / manager_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark the parallel SIP summary of per-task captures.
+
+Writes one synthetic capture per task (overlapping calls with RTP, some failing), then
+summarizes the run folder with utils.sip_summary.summarize_sip using a growing number of
+processes. With --baseline, a serial loop decoding and parsing every packet of every file
+runs on the same captures for comparison.
+
+Usage:
+    python benchmarks/bench_sip_summary.py [--tasks 8] [--calls 500] [--workers 1 2 4 8] [--baseline]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from synthetic_pcap import sip_call, write_pcap
+import repo_path  # noqa: F401  (puts the repository root on sys.path)
+from utils.common import list_capture_files
+from utils.packets import is_sip, parse_sip, parse_transport
+from utils.pcap_merge import PcapReader
+from utils.sip_summary import summarize_sip
+
+
+def write_task_captures(folder, tasks, calls, rtp_packets):
+    """Write one capture per task, every tenth call failing with a 486. Returns the number of packets written."""
+    written = 0
+    for task in range(tasks):
+        packets = []
+        for index in range(task * calls, (task + 1) * calls):
+            packets.extend(sip_call(index, 1_700_000_000 + (index - task * calls) * 0.05, rtp_packets=rtp_packets,
+                                    setup_delay=0.1 + (index % 7) * 0.05, status=486 if index % 10 == 0 else 200))
+        packets.sort(key=lambda packet: packet[0])
+        write_pcap(os.path.join(folder, f"tcpdump_task{task:03d}.pcap"), packets)
+        written += len(packets)
+    return written
+
+
+def baseline(folder):
+    """Serial loop decoding every packet of every file, counting SIP messages."""
+    start = time.perf_counter()
+    messages = 0
+    for capture_file in list_capture_files(folder):
+        with PcapReader(capture_file) as reader:
+            for _, _, _, _, _, data, link_id, _ in reader:
+                transport = parse_transport(data, reader.linktypes[link_id])
+                if transport and is_sip(transport[5]) and parse_sip(transport[5]):
+                    messages += 1
+    return time.perf_counter() - start, messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=500, help="Calls per task")
+    parser.add_argument("--rtp-packets", type=int, default=100, help="RTP packets per call and direction")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--baseline", action="store_true", help="Also time a serial per-packet loop")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="ecx-sip-bench-")
+    try:
+        packets = write_task_captures(work_dir, args.tasks, args.calls, args.rtp_packets)
+        size_mb = sum(os.path.getsize(f) for f in list_capture_files(work_dir)) / 1024 / 1024
+        print(f"{args.tasks} captures, {packets} packets, {size_mb:.0f} MB, {os.cpu_count()} CPUs")
+        if args.baseline:
+            seconds, messages = baseline(work_dir)
+            print(f"baseline: {messages} SIP messages in {seconds:.2f}s ({packets / seconds:.0f} pkt/s)")
+
+        print(f"{'workers':>8} {'seconds':>8} {'pkt/s':>10} {'messages':>9} {'calls':>7} {'p95 ms':>7} {'speedup':>8}")
+        first = None
+        for workers in args.workers:
+            summary = summarize_sip([work_dir], workers)
+            first = first or summary["seconds"]
+            print(f"{summary['workers']:>8} {summary['seconds']:>8.2f} {packets / summary['seconds']:>10.0f} "
+                  f"{summary['messages']:>9} {summary['calls']['total']:>7} {summary['setupLatency'].get('p95Ms', 0):>7.0f} "
+                  f"{first / summary['seconds']:>7.1f}x")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark time-window slicing of a large merged capture with the sparse time index.
+
+Writes a synthetic capture of the given size (UDP packets at a steady rate), builds its
+time index in a separate pass, then slices a window out of the middle with
+utils.time_index.slice_capture. With --baseline, the same window is also written by reading
+every packet of the capture, like opening it whole and filtering.
+
+Usage:
+    python benchmarks/bench_slice.py [--size-mb 1024 5120] [--window 30] [--baseline]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from synthetic_pcap import PCAP_HEADER, udp_packet
+import repo_path  # noqa: F401  (puts the repository root on sys.path)
+from utils.pcap_merge import PcapReader, PcapWriter
+from utils.time_index import build_time_index, slice_capture
+
+PACKET_RATE = 20_000
+CHUNK_PACKETS = 1_000_000
+
+
+def write_capture(path, size_mb, payload_size=300):
+    """Write about `size_mb` MB of UDP packets, PACKET_RATE per second. Returns (packets, first timestamp)."""
+    frame = udp_packet("10.0.0.1", "10.1.0.1", 5060, 5060, b"\x00" * payload_size)
+    record = np.frombuffer(bytes(16) + frame, dtype=np.uint8).copy()
+    record[8:12] = np.frombuffer(np.array([len(frame)], dtype="<u4").tobytes(), dtype=np.uint8)
+    record[12:16] = record[8:12]
+    packets = size_mb * 1024 * 1024 // len(record)
+    start = 1_700_000_000
+    with open(path, "wb") as capture:
+        capture.write(PCAP_HEADER)
+        for first in range(0, packets, CHUNK_PACKETS):
+            index = np.arange(first, min(first + CHUNK_PACKETS, packets))
+            microseconds = index * 1_000_000 // PACKET_RATE
+            rows = np.tile(record, (len(index), 1))
+            rows[:, 0:4] = (start + microseconds // 1_000_000).astype("<u4").view(np.uint8).reshape(-1, 4)
+            rows[:, 4:8] = (microseconds % 1_000_000).astype("<u4").view(np.uint8).reshape(-1, 4)
+            capture.write(rows.tobytes())
+    return packets, start
+
+
+def baseline(path, start_ns, end_ns, output_file):
+    """Read every packet and keep the ones in the window."""
+    begin = time.perf_counter()
+    with PcapReader(path) as reader, PcapWriter(output_file, reader.linktypes, reader.nanosecond) as writer:
+        for timestamp_ns, _, _, caplen, origlen, data, link_id, _ in reader:
+            if start_ns <= timestamp_ns <= end_ns:
+                writer.write(timestamp_ns, caplen, origlen, data, link_id)
+        packets = writer.packets
+    return time.perf_counter() - begin, packets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, nargs="+", default=[1024, 5120])
+    parser.add_argument("--window", type=float, default=30, help="Window length in seconds")
+    parser.add_argument("--baseline", action="store_true", help="Also time a full scan of the capture")
+    args = parser.parse_args()
+
+    print(f"{'MB':>6} {'packets':>10} {'index s':>8} {'slice ms':>9} {'window pkts':>12} {'baseline s':>11} {'speedup':>8}")
+    for size_mb in args.size_mb:
+        work_dir = tempfile.mkdtemp(prefix="ecx-slice-bench-")
+        try:
+            path = os.path.join(work_dir, "merged.pcap")
+            packets, start = write_capture(path, size_mb)
+            begin = time.perf_counter()
+            build_time_index(path)
+            index_time = time.perf_counter() - begin
+
+            # A window in the middle of the capture
+            start_ns = (start + packets // PACKET_RATE // 2) * 1_000_000_000
+            end_ns = start_ns + int(args.window * 1_000_000_000)
+            stats = slice_capture(path, start_ns, end_ns, os.path.join(work_dir, "window.pcap"))
+            baseline_time, speedup = "n/a", "n/a"
+            if args.baseline:
+                seconds, baseline_packets = baseline(path, start_ns, end_ns, os.path.join(work_dir, "baseline.pcap"))
+                assert baseline_packets == stats["packets"]
+                baseline_time, speedup = f"{seconds:.2f}", f"{seconds / stats['seconds']:.0f}x"
+            print(f"{size_mb:>6} {packets:>10} {index_time:>8.2f} {stats['seconds'] * 1000:>9.1f} {stats['packets']:>12} "
+                  f"{baseline_time:>11} {speedup:>8}")
+        finally:
+            shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark the interactive startup of ecx_capture.py.
+
+Time to first prompt: ecx_capture.py runs in a subprocess against a throwaway HOME (AWS config
+with SSO profiles, SSO cache) until it asks for the profile.
+
+Time to capture start: ecx_capture.main runs in-process against a stubbed ECS API with a fixed
+per-call latency. Every prompt takes the default answer after --think seconds, like a user
+reading the menu. The time the user spends waiting on the tool (everything but the prompts) until
+the capture starts is measured, with and without speculative discovery of the services while
+the prompts are answered.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--think 1.0] [--latency 0.3] [--tasks 100]
+"""
+import argparse
+import asyncio
+import builtins
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from fake_aws import FakeECSClient, install_fake_session
+from repo_path import REPO_ROOT
+PROMPT = "Which profile you want to use?"
+
+
+def make_home(profiles=20):
+    """Throwaway HOME with AWS SSO profiles and a valid SSO session."""
+    home = tempfile.mkdtemp(prefix="ecx-startup-bench-")
+    os.makedirs(os.path.join(home, ".aws", "sso", "cache"))
+    with open(os.path.join(home, ".aws", "config"), "w") as config:
+        for i in range(profiles):
+            config.write(f"[profile team-{i}-prod]\nsso_start_url = https://example.awsapps.com/start\nsso_region = us-east-1\n"
+                         f"sso_account_id = {i:012d}\nsso_role_name = Admin\nregion = us-east-2\n\n")
+    for i in range(50):
+        with open(os.path.join(home, ".aws", "sso", "cache", f"{i:040x}.json"), "w") as session:
+            json.dump({"startUrl": "https://example.awsapps.com/start",
+                       "expiresAt": (datetime.utcnow() + timedelta(hours=8)).strftime("%Y-%m-%dT%H:%M:%SZ")}, session)
+    return home
+
+
+def time_to_first_prompt(home):
+    env = dict(os.environ, HOME=home, PYTHONUNBUFFERED="1")
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "ecx_capture.py"], cwd=REPO_ROOT, env=env, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    output = b""
+    while PROMPT.encode() not in output:
+        chunk = process.stdout.read1(4096)
+        if not chunk:
+            raise RuntimeError("ecx_capture.py exited before the first prompt")
+        output += chunk
+    elapsed = time.perf_counter() - start
+    process.kill()
+    process.wait()
+    return elapsed
+
+
+def time_to_capture_start(home, think, latency, tasks, prefetch):
+    """Run ecx_capture.main until the capture would start, returning (seconds waiting on the tool, total seconds)."""
+    os.environ["HOME"] = home
+    import ecx_capture
+
+    with open(os.path.join(REPO_ROOT, "config", "config.json")) as config_file:
+        config = json.load(config_file)
+    config["inventoryCache"] = {"enabled": False, "prefetch": prefetch}
+    config["captureServices"] = {"SIP Servers": {
+        name: {"id": cluster, "type": "ecs"} for name, cluster in (("PCSCF", "kamailio-test"), ("SCSCF", "scscf"), ("ICSCF", "icscf"))
+    }}
+    config_path = os.path.join(home, "config.json")
+    with open(config_path, "w") as config_file:
+        json.dump(config, config_file)
+
+    answered = []
+    started = []
+
+    def answer(prompt=""):
+        time.sleep(think)
+        answered.append(time.perf_counter())
+        return ""
+
+    async def capture(*args, **kwargs):
+        started.append(time.perf_counter())
+
+    install_fake_session({"ecs": lambda region: FakeECSClient(region, latency, 2, tasks)})
+    real_input, real_stdout = builtins.input, sys.stdout
+    ecx_capture.config_file_path = config_path
+    ecx_capture.interactive_capture = capture
+    builtins.input, sys.stdout = answer, open(os.devnull, "w")
+    try:
+        start = time.perf_counter()
+        asyncio.run(ecx_capture.main())
+    finally:
+        sys.stdout.close()
+        builtins.input, sys.stdout = real_input, real_stdout
+    if not started:
+        raise RuntimeError("the capture didn't start")
+    total = started[0] - start
+    return total - len(answered) * think, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--think", type=float, default=1.0, help="Seconds the user takes to answer each prompt")
+    parser.add_argument("--latency", type=float, default=0.3, help="Simulated latency per API call in seconds")
+    parser.add_argument("--tasks", type=int, default=100, help="Tasks per cluster")
+    args = parser.parse_args()
+
+    home = make_home()
+    try:
+        first_prompt = [time_to_first_prompt(home) for _ in range(args.runs)]
+        print(f"time to first prompt: median {statistics.median(first_prompt) * 1000:.0f} ms, "
+              f"min {min(first_prompt) * 1000:.0f} ms over {args.runs} runs")
+
+        print(f"{'discovery':>12} {'waiting (s)':>12} {'total (s)':>10}")
+        for prefetch in (False, True):
+            wait, total = time_to_capture_start(home, args.think, args.latency, args.tasks, prefetch)
+            print(f"{'speculative' if prefetch else 'on demand':>12} {wait:>12.2f} {total:>10.2f}")
+    finally:
+        shutil.rmtree(home)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Local stand-ins for the AWS APIs used by ECXCapture.
+
+Every API call sleeps for a fixed latency so benchmarks show how the number
+of round trips (and how they are spread over threads) drives wall-clock time.
+"""
+import threading
+import time
+
+
+class FakePaginator:
+    def __init__(self, client, operation, result_key, page_size):
+        self.client = client
+        self.operation = operation
+        self.result_key = result_key
+        self.page_size = page_size
+
+    def paginate(self, **kwargs):
+        items = getattr(self.client, "_all_" + self.operation)(**kwargs)
+        for i in range(0, max(len(items), 1), self.page_size):
+            self.client._call()
+            yield {self.result_key: items[i:i + self.page_size]}
+
+
+class FakeClient:
+    def __init__(self, region, latency):
+        self.region = region
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+
+
+class FakeECSClient(FakeClient):
+    """ECS client holding `clusters` clusters of `tasks_per_cluster` tasks each."""
+
+    def __init__(self, region, latency, clusters, tasks_per_cluster):
+        super().__init__(region, latency)
+        self.cluster_arns = [f"arn:aws:ecs:{region}:000000000000:cluster/kamailio-test-{i}" for i in range(clusters)]
+        self.task_arns = {
+            arn: [f"arn:aws:ecs:{region}:000000000000:task/{arn.split('/')[1]}/{i:032x}" for i in range(tasks_per_cluster)]
+            for arn in self.cluster_arns
+        }
+
+    def get_paginator(self, operation):
+        if operation == "list_clusters":
+            return FakePaginator(self, operation, "clusterArns", 100)
+        return FakePaginator(self, operation, "taskArns", 100)
+
+    def _all_list_clusters(self):
+        return self.cluster_arns
+
+    def _all_list_tasks(self, cluster):
+        return self.task_arns[cluster]
+
+    def list_clusters(self):
+        self._call()
+        return {"clusterArns": self.cluster_arns[:100]}
+
+    def list_tasks(self, cluster):
+        self._call()
+        return {"taskArns": self.task_arns[cluster][:100]}
+
+    def describe_tasks(self, cluster, tasks):
+        if len(tasks) > 100:
+            raise ValueError("describe_tasks accepts at most 100 tasks")
+        self._call()
+        return {"tasks": [{
+            "taskArn": arn,
+            "containers": [{"networkInterfaces": [{"privateIpv4Address": "10.0.0.1"}]}],
+        } for arn in tasks]}
+
+
+class FakeSession:
+    """Drop-in for boto3.Session that hands out fake clients per region."""
+
+    def __init__(self, factories, **kwargs):
+        self.factories = factories
+        self.clients = []
+
+    def client(self, service_name, region_name=None, **kwargs):
+        client = self.factories[service_name](region_name)
+        self.clients.append(client)
+        return client
+
+    @property
+    def available_profiles(self):
+        return ["bench-prod"]
+
+    @property
+    def api_calls(self):
+        return sum(client.calls for client in self.clients)
+
+
+def install_fake_session(factories):
+    """Patch `boto3.Session`, which utils.aws_services imports on first use, and return a getter for the last created session."""
+    import boto3
+    created = []
+
+    def session_factory(**kwargs):
+        session = FakeSession(factories, **kwargs)
+        created.append(session)
+        return session
+
+    boto3.Session = session_factory
+    return lambda: created[-1]
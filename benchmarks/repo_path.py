@@ -0,0 +1,8 @@
+"""
+Put the repository root on sys.path, so the benchmarks run as scripts import the tool's modules.
+"""
+import os
+import sys
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_ROOT)
@@ -0,0 +1,106 @@
+"""
+Synthetic capture generator shared by the benchmarks.
+
+Packets use the Linux cooked (SLL) link type, like `tcpdump -i any` on the targets.
+"""
+import random
+import socket
+import struct
+
+LINKTYPE_LINUX_SLL = 113
+PCAP_HEADER = struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 262144, LINKTYPE_LINUX_SLL)
+
+
+def udp_packet(src, dst, sport, dport, payload):
+    """Build an SLL + IPv4 + UDP frame (checksums left at zero)."""
+    sll = struct.pack(">HHH8sH", 0, 1, 6, b"\x02\x00\x00\x00\x00\x01\x00\x00", 0x0800)
+    udp = struct.pack(">HHHH", sport, dport, 8 + len(payload), 0) + payload
+    ip = struct.pack(">BBHHHBBH4s4s", 0x45, 0, 20 + len(udp), 0, 0, 64, 17, 0,
+                     socket.inet_aton(src), socket.inet_aton(dst))
+    return sll + ip + udp
+
+
+def write_pcap(path, packets):
+    """Write (timestamp_seconds, frame) tuples into a classic pcap file."""
+    with open(path, "wb") as file:
+        file.write(PCAP_HEADER)
+        for timestamp, frame in packets:
+            ts_sec = int(timestamp)
+            ts_usec = int(round((timestamp - ts_sec) * 1_000_000))
+            if ts_usec == 1_000_000:
+                ts_sec, ts_usec = ts_sec + 1, 0
+            file.write(struct.pack("<IIII", ts_sec, ts_usec, len(frame), len(frame)))
+            file.write(frame)
+
+
+def random_udp_stream(count, start=1_700_000_000.0, rate=1000.0, payload_size=200, seed=0, host=1):
+    """Yield `count` UDP packets with jittered inter-arrival times, in timestamp order."""
+    rng = random.Random(seed)
+    timestamp = start
+    payload = bytes(rng.getrandbits(8) for _ in range(payload_size))
+    for i in range(count):
+        timestamp += rng.expovariate(rate)
+        frame = udp_packet(f"10.0.{host // 256}.{host % 256}", "10.1.0.1", 5060, 5060,
+                           struct.pack(">I", i) + payload[4:])
+        yield timestamp, frame
+
+
+def sip_message(first_line, call_id, cseq, method, sdp=None):
+    headers = [first_line, "Via: SIP/2.0/UDP 10.0.0.1:5060;branch=z9hG4bK" + call_id[:8],
+               "From: <sip:alice@example.com>;tag=1", "To: <sip:bob@example.com>",
+               f"Call-ID: {call_id}", f"CSeq: {cseq} {method}"]
+    body = ""
+    if sdp:
+        ip, port = sdp
+        body = f"v=0\r\no=- 0 0 IN IP4 {ip}\r\ns=-\r\nc=IN IP4 {ip}\r\nt=0 0\r\nm=audio {port} RTP/AVP 0\r\n"
+        headers.append("Content-Type: application/sdp")
+    headers.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(headers) + "\r\n\r\n" + body).encode()
+
+
+def rtp_packet(ssrc, seq, rtp_timestamp, payload_size=160):
+    return struct.pack(">BBHII", 0x80, 0, seq & 0xFFFF, rtp_timestamp & 0xFFFFFFFF, ssrc) + b"\xd5" * payload_size
+
+
+def sip_call(index, start, rtp_packets=250, setup_delay=0.2, status=200, loss=0.0, seed=0):
+    """
+    Yield the packets of one call: INVITE/100/200/ACK, RTP both ways (20 ms ptime) and BYE/200.
+
+    Calls get distinct media ports from their index; `loss` drops that share of RTP packets.
+    """
+    rng = random.Random(seed * 7919 + index)
+    call_id = f"call-{index}@ecx"
+    a_ip, b_ip = "10.0.1.10", "10.0.2.20"
+    a_port, b_port = 20000 + 2 * (index % 10000), 40000 + 2 * (index % 10000)
+    packets = [
+        (start, udp_packet(a_ip, b_ip, 5060, 5060, sip_message("INVITE sip:bob@example.com SIP/2.0", call_id, 1, "INVITE", (a_ip, a_port)))),
+        (start + 0.01, udp_packet(b_ip, a_ip, 5060, 5060, sip_message("SIP/2.0 100 Trying", call_id, 1, "INVITE"))),
+    ]
+    answer = start + setup_delay
+    if status != 200:
+        packets.append((answer, udp_packet(b_ip, a_ip, 5060, 5060, sip_message(f"SIP/2.0 {status} Error", call_id, 1, "INVITE"))))
+        return packets
+    packets.append((answer, udp_packet(b_ip, a_ip, 5060, 5060, sip_message("SIP/2.0 200 OK", call_id, 1, "INVITE", (b_ip, b_port)))))
+    packets.append((answer + 0.01, udp_packet(a_ip, b_ip, 5060, 5060, sip_message("ACK sip:bob@example.com SIP/2.0", call_id, 1, "ACK"))))
+
+    ssrc_a, ssrc_b = 0x1000 + index, 0x8000 + index
+    for seq in range(rtp_packets):
+        for ssrc, src, sport, dst, dport in ((ssrc_a, a_ip, a_port, b_ip, b_port), (ssrc_b, b_ip, b_port, a_ip, a_port)):
+            if rng.random() < loss:
+                continue
+            arrival = answer + 0.02 + seq * 0.02 + rng.uniform(0, 0.004)
+            packets.append((arrival, udp_packet(src, dst, sport, dport, rtp_packet(ssrc, seq, seq * 160))))
+
+    end = answer + 0.04 + rtp_packets * 0.02
+    packets.append((end, udp_packet(a_ip, b_ip, 5060, 5060, sip_message("BYE sip:bob@example.com SIP/2.0", call_id, 2, "BYE"))))
+    packets.append((end + 0.01, udp_packet(b_ip, a_ip, 5060, 5060, sip_message("SIP/2.0 200 OK", call_id, 2, "BYE"))))
+    return packets
+
+
+def sip_calls(count, start=1_700_000_000.0, interval=0.05, **kwargs):
+    """Packets of `count` overlapping calls, sorted by timestamp."""
+    packets = []
+    for index in range(count):
+        packets.extend(sip_call(index, start + index * interval, **kwargs))
+    packets.sort(key=lambda packet: packet[0])
+    return packets
@@ -1,5 +1,15 @@
 from utils.aws_services import *
 from utils.common import *
+from utils.command_runner import CommandRunner, report_failures
+from utils.capture import (TCP_DUMP_EC2_LIVE_COMMAND, TCP_DUMP_ECS_LIVE_COMMAND, Ec2Capture, EcsCapture, capture_settings,
+                           ec2_capture_targets, ecs_capture_targets, leg_commands)
+from utils.capture_report import report_from_config
+from utils.capture_profile import resolve_capture_profile, validate_capture_filter
+from utils.inventory_cache import InventoryPrefetch, get_cached_inventory, resolve_inventory_refresh
+from utils.live_stream import DEFAULT_BUFFER_PACKETS, DEFAULT_MAX_DELAY, LiveOutput, LiveStream, merge_live_streams
+from utils.scheduler import CaptureScheduler, find_capture_service, iter_capture_services, load_job, parse_start_at, wait_for_stop
+import argparse
+import sys
 import json
 import asyncio
 from datetime import datetime
@@ -25,16 +35,270 @@ DEFAULT_PCAP_DIR = "./Pcaps/"
 LAB_REGIONS = ["us-east-1"]
 PROD_REGIONS = ["us-east-2", "us-west-2"]
 WIRESHARK_FILTERS = 'sip || esp || rtcp || rtp'
+DISCOVERY_FUNCTIONS = {"ecs": get_ecs_clusters, "ec2": get_ec2_instances}
 
-# Commands
-TCP_DUMP_ECS_COMMAND = "tcpdump -i any port not 22 -U -s0 -w ./pcapScript/tcpdump_{task_id}.pcap"
-MV_PCAP_TO_S3_ECS_COMMAND = "/root/.nvm/versions/node/v16.19.0/bin/node ./pcapScript/savePcap.js ./pcapScript/tcpdump_{task_id}.pcap {bucket_name}"
-TCP_DUMP_EC2_COMMAND = "sudo tcpdump -i any port not 22 -U -s0 -w /home/ec2-user/tcpdump_{instance_id}.pcap"
-TCP_DUMP_EC2_STO_AND_3MV_COMMAND = "sudo pkill tcpdump && sudo aws s3 cp /home/ec2-user/tcpdump_{instance_id}.pcap s3://{bucket_name}/tcpdump_{instance_id}.pcap"
 ECS_CONNECTION_COMMAND = 'aws ecs execute-command --region {region} --profile {sso_profile} --cluster {cluster} --task {task_id} --command "/bin/bash" --interactive'
 
 
-async def main():
+async def prompt_stop():
+    # Allow the user to stop tcpdump sessions when desired
+    while True:
+        user_input = (await asyncio.to_thread(input, "Type" + CYELLOW + " 'stop' " + CEND + "to stop tcpdump sessions: ")).strip()
+        if user_input.lower() == "stop":
+            break
+        else:
+            print("Invalid input !\n")
+
+
+def write_report(report, path, report_config=None):
+    # JSON report of the run and where its time went
+    if not (report_config or {}).get("enabled", True):
+        return
+    if report.write(path):
+        print(CYELLOW + "Capture timings, slowest phase first:" + CEND)
+        for line in report.summary():
+            print(f"  {line}")
+        print("Capture report: " + CGREEN + path + CEND)
+
+
+def merge_with_report(report, output_file, input_folders, merge_config=None, download_throughput=None):
+    # Wireshark is opened by the caller, after the report is written
+    with report.phase("merge", files=len(list_capture_files(input_folders, output_file))) as phase:
+        merged = merge_pcap_files_and_open(output_file, input_folders, WIRESHARK_FILTERS, merge_config, download_throughput,
+                                           open_wireshark=False)
+        phase["ok"] = merged
+        phase["bytes"] = os.path.getsize(output_file) if merged else 0
+    return merged
+
+
+def catalog_with_report(report, input_folders, catalog_config=None):
+    # Flow summaries of the run go into the catalog of past runs, searched with 'pcap_tools.py find'
+    if not (catalog_config or {}).get("enabled"):
+        return
+    # NumPy is only loaded here, once the capture is done
+    from utils.flow_catalog import DEFAULT_CATALOG_FILE, catalog_runs
+    input_folders = [input_folders] if isinstance(input_folders, str) else input_folders
+    try:
+        with report.phase("catalog") as phase:
+            stats = catalog_runs(input_folders, catalog_config.get("file", DEFAULT_CATALOG_FILE), catalog_config.get("workers"))
+            phase["files"] = stats["indexed"]
+            phase["ok"] = not stats["failed"]
+    except Exception as e:
+        print(CRED + f"Failed to catalog the capture: {e}" + CEND)
+        return
+    print(f"Cataloged {stats['flows']} flows from {stats['indexed']} files in {stats['seconds']:.1f}s")
+
+
+async def interactive_capture(capture, output_file, config_data):
+    """
+    Run one service capture until the user stops it, then merge its pcaps and open them in Wireshark.
+
+    Parameters:
+    - capture: EcsCapture or Ec2Capture.
+    - output_file: Path of the merged pcap, the capture report is written next to it.
+    - config_data: The whole config file.
+    """
+    try:
+        await capture.prepare()
+        running_targets = await capture.start()
+        if not running_targets:
+            print(CRED + "Failed to start any tcpdump session !" + CEND)
+            return
+        print(CGREEN + f"Started {len(running_targets)} tcpdump sessions..." + CEND)
+
+        with capture.report.phase("capturing", capture.name):
+            await prompt_stop()
+        await capture.stop()
+        print(CGREEN + "Stopped all tcpdump sessions." + CEND)
+
+        ########################################## S3 BUCKET DOWNLOAD PCAPs
+        print(CYELLOW + "Please wait while the script is downloading the pcap files..." + CEND)
+        await capture.collect()
+    finally:
+        await capture.close()
+
+    print(CGREEN + capture.downloader.summary() + CEND)
+    print(CGREEN + "Downloaded all pcap files. Opening the merged pcap in Wireshark..." + "\U0001F680" + CEND)
+    # Merge the pcap files and open in Wireshark
+    merged = merge_with_report(capture.report, output_file, capture.pcaps_folder, config_data.get("merge"), capture.downloader.throughput)
+    catalog_with_report(capture.report, capture.pcaps_folder, config_data.get("catalog"))
+    write_report(capture.report, os.path.splitext(output_file)[0] + "_report.json", config_data.get("report"))
+    if merged:
+        open_in_wireshark(output_file, WIRESHARK_FILTERS)
+
+
+async def live_capture(runner, commands, output_file, live_config=None):
+    """
+    Stream tcpdump from every target over its session and merge the streams live, skipping S3.
+
+    Parameters:
+    - runner: CommandRunner starting and stopping the sessions.
+    - commands: A dictionary of {target: session args} running a live tcpdump command.
+    - output_file: Path of the merged output, a FIFO read by Wireshark or a growing pcap.
+    - live_config: The "live" settings of the capture config.
+    """
+    live_config = live_config or {}
+    output = LiveOutput(output_file, live_config.get("output", "fifo"), WIRESHARK_FILTERS)
+    try:
+        await output.open()
+    except OSError as e:
+        print(CRED + f"Can't open the live output: {e}" + CEND)
+        return
+
+    try:
+        running_processes, start_results = await runner.spawn_all(commands)
+        report_failures(start_results, "start live tcpdump")
+
+        if not running_processes:
+            print(CRED + "Failed to start any tcpdump session !" + CEND)
+            return
+        print(CGREEN + f"Streaming {len(running_processes)} tcpdump sessions to {output_file}..." + CEND)
+        if output.mode != "fifo":
+            print("Follow it in Wireshark with: " + CYELLOW + f"tail -c +1 -f {output_file} | wireshark -k -i -" + CEND)
+
+        streams = [LiveStream(target, process.stdout, live_config.get("bufferPackets", DEFAULT_BUFFER_PACKETS))
+                   for target, process in running_processes.items()]
+        merge = asyncio.create_task(merge_live_streams(streams, output_file, live_config.get("maxDelaySeconds", DEFAULT_MAX_DELAY)))
+
+        await prompt_stop()
+        await runner.stop_all(running_processes)
+        try:
+            stats = await merge
+        except OSError as e:
+            print(CRED + f"Live merge stopped: {e}" + CEND)
+            return
+        print(CGREEN + f"Streamed {stats['packets']} packets from {len(streams)} sessions in {stats['seconds']:.1f}s" + CEND)
+        if stats["late"] or stats["dropped"]:
+            print(CYELLOW + f"{stats['late']} packets arrived late and were written out of order, {stats['dropped']} dropped" + CEND)
+    finally:
+        output.close()
+
+
+def refresh_targets(targets, refresh, target_kind):
+    # Pick up the result of a background revalidation of cached targets
+    if refresh is None:
+        return targets
+
+    print(CYELLOW + f"Checking cached {target_kind} are still up to date..." + CEND)
+    targets, changed = resolve_inventory_refresh(targets, refresh)
+    if changed:
+        print(CYELLOW + f"{target_kind} changed since they were cached, using the refreshed list: \n" + CGREEN +
+              f"{json.dumps(targets, indent=2)}" + CEND)
+    return targets
+
+
+async def batch_capture(job, force_refresh=False):
+    """
+    Capture several services and environments at once without any prompt, e.g. from a load test pipeline.
+
+    Every capture is prepared first, all start together at the start barrier and all stop on the first
+    stop trigger: the job duration, the stop file showing up, or SIGINT/SIGTERM. The pcaps of every
+    capture end up in one merged output.
+
+    Parameters:
+    - job: The batch job, with the "profile", the "captures" ({"environment", "service", "profile"}),
+      "durationSeconds", "stopFile", "startAt" (ISO 8601) and "output" path.
+    - force_refresh: Ignore the cached clusters/instances and rediscover them.
+
+    Returns:
+    The exit code, 0 when every capture completed and the merged pcap was written.
+    """
+    config_data = read_config(config_file_path)
+    if not config_data:
+        print(CRED + "Config file not found or invalid. Exiting..." + CEND)
+        return 1
+    try:
+        settings = capture_settings(config_data)
+        start_at = parse_start_at(job["startAt"]) if job.get("startAt") else None
+    except ValueError as e:
+        print(CRED + f"{e}" + CEND)
+        return 1
+    if not job.get("captures"):
+        print(CRED + "No captures in the job !" + CEND)
+        return 1
+    stop_file = job.get("stopFile")
+    if stop_file and os.path.exists(stop_file):
+        print(CRED + f"Stop file {stop_file} already exists, remove it first." + CEND)
+        return 1
+    if not job.get("durationSeconds") and not stop_file:
+        print(CYELLOW + "No duration or stop file in the job, stop the capture with SIGINT/SIGTERM." + CEND)
+
+    # The SSO login opens a browser, headless runs need a valid session already
+    expiration_time = get_sso_session_expiration()
+    if not expiration_time or expiration_time <= datetime.utcnow():
+        print(CRED + "SSO session expired, log in with 'aws sso login' before running a batch capture." + CEND)
+        return 1
+
+    run_time = datetime.now()
+    capture_id = run_time.strftime('%Y%m%d%H%M%S')
+    specs = {}
+    for entry in job["captures"]:
+        env = entry.get("environment")
+        profile = entry.get("profile", job.get("profile"))
+        found = find_capture_service(config_data.get("captureServices", {}), entry.get("service", ""))
+        if not found or env not in config_data.get("regions", {}) or not profile:
+            print(CRED + f"Invalid capture {entry}: unknown service or environment, or no profile." + CEND)
+            return 1
+        service, service_config = found
+        capture_legs = resolve_capture_profile(service_config)
+        for leg in capture_legs:
+            filter_error = validate_capture_filter(leg["filter"])
+            if filter_error:
+                print(CRED + f"Invalid capture filter '{leg['filter']}' of {service}: {filter_error}" + CEND)
+                return 1
+        if f"{service}@{env}" in specs:
+            print(CRED + f"{service} is captured twice in {env} !" + CEND)
+            return 1
+        specs[f"{service}@{env}"] = (profile, env, service, service_config, capture_legs)
+
+    report = report_from_config("batch", config_data.get("report"))
+
+    # Discover the targets of every capture at once
+    def discover(name, profile, env, service_config):
+        server_type = service_config.get("type").lower()
+        with report.phase("discovery", name):
+            inventory, refresh = get_cached_inventory(profile, server_type, service_config.get("id"), config_data.get("regions", {}).get(env),
+                                                      get_ecs_clusters if server_type == "ecs" else get_ec2_instances,
+                                                      config_data.get("inventoryCache"), force_refresh)
+        return refresh_targets(inventory, refresh, f"{server_type.upper()} targets") if inventory else inventory
+
+    inventories = await asyncio.gather(*(asyncio.to_thread(discover, name, profile, env, service_config)
+                                         for name, (profile, env, _, service_config, _) in specs.items()))
+
+    captures = {}
+    for (name, (profile, env, service, service_config, capture_legs)), inventory in zip(specs.items(), inventories):
+        if not inventory:
+            print(CRED + f"No targets found for {name} !" + CEND)
+            return 1
+        pcaps_folder_path = DEFAULT_PCAP_DIR + f"{service}/" + env + f"/{run_time.strftime('%Y-%m-%d-%H-%M')}/"
+        bucket = config_data.get("buckets", {}).get(env, {})
+        if service_config.get("type").lower() == "ecs":
+            captures[name] = EcsCapture(profile, ecs_capture_targets(inventory), capture_legs, settings, bucket, pcaps_folder_path, capture_id,
+                                        name, report)
+        else:
+            captures[name] = Ec2Capture(profile, ec2_capture_targets(inventory), capture_legs, settings, bucket, pcaps_folder_path, capture_id,
+                                        name, report)
+
+    scheduler = CaptureScheduler(captures, report)
+    result = await scheduler.run(lambda: wait_for_stop(job.get("durationSeconds"), stop_file), start_at)
+    if not result["captures"]:
+        print(CRED + "No capture completed !" + CEND)
+        return 1
+    print(CGREEN + f"Captures started within {result['startSkew']:.2f}s of each other, stopped by {result['reason']}." + CEND)
+    for name in result["captures"]:
+        print(CGREEN + f"{name}: {captures[name].downloader.summary()}" + CEND)
+
+    output_file = job.get("output") or DEFAULT_PCAP_DIR + f"batch/{run_time.strftime('%Y-%m-%d-%H-%M-%S')}.pcap"
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    merged = merge_with_report(report, output_file, [captures[name].pcaps_folder for name in result["captures"]], config_data.get("merge"))
+    catalog_with_report(report, [captures[name].pcaps_folder for name in result["captures"]], config_data.get("catalog"))
+    if merged:
+        print(CGREEN + f"Merged pcap: {output_file}" + CEND)
+    write_report(report, os.path.splitext(output_file)[0] + "_report.json", config_data.get("report"))
+    return 0 if merged and not scheduler.failed else 1
+
+
+async def main(force_refresh=False, live=False):
     print(CRED + textArt + CEND)
     print(CYELLOW + "Welcome to ECXCapture!" + "\U0001F40D" + CEND)
     print("It is a tool to capture your ECS/EC2 traffic in one place.")
@@ -50,6 +314,9 @@ async def main():
 
 
     ########################################## SSO PROFILE
+    # The SSO cache is scanned while the user picks a profile
+    sso_expiration = asyncio.get_running_loop().run_in_executor(None, get_sso_session_expiration)
+
     # Read available AWS SSO profiles
     sso_profiles = read_aws_sso_profiles()
 
@@ -83,7 +350,7 @@ async def main():
 
 
     # Check if the SSO session is expired
-    expiration_time = get_sso_session_expiration()
+    expiration_time = await sso_expiration
 
     if expiration_time and expiration_time > datetime.utcnow():
         print("SSO session for profile " + CGREEN + f"'{selected_profile}'" + CEND + " is still valid. No need to log in.")
@@ -121,8 +388,22 @@ async def main():
 
 
     selected_regions = config_data.get("regions", {}).get(env)
+    try:
+        settings = capture_settings(config_data)
+    except ValueError as e:
+        print(CRED + f"{e}" + CEND)
+        return
     print("Configured regions for selected env: " + CGREEN + f"{selected_regions}" + CEND)
 
+    # Discover the targets of every service in the background while the user picks one
+    inventory_config = config_data.get("inventoryCache", {})
+    prefetch = InventoryPrefetch(selected_profile, selected_regions, inventory_config, force_refresh)
+    if inventory_config.get("prefetch", True):
+        for _, _, capture_service in iter_capture_services(config_data.get("captureServices", {})):
+            discover = DISCOVERY_FUNCTIONS.get(capture_service.get("type", "").lower())
+            if discover:
+                prefetch.start(capture_service.get("type").lower(), capture_service.get("id"), discover)
+
 
     ########################################## List all services that we can capture from config file
     print("\nAvailable capture types: ")
@@ -164,6 +445,7 @@ async def main():
             try:
                 if not service_input:
                     service = list(sub_service_config.keys())[0]
+                    sub_service_config = config_data["captureServices"][service_config][service]
                     break
 
                 if int(service_input) < 1 or int(service_input) > len(sub_service_config):
@@ -181,10 +463,22 @@ async def main():
     print("===============================================")
     server_type = sub_service_config.get("type").lower()
 
+    # Capture profile of the service, checked here rather than on every target
+    capture_legs = resolve_capture_profile(sub_service_config)
+    for leg in capture_legs:
+        filter_error = validate_capture_filter(leg["filter"])
+        if filter_error:
+            print(CRED + f"Invalid capture filter '{leg['filter']}': {filter_error}" + CEND)
+            return
+
+
+    report = report_from_config(service, config_data.get("report"))
 
     ########################################## ECS Services Capture
     if server_type == 'ecs':
-        ecs_clusters = get_ecs_clusters(selected_profile, selected_regions, sub_service_config.get("id"))
+        with report.phase("discovery", service, prefetched=prefetch.started(server_type, sub_service_config.get("id"))):
+            ecs_clusters, inventory_refresh = prefetch.get(server_type, sub_service_config.get("id"), get_ecs_clusters)
+        prefetch.close()
 
         if not ecs_clusters:
             print(CRED + "No ECS clusters found !" + CEND)
@@ -214,61 +508,29 @@ async def main():
 
         if action == 1:
             input(CYELLOW + "======> Ready to start capture? Press Enter to continue..." + CEND)
+            ecs_clusters = refresh_targets(ecs_clusters, inventory_refresh, "ECS clusters")
 
-            running_processes = []
-            task_ids = []
-
-            # Start tcpdump on each task
-            for region, clusters in ecs_clusters.items():
-                for cluster_name, cluster_info in clusters.items():
-                    for task_id in cluster_info.get("tasks", []):
-                        # Run tcpdump on each task in the background
-                        process = await run_ecs_command(region, selected_profile, cluster_name, task_id, TCP_DUMP_ECS_COMMAND.format(task_id=task_id))
-                        running_processes.append(process)
-                        task_ids.append(task_id)
+            ecs_targets = ecs_capture_targets(ecs_clusters)
 
-            if not running_processes:
+            if not ecs_targets:
                 print(CRED + "No ECS tasks found !" + CEND)
                 return
-            else:
-                print(CGREEN + f"Started {len(running_processes)} tcpdump sessions..." + CEND)
 
-            # Allow the user to stop tcpdump sessions when desired
-            while True:
-                user_input = input("Type" + CYELLOW + " 'stop' " + CEND + "to stop tcpdump sessions: ").strip()
-                if user_input.lower() == "stop":
-                    break
-                else:
-                    print("Invalid input !\n")
-                
-            for process in running_processes:
-                stop_command(process)
-            
-            print(CGREEN + "Stopped all tcpdump sessions." + CEND)
-            
-
-            ########################################## S3 BUCKET DOWNLOAD PCAPs
-            print(CYELLOW + "Please wait while the script is downloading the pcap files..." + CEND)
-
-            # Move the pcap files to S3
-            for region, clusters in ecs_clusters.items():
-                for cluster_name, cluster_info in clusters.items():
-                    for task_id in cluster_info.get("tasks", []):
-                        process = await run_ecs_command(region, selected_profile, cluster_name, task_id,
-                                                            MV_PCAP_TO_S3_ECS_COMMAND.format(task_id=task_id, bucket_name=config_data.get("buckets", {}).get(env, {}).get("name")))
-                        process.wait()
-            
-            # Download the pcap files from S3
+            capture_id = datetime.now().strftime('%Y%m%d%H%M%S')
             pcaps_folder_path = DEFAULT_PCAP_DIR + f"{service}/" + env + f"/{datetime.now().strftime('%Y-%m-%d-%H-%M')}/"
-            
-            for task_id in task_ids:
-                get_pcap_from_s3(selected_profile, config_data.get("buckets", {}).get(env, {}).get("name"), f"tcpdump_{task_id}.pcap", 
-                                 config_data.get("buckets", {}).get(env, {}).get("region"), pcaps_folder_path)
-                
-            
-            print(CGREEN + "Downloaded all pcap files. Opening the merged pcap in Wireshark..." + "\U0001F680" + CEND)
-            # Merge the pcap files and open in Wireshark
-            merge_pcap_files_and_open(pcaps_folder_path + f"{service}.pcap", pcaps_folder_path, WIRESHARK_FILTERS)
+
+            if live:
+                await live_capture(CommandRunner.from_config(config_data.get("execution")), {
+                    f"{task_id}{leg['suffix']}": ecs_command_args(region, selected_profile, cluster_name, task_id,
+                                                                  leg_commands(TCP_DUMP_ECS_LIVE_COMMAND, [leg])[0])
+                    for task_id, (region, cluster_name) in ecs_targets.items() for leg in capture_legs
+                }, pcaps_folder_path + f"{service}_live.pcap", config_data.get("capture", {}).get("live"))
+                return
+
+            # One session per task for the whole capture: start, stop and upload all go through it
+            await interactive_capture(EcsCapture(selected_profile, ecs_targets, capture_legs, settings, config_data.get("buckets", {}).get(env, {}),
+                                                 pcaps_folder_path, capture_id, service, report),
+                                      pcaps_folder_path + f"{service}.pcap", config_data)
         elif action == 2:
             for region, clusters in ecs_clusters.items():
                 for cluster_name, cluster_info in clusters.items():
@@ -278,7 +540,9 @@ async def main():
     ########################################## EC2 Services Capture
     else:
         # Get EC2 instances information
-        ec2_instances = get_ec2_instances(selected_profile, selected_regions, sub_service_config.get("id"))
+        with report.phase("discovery", service, prefetched=prefetch.started(server_type, sub_service_config.get("id"))):
+            ec2_instances, inventory_refresh = prefetch.get(server_type, sub_service_config.get("id"), get_ec2_instances)
+        prefetch.close()
 
         if not ec2_instances:
             print(CRED + "No EC2 instances found !" + CEND)
@@ -287,50 +551,58 @@ async def main():
         print("Available EC2 instances for selected service: \n" + CGREEN + f"{json.dumps(ec2_instances, indent=2)}" + CEND)
         
         input(CYELLOW + "======> Ready to start capture? Press Enter to continue..." + CEND)
+        ec2_instances = refresh_targets(ec2_instances, inventory_refresh, "EC2 instances")
 
-        running_processes = []
-        instance_ids = []
-        # Start tcpdump on each instance
-        for region, instances in ec2_instances.items():
-            for instance in instances:
-                # Run tcpdump on each instance in the background
-                process = await run_ec2_command(region, selected_profile, instance.get("InstanceId"), TCP_DUMP_EC2_COMMAND.format(instance_id=instance.get("InstanceId")))
-                process.wait()
-                running_processes.append(process)
-
-        print(CGREEN + f"Started {len(running_processes)} tcpdump sessions..." + CEND)
-
-        # Allow the user to stop tcpdump sessions when desired
-        while True:
-            user_input = input("Type" + CYELLOW + " 'stop' " + CEND + "to stop tcpdump sessions: ").strip()
-            if user_input.lower() == "stop":
-                break
-            else:
-                print("Invalid input !\n")
+        ec2_targets = ec2_capture_targets(ec2_instances)
 
-        # Stop tcpdump on each instance and move the pcap file to S3
-        for region, instances in ec2_instances.items():
-            for instance in instances:
-                # Stop tcpdump and move the pcap file to S3
-                process = await run_ec2_command(region, selected_profile, instance.get("InstanceId"), TCP_DUMP_EC2_STO_AND_3MV_COMMAND.format(instance_id=instance.get("InstanceId"), bucket_name=config_data.get("buckets", {}).get(env, {}).get("name")))
-                process.wait()
-                instance_ids.append(instance.get("InstanceId"))
-
-
-        # Download the pcap files from S3
+        capture_id = datetime.now().strftime('%Y%m%d%H%M%S')
         pcaps_folder_path = DEFAULT_PCAP_DIR + f"{service}/" + env + f"/{datetime.now().strftime('%Y-%m-%d-%H-%M')}/"
-        
-        for instance_id in instance_ids:
-            get_pcap_from_s3(selected_profile, config_data.get("buckets", {}).get(env, {}).get("name"), f"tcpdump_{instance_id}.pcap",
-                              config_data.get("buckets", {}).get(env, {}).get("region"), pcaps_folder_path)
-            
-        print(CGREEN + "Downloaded all pcap files. Opening the merged pcap in Wireshark..." + "\U0001F680" + CEND)
 
-        # Merge the pcap files and open in Wireshark
-        merge_pcap_files_and_open(pcaps_folder_path + f"{service}.pcap", pcaps_folder_path, WIRESHARK_FILTERS)
+        if live:
+            await live_capture(CommandRunner.from_config(config_data.get("execution")), {
+                f"{instance_id}{leg['suffix']}": ssm_session_args(region, selected_profile, instance_id,
+                                                                  leg_commands(TCP_DUMP_EC2_LIVE_COMMAND, [leg])[0])
+                for region, instance_ids in ec2_targets.items() for instance_id in instance_ids for leg in capture_legs
+            }, pcaps_folder_path + f"{service}_live.pcap", config_data.get("capture", {}).get("live"))
+            return
+
+        await interactive_capture(Ec2Capture(selected_profile, ec2_targets, capture_legs, settings, config_data.get("buckets", {}).get(env, {}),
+                                             pcaps_folder_path, capture_id, service, report),
+                                  pcaps_folder_path + f"{service}.pcap", config_data)
 
     print(CGREEN + "Thank you for using this tool!" + CEND + "\U0001F31F")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Capture your ECS/EC2 traffic in one place.")
+    parser.add_argument("--refresh-inventory", action="store_true",
+                        help="Ignore the cached clusters/instances and rediscover them")
+    parser.add_argument("--live", action="store_true",
+                        help="Stream tcpdump over the sessions and merge it live instead of going through S3")
+    batch = parser.add_argument_group("batch mode", "Capture without prompts, from a job file and/or these options")
+    batch.add_argument("--job", help="JSON job file")
+    batch.add_argument("--profile", help="AWS SSO profile of the captures")
+    batch.add_argument("--capture", action="append", default=[], metavar="ENV:SERVICE",
+                       help="Capture a service, e.g. 'prod:PCSCF' or 'prod:Media Servers/RTPENGINE' (repeatable)")
+    batch.add_argument("--duration", type=float, help="Stop the captures after this many seconds")
+    batch.add_argument("--stop-file", help="Stop the captures when this file exists")
+    batch.add_argument("--start-at", help="Start every capture at this ISO 8601 time")
+    batch.add_argument("--output", help="Path of the merged pcap")
+    args = parser.parse_args()
+
+    if args.job or args.capture:
+        if args.live:
+            parser.error("--live is interactive only")
+        job = load_job(args.job) if args.job else {}
+        if job is None:
+            sys.exit(1)
+        for capture in args.capture:
+            env, _, service = capture.partition(":")
+            job.setdefault("captures", []).append({"environment": env, "service": service})
+        for key, value in (("profile", args.profile), ("durationSeconds", args.duration), ("stopFile", args.stop_file),
+                           ("startAt", args.start_at), ("output", args.output)):
+            if value is not None:
+                job[key] = value
+        sys.exit(asyncio.run(batch_capture(job, force_refresh=args.refresh_inventory)))
+
+    asyncio.run(main(force_refresh=args.refresh_inventory, live=args.live))
\ No newline at end of file
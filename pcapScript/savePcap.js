@@ -1,23 +1,80 @@
 const AWS = require("aws-sdk");
 const s3 = new AWS.S3();
+const crypto = require("crypto");
 const fs = require("fs");
 
 const fileNameWithPath = process.argv[2] || "ecs-pcap.pcap"; // as the default
 const s3Bucket = process.argv[3] || "bucket-pcaps"; // Use "nginx-pcaps-prod" as the default
 
-// Use the provided file name
-try {
-  const data = fs.readFileSync(fileNameWithPath);
-  const fileName = fileNameWithPath.includes('/') ? fileNameWithPath.split('/').pop() : fileNameWithPath;
-
-  let params = { Bucket: s3Bucket, Key: fileName, Body: data };
-  s3.putObject(params, function (err, data) {
-    if (err) console.log(err);
-    else
-      console.log(
-        `Successfully saved object to bucket with key: ${fileName}`
-      );
-  });
-} catch (err) {
-  console.error(err);
-}
\ No newline at end of file
+// Multipart upload settings, memory use stays around partSize * parallelism whatever the pcap size
+const MB = 1024 * 1024;
+const MIN_PART_SIZE = 5 * MB; // S3 minimum for every part but the last
+const MAX_PARTS = 10000;
+const partSize = Math.max(MIN_PART_SIZE, (Number(process.env.ECX_PART_SIZE_MB) || 16) * MB);
+const parallelism = Math.max(1, Number(process.env.ECX_UPLOAD_PARALLELISM) || 4);
+const retries = Math.max(0, Number(process.env.ECX_UPLOAD_RETRIES ?? 3));
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Upload one part, retrying it alone with exponential backoff
+async function uploadPart(params, attempt = 0) {
+  try {
+    return await s3.uploadPart(params).promise();
+  } catch (err) {
+    if (attempt >= retries) throw err;
+    const delay = 500 * 2 ** attempt;
+    console.log(`Retrying part ${params.PartNumber} in ${delay} ms: ${err.message}`);
+    await sleep(delay);
+    return uploadPart(params, attempt + 1);
+  }
+}
+
+// Stream the file to S3 as a multipart upload, reading one part at a time
+async function savePcap(path, bucket) {
+  const fileName = path.includes('/') ? path.split('/').pop() : path;
+  const file = await fs.promises.open(path, 'r');
+  const size = (await file.stat()).size;
+  // Grow the parts for files that wouldn't fit in MAX_PARTS parts
+  const chunkSize = Math.max(partSize, Math.ceil(size / MAX_PARTS));
+  const base = { Bucket: bucket, Key: fileName };
+  const { UploadId } = await s3.createMultipartUpload(base).promise();
+
+  const parts = [];
+  const inFlight = new Set();
+  try {
+    for (let partNumber = 1, position = 0; partNumber === 1 || position < size; partNumber++, position += chunkSize) {
+      const body = Buffer.allocUnsafe(Math.min(chunkSize, size - position));
+      const { bytesRead } = await file.read(body, 0, body.length, position);
+      if (bytesRead !== body.length) throw new Error(`${path} changed while uploading it`);
+
+      // S3 checks every part against its MD5, so a corrupted part fails its upload and is retried
+      const digest = crypto.createHash("md5").update(body).digest();
+      const upload = uploadPart({ ...base, UploadId, PartNumber: partNumber, Body: body, ContentMD5: digest.toString("base64") })
+        .then(({ ETag }) => {
+          parts[partNumber - 1] = { ETag, PartNumber: partNumber };
+          inFlight.delete(upload);
+        });
+      upload.catch(() => {}); // Failures surface through Promise.race/all below
+      inFlight.add(upload);
+      if (inFlight.size >= parallelism) await Promise.race(inFlight);
+    }
+    await Promise.all(inFlight);
+
+    await s3.completeMultipartUpload({ ...base, UploadId, MultipartUpload: { Parts: parts } }).promise();
+    return { fileName, size, parts: parts.length };
+  } catch (err) {
+    await s3.abortMultipartUpload({ ...base, UploadId }).promise().catch(() => {});
+    throw err;
+  } finally {
+    await file.close();
+  }
+}
+
+savePcap(fileNameWithPath, s3Bucket).then(
+  ({ fileName, size, parts }) =>
+    console.log(`Successfully saved object to bucket with key: ${fileName} (${size} bytes in ${parts} parts)`),
+  (err) => {
+    console.error(err);
+    process.exitCode = 1;
+  }
+);
\ No newline at end of file
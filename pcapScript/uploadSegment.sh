@@ -0,0 +1,24 @@
+#!/bin/sh
+# Upload a finished tcpdump segment to S3 and remove it from the target.
+# tcpdump calls it with -z when it rotates to the next file, e.g. with ./pcapScript/tcpdump_<id>.pcap3.
+# ECX_BUCKET: the S3 bucket. ECX_UPLOADER: "node" (savePcap.js, default) or "aws" (aws s3 cp).
+# ECX_COMPRESS: optional "gzip" or "zstd" compression before upload, at level ECX_LEVEL.
+[ -f "$1" ] || exit 0
+
+# Give every segment a unique name, ring buffer file names are reused by tcpdump: seconds followed by
+# the ring buffer index (busybox date has no %N)
+INDEX="${1##*.pcap}"
+case "$INDEX" in ''|*[!0-9]*) INDEX=0 ;; esac
+SEGMENT="${1%.pcap*}_$(date +%s)$(printf '%04d' "$INDEX").pcap"
+mv "$1" "$SEGMENT" || exit 1
+
+case "$ECX_COMPRESS" in
+  gzip) gzip -f "-${ECX_LEVEL:-6}" "$SEGMENT" && SEGMENT="$SEGMENT.gz" || exit 1 ;;
+  zstd) zstd -q -f --rm "-${ECX_LEVEL:-3}" "$SEGMENT" && SEGMENT="$SEGMENT.zst" || exit 1 ;;
+esac
+
+if [ "$ECX_UPLOADER" = "aws" ]; then
+  aws s3 cp "$SEGMENT" "s3://$ECX_BUCKET/$(basename "$SEGMENT")" --only-show-errors
+else
+  "${ECX_NODE:-/root/.nvm/versions/node/v16.19.0/bin/node}" "$(dirname "$0")/savePcap.js" "$SEGMENT" "$ECX_BUCKET"
+fi && rm -f "$SEGMENT"
@@ -0,0 +1,278 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from utils.aws_services import resume_downloads
+from utils.call_index import build_call_index, extract_call, load_call_index
+from utils.common import merge_pcap_files_and_open
+from utils.flow_catalog import ARCHIVE_DIR, DEFAULT_CATALOG_FILE, DEFAULT_QUERY_LIMIT, catalog_runs, query_flows
+from utils.pcap_merge import PcapFormatError
+from utils.rtp_analysis import DEFAULT_MIN_PACKETS, RTP_REPORT_SUFFIX, analyze_rtp, write_rtp_report
+from utils.sip_summary import summarize_sip
+from utils.time_index import DEFAULT_INDEX_INTERVAL, build_time_index, load_time_index, parse_window_time, slice_capture
+
+
+CGREEN  = '\33[32m'
+CRED    = '\33[31m'
+CYELLOW = '\33[33m'
+CEND    = '\33[0m'
+
+
+def index_command(args):
+    calls = build_call_index(args.capture)
+    print(CGREEN + f"Indexed {calls} calls in {args.capture}" + CEND)
+
+
+def calls_command(args):
+    index = load_call_index(args.capture)
+    if index is None:
+        print(CRED + f"No up-to-date call index for {args.capture}, run the 'index' command first." + CEND)
+        return 1
+    for call_id, call in index["calls"].items():
+        print(f"{call_id}  sip={call['sipPackets']} packets={call['count']} media={len(call['media'])}")
+
+
+def extract_call_command(args):
+    output_file = args.output or os.path.join(os.path.dirname(args.capture), f"call_{args.call_id.replace('/', '_')}.pcap")
+    if load_call_index(args.capture) is None:
+        print(f"No up-to-date call index for {args.capture}, building it...")
+        build_call_index(args.capture)
+    try:
+        stats = extract_call(args.capture, args.call_id, output_file)
+    except KeyError as e:
+        print(CRED + str(e) + CEND)
+        return 1
+    print(CGREEN + f"Extracted {stats['packets']} packets to {output_file} in {stats['seconds'] * 1000:.0f} ms" + CEND)
+
+
+def rtp_command(args):
+    output_file = args.output or args.capture + RTP_REPORT_SUFFIX
+    result = analyze_rtp(args.capture, args.min_packets)
+    write_rtp_report(result["streams"], output_file)
+    print(CGREEN + f"Analyzed {result['rtpPackets']} RTP and {result['rtcpPackets']} RTCP packets of {len(result['streams'])} streams "
+          f"in {result['seconds']:.2f}s, report written to {output_file}" + CEND)
+
+    # Worst streams first
+    streams = sorted(result["streams"], key=lambda stream: (stream["lossPercent"], stream["jitterMs"]), reverse=True)
+    if streams:
+        print(f"{'SSRC':<11} {'source':<22} {'destination':<22} {'packets':>8} {'lost':>6} {'loss%':>7} {'jitter ms':>10} "
+              f"{'max jitter':>10} {'reordered':>9} {'gaps':>5}")
+    for stream in streams[:args.top]:
+        line = (f"{stream['ssrc']:<11} {stream['src']:<22} {stream['dst']:<22} {stream['packets']:>8} {stream['lost']:>6} "
+                f"{stream['lossPercent']:>7.2f} {stream['jitterMs']:>10.2f} {stream['maxJitterMs']:>10.2f} "
+                f"{stream['reordered']:>9} {stream['gaps']:>5}")
+        print(CYELLOW + line + CEND if stream["lossPercent"] > 0 else line)
+    if len(streams) > args.top:
+        print(f"... {len(streams) - args.top} more streams in {output_file}")
+
+
+def sip_summary_command(args):
+    summary = summarize_sip(args.paths, args.workers)
+    if not summary["files"]:
+        print(CRED + f"No capture files found in {', '.join(args.paths)}" + CEND)
+        return 1
+    print(CGREEN + f"Parsed {summary['messages']} SIP messages from {summary['files']} files with {summary['workers']} processes "
+          f"in {summary['seconds']:.2f}s" + CEND)
+    print("Requests: " + ", ".join(f"{method} {count}" for method, count in summary["methods"].items()))
+    print("Responses: " + ", ".join(f"{status} {count}" for status, count in summary["responses"].items()))
+
+    calls = summary["calls"]
+    print(f"Calls: {calls['total']} total, {calls['answered']} answered, {calls['failed']} failed, "
+          f"{calls['noFinalResponse']} without final response")
+    latency = summary["setupLatency"]
+    if latency["count"]:
+        print("INVITE -> 2xx setup latency: " + ", ".join(f"{name[:-2]} {value:.0f} ms" for name, value in latency.items()
+                                                          if name.endswith("Ms")))
+    if summary["failures"]:
+        print(CRED + "Failed calls: " + ", ".join(f"{status} {count}" for status, count in summary["failures"].items()) + CEND)
+
+    print(f"{'task/instance':<40} {'files':>5} {'messages':>9} {'calls':>7} {'retransmissions':>15} {'errors':>7}")
+    for source, stats in summary["sources"].items():
+        line = (f"{source:<40} {stats['files']:>5} {stats['messages']:>9} {stats['calls']:>7} "
+                f"{stats['retransmissions']:>15} {stats['errors']:>7}")
+        print(CRED + line + CEND if stats["errors"] else line)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(summary, output, indent=2)
+        print(f"Summary written to {args.output}")
+
+
+def time_index_command(args):
+    try:
+        packets = build_time_index(args.capture, args.interval)
+    except PcapFormatError as e:
+        print(CRED + str(e) + CEND)
+        return 1
+    print(CGREEN + f"Indexed the timestamps of {packets} packets in {args.capture}" + CEND)
+
+
+def slice_command(args):
+    index = load_time_index(args.capture)
+    if index is None:
+        print(f"No up-to-date time index for {args.capture}, building it...")
+        try:
+            build_time_index(args.capture)
+        except PcapFormatError as e:
+            print(CRED + str(e) + CEND)
+            return 1
+        index = load_time_index(args.capture)
+        if index is None:
+            print(CRED + f"Couldn't build the time index of {args.capture}" + CEND)
+            return 1
+    try:
+        start_ns = parse_window_time(args.start, index["first"])
+        end_ns = start_ns + int(args.duration * 1_000_000_000) if args.duration else parse_window_time(args.end, index["first"])
+    except ValueError as e:
+        print(CRED + f"Invalid time: {e}" + CEND)
+        return 1
+    output_file = args.output or os.path.splitext(args.capture)[0] + f"_{args.start}_{args.end or args.duration}.{index['format']}".replace(":", "")
+    stats = slice_capture(args.capture, start_ns, end_ns, output_file)
+    if not stats["packets"]:
+        print(CRED + f"No packets between {args.start} and {args.end or f'+{args.duration}s'} in {args.capture}" + CEND)
+    print(CGREEN + f"Sliced {stats['packets']} packets ({stats['bytes'] / 1024 / 1024:.1f} MB) to {output_file} "
+          f"in {stats['seconds'] * 1000:.0f} ms" + CEND)
+
+
+def catalog_command(args):
+    stats = catalog_runs(args.paths or [ARCHIVE_DIR], args.catalog, args.workers)
+    if not stats["files"]:
+        print(CRED + f"No capture runs found in {', '.join(args.paths or [ARCHIVE_DIR])}" + CEND)
+        return 1
+    print(CGREEN + f"Cataloged {stats['flows']} flows ({stats['packets']} packets) from {stats['indexed']} files with "
+          f"{stats['workers']} processes in {stats['seconds']:.2f}s, {stats['unchanged']} files unchanged of {stats['runs']} runs" + CEND)
+    if stats["removed"]:
+        print(CYELLOW + f"Removed {stats['removed']} deleted files from {args.catalog}" + CEND)
+    if stats["failed"]:
+        print(CRED + f"{stats['failed']} files couldn't be cataloged" + CEND)
+        return 1
+
+
+def find_command(args):
+    if not os.path.exists(args.catalog):
+        print(CRED + f"No flow catalog at {args.catalog}, run the 'catalog' command first." + CEND)
+        return 1
+    try:
+        start_ns = parse_window_time(args.start) if args.start else None
+        end_ns = parse_window_time(args.end) if args.end else None
+    except ValueError as e:
+        print(CRED + f"Invalid time: {e}" + CEND)
+        return 1
+    flows = query_flows(args.catalog, args.ip, args.port, args.protocol, args.call_id, args.service, args.env, start_ns, end_ns, args.limit)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(flows, output, indent=2)
+        print(f"{len(flows)} flows written to {args.output}")
+        return
+    if not flows:
+        print(CYELLOW + "No matching flows in the catalog." + CEND)
+        return
+    run = None
+    for flow in flows:
+        if flow["run"] != run:
+            run = flow["run"]
+            print(CGREEN + f"{flow['service']} {flow['env']} {flow['started']}: {run}" + CEND)
+        first = datetime.fromtimestamp(flow["first"] / 1e9).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        last = datetime.fromtimestamp(flow["last"] / 1e9).strftime('%H:%M:%S.%f')[:-3]
+        line = (f"  {flow['source']:<30} {flow['protocol']} {flow['src']}:{flow['srcPort']} -> {flow['dst']}:{flow['dstPort']} "
+                f"{first} - {last} packets={flow['packets']} bytes={flow['bytes']}")
+        if flow["callIds"]:
+            line += f" calls={len(flow['callIds'])}"
+        print(line)
+    if len(flows) == args.limit:
+        print(f"... showing the latest {args.limit} flows, use --limit for more")
+
+
+def download_command(args):
+    downloaders = resume_downloads(args.folder, args.profile)
+    if not downloaders:
+        print(CGREEN + f"Nothing left to download in {args.folder}" + CEND)
+    failed = [key for downloader in downloaders for key in downloader.failed]
+    for downloader in downloaders:
+        print(CGREEN + f"{downloader.bucket_name}: {downloader.summary()}" + CEND)
+    if failed:
+        print(CRED + f"Still incomplete, run the command again: {', '.join(failed)}" + CEND)
+        return 1
+    if args.merge and not merge_pcap_files_and_open(args.merge, args.folder, merge_config={"callIndex": True, "timeIndex": True},
+                                                    open_wireshark=False):
+        return 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline tools for ECXCapture merged pcaps.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = subparsers.add_parser("index", help="Build the SIP Call-ID index of a capture")
+    index_parser.add_argument("capture", help="Merged pcap/pcapng file")
+    index_parser.set_defaults(func=index_command)
+
+    calls_parser = subparsers.add_parser("calls", help="List the calls of an indexed capture")
+    calls_parser.add_argument("capture", help="Merged pcap/pcapng file")
+    calls_parser.set_defaults(func=calls_command)
+
+    extract_parser = subparsers.add_parser("extract-call", help="Write one call (SIP and RTP/RTCP) into a small pcap")
+    extract_parser.add_argument("capture", help="Merged pcap/pcapng file")
+    extract_parser.add_argument("call_id", help="SIP Call-ID of the call")
+    extract_parser.add_argument("-o", "--output", help="Output file (default: call_<Call-ID>.pcap next to the capture)")
+    extract_parser.set_defaults(func=extract_call_command)
+
+    rtp_parser = subparsers.add_parser("rtp", help="Per-stream RTP loss, jitter and reordering of a capture")
+    rtp_parser.add_argument("capture", help="Merged pcap/pcapng file")
+    rtp_parser.add_argument("-o", "--output", help=f"CSV report (default: <capture>{RTP_REPORT_SUFFIX})")
+    rtp_parser.add_argument("--min-packets", type=int, default=DEFAULT_MIN_PACKETS, help="Ignore streams with fewer packets")
+    rtp_parser.add_argument("--top", type=int, default=20, help="Number of streams to print, worst first")
+    rtp_parser.set_defaults(func=rtp_command)
+
+    time_index_parser = subparsers.add_parser("time-index", help="Build the sparse timestamp index of a capture")
+    time_index_parser.add_argument("capture", help="Merged pcap/pcapng file")
+    time_index_parser.add_argument("--interval", type=int, default=DEFAULT_INDEX_INTERVAL, help="Packets between two index entries")
+    time_index_parser.set_defaults(func=time_index_command)
+
+    slice_parser = subparsers.add_parser("slice", help="Write the packets of a time window into a small pcap")
+    slice_parser.add_argument("capture", help="Merged pcap/pcapng file")
+    slice_parser.add_argument("--start", required=True, help="Start: time of day (14:02:10), ISO date and time or epoch seconds")
+    window_end = slice_parser.add_mutually_exclusive_group(required=True)
+    window_end.add_argument("--end", help="End, included, in the same formats as --start")
+    window_end.add_argument("--duration", type=float, help="Length of the window in seconds")
+    slice_parser.add_argument("-o", "--output", help="Output file (default: <capture>_<start>_<end>.pcap)")
+    slice_parser.set_defaults(func=slice_command)
+
+    sip_parser = subparsers.add_parser("sip-summary", help="SIP responses, setup latency and retransmissions of per-target captures")
+    sip_parser.add_argument("paths", nargs="+", help="Run folder(s) of per-target captures, or capture files")
+    sip_parser.add_argument("--workers", type=int, help="Number of parsing processes (default: number of CPUs)")
+    sip_parser.add_argument("-o", "--output", help="Also write the summary as JSON")
+    sip_parser.set_defaults(func=sip_summary_command)
+
+    catalog_parser = subparsers.add_parser("catalog", help="Add new or changed capture runs to the flow catalog")
+    catalog_parser.add_argument("paths", nargs="*", help=f"Run folders, or archives of runs (default: {ARCHIVE_DIR})")
+    catalog_parser.add_argument("--catalog", default=DEFAULT_CATALOG_FILE, help="SQLite catalog file")
+    catalog_parser.add_argument("--workers", type=int, help="Number of processes (default: number of CPUs)")
+    catalog_parser.set_defaults(func=catalog_command)
+
+    find_parser = subparsers.add_parser("find", help="Find the past runs that saw an IP, port or Call-ID in the flow catalog")
+    find_parser.add_argument("--ip", help="Source or destination address")
+    find_parser.add_argument("--port", type=int, help="Source or destination port")
+    find_parser.add_argument("--protocol", choices=["udp", "tcp"])
+    find_parser.add_argument("--call-id", help="SIP Call-ID")
+    find_parser.add_argument("--service", help="Service of the run")
+    find_parser.add_argument("--env", help="Environment of the run")
+    find_parser.add_argument("--start", help="Flows active after: ISO date and time or epoch seconds")
+    find_parser.add_argument("--end", help="Flows active before, in the same formats as --start")
+    find_parser.add_argument("--limit", type=int, default=DEFAULT_QUERY_LIMIT, help="Maximum number of flows, latest first")
+    find_parser.add_argument("--catalog", default=DEFAULT_CATALOG_FILE, help="SQLite catalog file")
+    find_parser.add_argument("-o", "--output", help="Write the flows as JSON instead of printing them")
+    find_parser.set_defaults(func=find_command)
+
+    download_parser = subparsers.add_parser("download", help="Finish the pcap downloads a capture run left incomplete")
+    download_parser.add_argument("folder", help="Run folder holding the .ecx_manifest.json")
+    download_parser.add_argument("--profile", help="AWS profile to use instead of the one of the run")
+    download_parser.add_argument("--merge", metavar="OUTPUT", help="Then merge the folder into OUTPUT, with call and time indexes")
+    download_parser.set_defaults(func=download_command)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
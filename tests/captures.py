@@ -0,0 +1,31 @@
+"""Helpers shared by the tests reading and writing synthetic captures."""
+import struct
+
+from utils.packets import LINKTYPE_RAW
+from utils.pcap_merge import PcapReader
+
+SLL_HEADER_SIZE = 16
+
+
+def write_raw_pcap(path, packets):
+    """Write (timestamp_seconds, frame) tuples as a raw IP pcap, dropping the SLL header of the frames."""
+    with open(path, "wb") as file:
+        file.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 262144, LINKTYPE_RAW))
+        for timestamp, frame in packets:
+            ts_sec = int(timestamp)
+            ts_usec = int(round((timestamp - ts_sec) * 1_000_000))
+            data = frame[SLL_HEADER_SIZE:]
+            file.write(struct.pack("<IIII", ts_sec, ts_usec, len(data), len(data)) + data)
+
+
+def read_capture(path):
+    """Format of a capture and its packets as (timestamp_ns, linktype, data), in file order."""
+    with PcapReader(path) as reader:
+        return reader.format, [(timestamp_ns, reader.linktypes[link_id], bytes(data))
+                               for timestamp_ns, _, _, _, _, data, link_id, _ in reader]
+
+
+def timestamp_ns(timestamp):
+    """Nanoseconds of a timestamp in seconds, rounded to the microseconds a pcap keeps."""
+    ts_sec = int(timestamp)
+    return ts_sec * 1_000_000_000 + int(round((timestamp - ts_sec) * 1_000_000)) * 1000
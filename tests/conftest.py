@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The tests import the tool's modules and reuse the synthetic captures of the benchmarks
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
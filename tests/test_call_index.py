@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from captures import SLL_HEADER_SIZE, read_capture, timestamp_ns, write_raw_pcap
+from synthetic_pcap import LINKTYPE_LINUX_SLL, sip_call, write_pcap
+from utils.call_index import CALL_INDEX_SUFFIX, CallIndexer, build_call_index, extract_call, load_call_index
+from utils.pcap_merge import merge_pcaps
+
+START = 1_700_000_000.0
+
+
+def write_calls(path, indexes, rtp_packets=20, writer=write_pcap):
+    """Write the calls into a capture, returning the packets of every call."""
+    calls = {index: sip_call(index, START + index * 0.05, rtp_packets=rtp_packets) for index in indexes}
+    writer(path, sorted((packet for packets in calls.values() for packet in packets), key=lambda packet: packet[0]))
+    return calls
+
+
+def test_call_extracted_from_the_merge_index_holds_exactly_its_packets(tmp_path):
+    calls = write_calls(str(tmp_path / "task1.pcap"), range(0, 10, 2))
+    calls.update(write_calls(str(tmp_path / "task2.pcap"), range(1, 10, 2)))
+    merged = str(tmp_path / "merged.pcap")
+    merge_pcaps([str(tmp_path / "task1.pcap"), str(tmp_path / "task2.pcap")], merged, indexer=CallIndexer())
+
+    index = load_call_index(merged)
+    assert set(index["calls"]) == {f"call-{i}@ecx" for i in range(10)}
+    for i, packets in calls.items():
+        extract_call(merged, f"call-{i}@ecx", str(tmp_path / f"call-{i}.pcap"))
+        _, extracted = read_capture(str(tmp_path / f"call-{i}.pcap"))
+        assert extracted == sorted((timestamp_ns(timestamp), LINKTYPE_LINUX_SLL, frame) for timestamp, frame in packets)
+        assert index["calls"][f"call-{i}@ecx"]["sipPackets"] == 6
+
+
+def test_separate_pass_builds_the_same_index_as_the_merge(tmp_path):
+    write_calls(str(tmp_path / "task1.pcap"), range(5))
+    merged = str(tmp_path / "merged.pcap")
+    merge_pcaps([str(tmp_path / "task1.pcap")], merged, indexer=CallIndexer())
+    with open(merged + CALL_INDEX_SUFFIX) as index_file:
+        merge_index = json.load(index_file)
+
+    assert build_call_index(merged) == 5
+    assert load_call_index(merged) == merge_index
+
+
+def test_call_of_a_pcapng_merge_keeps_its_interfaces(tmp_path):
+    calls = write_calls(str(tmp_path / "sll.pcap"), [0, 1])
+    raw_calls = write_calls(str(tmp_path / "raw.pcap"), [2, 3], writer=write_raw_pcap)
+    merged = str(tmp_path / "merged.pcapng")
+    merge_pcaps([str(tmp_path / "sll.pcap"), str(tmp_path / "raw.pcap")], merged, indexer=CallIndexer())
+
+    extract_call(merged, "call-3@ecx", str(tmp_path / "call-3.pcapng"))
+    file_format, extracted = read_capture(str(tmp_path / "call-3.pcapng"))
+    assert file_format == "pcapng"
+    assert [data for _, _, data in extracted] == [frame[SLL_HEADER_SIZE:] for _, frame in sorted(raw_calls[3], key=lambda packet: packet[0])]
+
+    extract_call(merged, "call-0@ecx", str(tmp_path / "call-0.pcapng"))
+    _, extracted = read_capture(str(tmp_path / "call-0.pcapng"))
+    assert [data for _, _, data in extracted] == [frame for _, frame in sorted(calls[0], key=lambda packet: packet[0])]
+
+
+def test_extract_refuses_missing_or_outdated_indexes_and_unknown_calls(tmp_path):
+    write_calls(str(tmp_path / "task1.pcap"), [0])
+    merged = str(tmp_path / "merged.pcap")
+    merge_pcaps([str(tmp_path / "task1.pcap")], merged)
+    with pytest.raises(FileNotFoundError):
+        extract_call(merged, "call-0@ecx", str(tmp_path / "call.pcap"))
+
+    build_call_index(merged)
+    with pytest.raises(KeyError):
+        extract_call(merged, "unknown@ecx", str(tmp_path / "call.pcap"))
+
+    with open(merged, "ab") as capture:
+        capture.write(b"\0" * 16)
+    assert load_call_index(merged) is None
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from utils.command_runner import CommandRunner, report_failures, stop_process
+
+
+def test_spawn_counts_a_command_still_running_as_started():
+    async def scenario():
+        runner = CommandRunner(retries=0, startup_grace=0.2)
+        process, result = await runner.spawn("task1", ["sleep", "30"])
+        try:
+            return process, result
+        finally:
+            process.kill()
+            await process.wait()
+
+    process, result = asyncio.run(scenario())
+    assert process is not None
+    assert result.running and result.returncode is None
+    assert result.ok
+    assert report_failures({"task1": result}, "start the capture") == ["task1"]
+
+
+def test_spawn_counts_a_clean_exit_as_started_and_a_failure_as_failed():
+    async def scenario():
+        runner = CommandRunner(retries=0, startup_grace=5)
+        _, clean = await runner.spawn("task1", ["sh", "-c", "exit 0"])
+        process, failed = await runner.spawn("task2", ["sh", "-c", "echo boom >&2; exit 3"])
+        return clean, process, failed
+
+    clean, process, failed = asyncio.run(scenario())
+    assert clean.ok and not clean.running
+    assert process is None
+    assert not failed.ok and failed.returncode == 3 and failed.stderr.strip() == "boom"
+
+
+def test_run_all_reports_exit_codes_and_output():
+    async def scenario():
+        runner = CommandRunner(retries=1, backoff=0)
+        return await runner.run_all({"ok": ["sh", "-c", "echo hello"], "failing": ["sh", "-c", "exit 2"]})
+
+    results = asyncio.run(scenario())
+    assert results["ok"].ok and results["ok"].stdout.strip() == "hello"
+    assert not results["failing"].ok and results["failing"].returncode == 2 and results["failing"].attempts == 2
+
+
+def test_stop_all_interrupts_commands_that_honour_sigint():
+    async def scenario():
+        runner = CommandRunner(retries=0, startup_grace=0.2)
+        processes, _ = await runner.spawn_all({"task1": ["sh", "-c", "trap 'exit 130' INT; while :; do sleep 0.1; done"]})
+        start = time.monotonic()
+        results = await runner.stop_all(processes, timeout=5)
+        return results, time.monotonic() - start
+
+    results, seconds = asyncio.run(scenario())
+    assert results["task1"].returncode == 130
+    assert seconds < 5
+
+
+@pytest.mark.skipif(os.name != 'posix', reason="process groups are POSIX only")
+def test_stop_process_kills_the_whole_group_when_sigint_is_ignored():
+    async def scenario():
+        runner = CommandRunner()
+        # Like the aws CLI while session-manager-plugin runs: SIGINT ignored, a child holding the output pipe
+        process = await runner._spawn_process(["sh", "-c", "trap '' INT; sleep 30 & echo $!; wait"])
+        child = int(await process.stdout.readline())
+        start = time.monotonic()
+        await stop_process(process, timeout=0.5)
+        # The output only ends once the child holding the pipe is gone too
+        await asyncio.wait_for(process.stdout.read(), 5)
+        return process.returncode, child, time.monotonic() - start
+
+    returncode, child, seconds = asyncio.run(scenario())
+    assert returncode == -9
+    assert seconds < 5
+    try:
+        with open(f"/proc/{child}/stat") as stat:
+            assert stat.read().split(")")[-1].split()[0] == "Z"  # Killed, waiting for init to reap it
+    except FileNotFoundError:
+        pass
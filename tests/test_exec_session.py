@@ -0,0 +1,113 @@
+import asyncio
+import os
+import sys
+
+from utils.exec_session import ExecSessionRunner
+
+# Like tcpdump: runs until SIGINT, then writes what it captured and exits cleanly
+CAPTURE_SCRIPT = """
+import signal, sys, time
+def stop(*_):
+    open(sys.argv[1], "w").write("flushed")
+    sys.exit(0)
+signal.signal(signal.SIGINT, stop)
+open(sys.argv[1] + ".ready", "w").close()
+while True:
+    time.sleep(0.05)
+"""
+
+
+def run(scenario):
+    async def with_runner():
+        runner = ExecSessionRunner(retries=0, timeout=5, startup_grace=0.3)
+        try:
+            return await scenario(runner)
+        finally:
+            await runner.close_all()
+    return asyncio.run(with_runner())
+
+
+def test_commands_run_in_one_session_per_target():
+    async def scenario(runner):
+        opened = await runner.open_all({"task1": ["sh"], "task2": ["sh"]})
+        # Shell state persists between commands of a session, each target has its own
+        await runner.run_on("task1", "ECX_NAME=one")
+        await runner.run_on("task2", "ECX_NAME=two")
+        echoed = {target: await runner.run_on(target, 'echo "$ECX_NAME"; echo second line') for target in opened}
+        failed = await runner.run_on("task1", "echo partial; exit_code() { return 4; }; exit_code")
+        return opened, echoed, failed
+
+    opened, echoed, failed = run(scenario)
+    assert all(result.ok for result in opened.values())
+    assert echoed["task1"].stdout == "one\nsecond line" and echoed["task2"].stdout == "two\nsecond line"
+    assert failed.returncode == 4 and failed.stdout == "partial" and not failed.ok
+
+
+def test_started_commands_are_interrupted_and_flush_their_output(tmp_path):
+    script = tmp_path / "capture.py"
+    script.write_text(CAPTURE_SCRIPT)
+    flushed = {target: tmp_path / f"{target}.pcap" for target in ("task1", "task2")}
+
+    async def scenario(runner):
+        await runner.open_all({target: ["sh"] for target in flushed})
+        started = await runner.start_all({target: [f"{sys.executable} {script} {path}"] for target, path in flushed.items()})
+        before = [path.exists() for path in flushed.values()]
+        # A SIGINT before the handler is installed would kill the command instead of stopping it
+        while not all(os.path.exists(f"{path}.ready") for path in flushed.values()):
+            await asyncio.sleep(0.05)
+        interrupted = await runner.interrupt_all(list(flushed))
+        return started, before, interrupted
+
+    started, before, interrupted = run(scenario)
+    assert all(result.ok for result in started.values())
+    assert before == [False, False]
+    assert all(result.ok for result in interrupted.values())
+    assert all(path.read_text() == "flushed" for path in flushed.values())
+
+
+def test_command_exiting_during_the_startup_grace_is_not_started():
+    async def scenario(runner):
+        await runner.open_all({"task1": ["sh"]})
+        return (await runner.start_all({"task1": ["sleep 30", "false"]}))["task1"]
+
+    assert not run(scenario).ok
+
+
+def test_sessions_that_fail_or_never_answer_are_not_opened():
+    async def scenario(runner):
+        runner.timeout = 0.5
+        results = await runner.open_all({"failing": ["sh", "-c", "echo 'TargetNotConnectedException' >&2; exit 255"],
+                                         "silent": ["sh", "-c", "cat > /dev/null"]})
+        return results, set(runner.sessions)
+
+    results, sessions = run(scenario)
+    assert sessions == set()
+    assert results["failing"].returncode == 255 and "TargetNotConnectedException" in results["failing"].stderr
+    assert not results["silent"].ok and results["silent"].stderr == "No answer from the session after 0.5s"
+
+
+def test_close_all_ends_every_session():
+    async def scenario(runner):
+        await runner.open_all({"task1": ["sh"], "task2": ["sh"]})
+        runner.keep_alive(interval=0.05)
+        await asyncio.sleep(0.2)
+        processes = [session.process for session in runner.sessions.values()]
+        await runner.close_all()
+        return [process.returncode for process in processes], runner.sessions
+
+    returncodes, sessions = run(scenario)
+    assert returncodes == [0, 0] and sessions == {}
+
+
+def test_run_on_timeout_lets_a_long_command_outlast_the_execution_timeout():
+    async def scenario(runner):
+        await runner.open_all({"task1": ["sh"], "task2": ["sh"]})
+        runner.timeout = 0.2
+        # Like a multi-GB upload: longer than the execution timeout, within its own
+        upload = await runner.run_on("task1", "sleep 0.5; echo uploaded", timeout=5)
+        cut = await runner.run_on("task2", "sleep 0.5; echo uploaded")
+        return upload, cut
+
+    upload, cut = run(scenario)
+    assert upload.ok and upload.stdout == "uploaded"
+    assert cut.timed_out and not cut.ok
@@ -0,0 +1,91 @@
+import functools
+import gzip
+import os
+import shutil
+import sqlite3
+
+from synthetic_pcap import random_udp_stream, sip_call, write_pcap
+from utils import flow_catalog
+from utils.flow_catalog import catalog_runs, query_flows, summarize_flows
+from utils.pcap_merge import open_capture
+
+START = 1_700_000_000.0
+
+
+def row_counts(catalog_file):
+    connection = sqlite3.connect(catalog_file)
+    try:
+        return {table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("runs", "files", "flows", "flow_calls")}
+    finally:
+        connection.close()
+
+
+def write_calls(path, first, count):
+    packets = [packet for index in range(first, first + count) for packet in sip_call(index, START + index * 0.05, rtp_packets=20)]
+    write_pcap(str(path), sorted(packets, key=lambda packet: packet[0]))
+
+
+def test_recatalog_only_indexes_changed_files_and_drops_deleted_ones(tmp_path):
+    run = tmp_path / "archive" / "svc" / "dev" / "20240101_000000"
+    run.mkdir(parents=True)
+    catalog_file = str(tmp_path / "catalog.sqlite")
+    write_calls(run / "tcpdump_taskA.pcap", 0, 3)
+    write_calls(run / "tcpdump_taskB.pcap", 3, 2)
+    write_pcap(str(run / "tcpdump_taskC.pcap"), random_udp_stream(200, START, host=3))
+
+    result = catalog_runs([str(tmp_path / "archive")], catalog_file, workers=1)
+    assert (result["runs"], result["files"], result["indexed"], result["unchanged"], result["removed"]) == (1, 3, 3, 0, 0)
+    summaries = {name: summarize_flows(str(run / name)) for name in ("tcpdump_taskA.pcap", "tcpdump_taskB.pcap", "tcpdump_taskC.pcap")}
+    assert row_counts(catalog_file)["flows"] == result["flows"] == sum(len(summary["flows"]) for summary in summaries.values())
+
+    flows = query_flows(catalog_file, call_id="call-3@ecx")
+    # The INVITE and its responses, one flow each way between the SIP ports
+    assert {(flow["src"], flow["dst"], flow["srcPort"]) for flow in flows} == {("10.0.1.10", "10.0.2.20", 5060), ("10.0.2.20", "10.0.1.10", 5060)}
+    assert {flow["source"] for flow in flows} == {"taskB"}
+    assert all(flow["callIds"] == ["call-3@ecx", "call-4@ecx"] for flow in flows)
+    assert all((flow["service"], flow["env"], flow["started"]) == ("svc", "dev", "20240101_000000") for flow in flows)
+
+    # taskB now holds other calls, taskC is gone
+    write_calls(run / "tcpdump_taskB.pcap", 5, 3)
+    stat = os.stat(run / "tcpdump_taskB.pcap")
+    os.utime(run / "tcpdump_taskB.pcap", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    os.remove(run / "tcpdump_taskC.pcap")
+
+    result = catalog_runs([str(tmp_path / "archive")], catalog_file, workers=1)
+    assert (result["files"], result["indexed"], result["unchanged"], result["removed"]) == (2, 1, 1, 1)
+    new_b = summarize_flows(str(run / "tcpdump_taskB.pcap"))
+    counts = row_counts(catalog_file)
+    assert (counts["runs"], counts["files"]) == (1, 2)
+    assert counts["flows"] == len(summaries["tcpdump_taskA.pcap"]["flows"]) + len(new_b["flows"])
+    assert counts["flow_calls"] == sum(len(flow[9]) for summary in (summaries["tcpdump_taskA.pcap"], new_b) for flow in summary["flows"])
+
+    assert query_flows(catalog_file, call_id="call-3@ecx") == []
+    assert {flow["source"] for flow in query_flows(catalog_file, call_id="call-6@ecx")} == {"taskB"}
+    assert {flow["source"] for flow in query_flows(catalog_file, call_id="call-1@ecx")} == {"taskA"}
+    assert query_flows(catalog_file, ip="10.0.3.1") == []
+
+    # Nothing changed since
+    result = catalog_runs([str(tmp_path / "archive")], catalog_file, workers=1)
+    assert (result["indexed"], result["unchanged"], result["removed"]) == (0, 2, 0)
+    assert row_counts(catalog_file) == counts
+
+
+def test_compressed_captures_are_summarized_chunk_by_chunk(tmp_path, monkeypatch):
+    plain = str(tmp_path / "tcpdump_taskA.pcap")
+    write_calls(plain, 0, 4)
+    with open(plain, "rb") as source, gzip.open(plain + ".gz", "wb") as target:
+        shutil.copyfileobj(source, target)
+
+    with open_capture(plain + ".gz") as reader:
+        chunks = list(flow_catalog._decompressed_chunks(reader, chunk_bytes=4096))
+    assert len(chunks) > 5
+    assert sum(len(chunk[1]) for chunk in chunks) == summarize_flows(plain)["packets"]
+
+    # Flows and Call-IDs split across chunks add up to the same summary as the whole capture
+    monkeypatch.setattr(flow_catalog, "_decompressed_chunks", functools.partial(flow_catalog._decompressed_chunks, chunk_bytes=4096))
+    compressed = summarize_flows(plain + ".gz")
+    expected = summarize_flows(plain)
+    assert compressed["file"] == plain + ".gz"
+    assert {key: compressed[key] for key in ("packets", "first", "last", "flows")} == \
+        {key: expected[key] for key in ("packets", "first", "last", "flows")}
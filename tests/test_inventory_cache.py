@@ -0,0 +1,92 @@
+import types
+
+import pytest
+
+from utils import inventory_cache
+from utils.inventory_cache import get_cached_inventory, resolve_inventory_refresh
+
+
+class FakeDiscovery:
+    """Stands in for get_ecs_clusters/get_ec2_instances, returning `targets` per region and recording every call."""
+
+    def __init__(self, targets):
+        self.targets = targets
+        self.calls = []
+
+    def __call__(self, profile_name, regions, service_id):
+        self.calls.append(list(regions))
+        return {region: list(self.targets) for region in regions}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(inventory_cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def cache_config(tmp_path):
+    return {"file": str(tmp_path / "inventory_cache.json"), "ttlSeconds": 300, "maxStaleSeconds": 3600}
+
+
+def get(discover, cache_config, regions=("us-east-1",), **kwargs):
+    return get_cached_inventory("dev", "ecs", "api", list(regions), discover, cache_config, **kwargs)
+
+
+def test_entries_are_served_from_cache_until_their_ttl(clock, cache_config):
+    discover = FakeDiscovery(["task-1"])
+    assert get(discover, cache_config) == ({"us-east-1": ["task-1"]}, None)
+    clock[0] += 299
+    discover.targets = ["task-2"]
+    assert get(discover, cache_config) == ({"us-east-1": ["task-1"]}, None)
+    assert discover.calls == [["us-east-1"]]
+
+
+def test_stale_entries_are_served_while_revalidated_in_the_background(clock, cache_config):
+    discover = FakeDiscovery(["task-1"])
+    get(discover, cache_config)
+    clock[0] += 301
+    discover.targets = ["task-2"]
+
+    inventory, refresh = get(discover, cache_config)
+    assert inventory == {"us-east-1": ["task-1"]}
+    assert resolve_inventory_refresh(inventory, refresh, timeout=5) == ({"us-east-1": ["task-2"]}, True)
+    # The revalidated entry is fresh again from the time it was fetched
+    clock[0] += 299
+    assert get(discover, cache_config) == ({"us-east-1": ["task-2"]}, None)
+    assert len(discover.calls) == 2
+
+
+def test_entries_past_the_max_stale_time_are_rediscovered_before_returning(clock, cache_config):
+    discover = FakeDiscovery(["task-1"])
+    get(discover, cache_config)
+    clock[0] += 300 + 3601
+    discover.targets = ["task-2"]
+    assert get(discover, cache_config) == ({"us-east-1": ["task-2"]}, None)
+
+
+def test_without_stale_while_revalidate_expired_entries_are_rediscovered(clock, cache_config):
+    cache_config["staleWhileRevalidate"] = False
+    discover = FakeDiscovery(["task-1"])
+    get(discover, cache_config)
+    clock[0] += 301
+    discover.targets = ["task-2"]
+    assert get(discover, cache_config) == ({"us-east-1": ["task-2"]}, None)
+
+
+def test_force_refresh_ignores_fresh_entries(clock, cache_config):
+    discover = FakeDiscovery(["task-1"])
+    get(discover, cache_config)
+    discover.targets = ["task-2"]
+    assert get(discover, cache_config, force_refresh=True) == ({"us-east-1": ["task-2"]}, None)
+    assert get(discover, cache_config) == ({"us-east-1": ["task-2"]}, None)
+    assert len(discover.calls) == 2
+
+
+def test_only_missing_regions_are_discovered_and_region_order_is_kept(clock, cache_config):
+    discover = FakeDiscovery(["task-1"])
+    get(discover, cache_config, regions=["us-west-2"])
+    inventory, refresh = get(discover, cache_config, regions=["eu-west-1", "us-west-2"])
+    assert list(inventory) == ["eu-west-1", "us-west-2"] and refresh is None
+    assert discover.calls == [["us-west-2"], ["eu-west-1"]]
@@ -0,0 +1,97 @@
+import asyncio
+
+from captures import read_capture, timestamp_ns
+from synthetic_pcap import LINKTYPE_LINUX_SLL, PCAP_HEADER, random_udp_stream, write_pcap
+from utils.live_stream import LiveStream, PcapStreamParser, merge_live_streams
+
+
+def capture_bytes(tmp_path, name, packets):
+    path = str(tmp_path / name)
+    write_pcap(path, packets)
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def hex_lines(data, width=32):
+    """Session output of LIVE_ENCODE_COMMAND (od -An -v -tx1 -w32) for the bytes of a pcap stream."""
+    return b"".join((" " + " ".join(f"{byte:02x}" for byte in data[i:i + width]) + "\r\n").encode()
+                    for i in range(0, len(data), width))
+
+
+def feed(reader, data, eof=True):
+    reader.feed_data(hex_lines(data))
+    if eof:
+        reader.feed_eof()
+
+
+def expected_packets(*streams):
+    return sorted((timestamp_ns(timestamp), LINKTYPE_LINUX_SLL, frame) for packets in streams for timestamp, frame in packets)
+
+
+def test_parser_gives_the_same_packets_whatever_the_feed_boundaries(tmp_path):
+    packets = list(random_udp_stream(50))
+    data = capture_bytes(tmp_path, "task1.pcap", packets)
+
+    whole = PcapStreamParser().feed(data)
+    parser = PcapStreamParser()
+    byte_by_byte = [packet for i in range(len(data)) for packet in parser.feed(data[i:i + 1])]
+    assert whole == byte_by_byte
+    assert [(timestamp, data) for timestamp, _, _, data in whole] == [(timestamp_ns(ts), frame) for ts, frame in packets]
+    assert parser.linktype == LINKTYPE_LINUX_SLL and not parser.nanosecond
+
+
+def test_streams_are_merged_by_timestamp_skipping_session_banners(tmp_path):
+    first = list(random_udp_stream(300, seed=1, host=1))
+    second = list(random_udp_stream(300, seed=2, host=2))
+
+    async def scenario():
+        readers = [asyncio.StreamReader(), asyncio.StreamReader()]
+        readers[0].feed_data(b"\r\nStarting session with SessionId: ecs-execute-command-0123\r\n")
+        feed(readers[0], capture_bytes(tmp_path, "1.pcap", first))
+        feed(readers[1], capture_bytes(tmp_path, "2.pcap", second))
+        streams = [LiveStream("task1", readers[0]), LiveStream("task2", readers[1], buffer_packets=8)]
+        return await merge_live_streams(streams, str(tmp_path / "live.pcap"), max_delay=0.5, header_timeout=5)
+
+    stats = asyncio.run(scenario())
+    _, merged = read_capture(str(tmp_path / "live.pcap"))
+    assert stats["packets"] == 600 and stats["late"] == 0 and stats["dropped"] == 0
+    assert merged == expected_packets(first, second)
+
+
+def test_quiet_stream_delays_the_merge_by_max_delay_at_most(tmp_path):
+    busy = list(random_udp_stream(100, start=1_700_000_010.0, seed=1, host=1))
+    late = list(random_udp_stream(1, start=1_700_000_000.0, seed=2, host=2))
+
+    async def scenario():
+        readers = [asyncio.StreamReader(), asyncio.StreamReader()]
+        feed(readers[0], capture_bytes(tmp_path, "busy.pcap", busy), eof=False)
+        # The quiet target only sends its header, then an old packet well after max_delay
+        feed(readers[1], PCAP_HEADER, eof=False)
+        merge = asyncio.create_task(merge_live_streams([LiveStream("task1", readers[0]), LiveStream("task2", readers[1])],
+                                                       str(tmp_path / "live.pcap"), max_delay=0.1, header_timeout=5))
+        await asyncio.sleep(0.5)
+        _, written = read_capture(str(tmp_path / "live.pcap"))
+        feed(readers[1], capture_bytes(tmp_path, "late.pcap", late)[len(PCAP_HEADER):])
+        readers[0].feed_eof()
+        return written, await merge
+
+    written, stats = asyncio.run(scenario())
+    assert len(written) == 100
+    assert stats["packets"] == 101 and stats["late"] == 1
+    _, merged = read_capture(str(tmp_path / "live.pcap"))
+    assert sorted(merged) == expected_packets(busy, late)
+
+
+def test_stream_that_is_not_a_pcap_ends_without_stopping_the_others(tmp_path, capsys):
+    packets = list(random_udp_stream(20))
+
+    async def scenario():
+        readers = [asyncio.StreamReader(), asyncio.StreamReader()]
+        feed(readers[0], capture_bytes(tmp_path, "1.pcap", packets))
+        feed(readers[1], b"\x00" * 64)
+        return await merge_live_streams([LiveStream("task1", readers[0]), LiveStream("task2", readers[1])],
+                                        str(tmp_path / "live.pcap"), max_delay=0.1, header_timeout=5)
+
+    stats = asyncio.run(scenario())
+    assert stats["packets"] == 20
+    assert "Live stream of task2 stopped: task2 is not streaming a pcap" in capsys.readouterr().out
@@ -0,0 +1,148 @@
+import gzip
+import shutil
+import struct
+
+from captures import SLL_HEADER_SIZE, read_capture, timestamp_ns, write_raw_pcap
+from synthetic_pcap import LINKTYPE_LINUX_SLL, random_udp_stream, udp_packet, write_pcap
+from utils.packets import LINKTYPE_RAW
+from utils.pcap_merge import PacketDeduplicator, merge_pcaps
+
+
+def routed_copy(frame, hops=1):
+    """The same packet seen on another target: another link-layer address, a lower TTL and another checksum."""
+    copy = bytearray(frame)
+    copy[6:14] = b"\x02\x00\x00\x00\x00\x02\x00\x00"
+    copy[SLL_HEADER_SIZE + 8] -= hops
+    copy[SLL_HEADER_SIZE + 10:SLL_HEADER_SIZE + 12] = b"\xbe\xef"
+    return bytes(copy)
+
+
+def test_merge_orders_every_packet_by_timestamp(tmp_path):
+    inputs, expected = [], []
+    for host in range(1, 4):
+        packets = list(random_udp_stream(500, seed=host, host=host))
+        path = str(tmp_path / f"tcpdump_task{host}.pcap")
+        write_pcap(path, packets)
+        inputs.append(path)
+        expected += [(timestamp_ns(timestamp), LINKTYPE_LINUX_SLL, frame) for timestamp, frame in packets]
+
+    stats = merge_pcaps(inputs, str(tmp_path / "merged.pcap"))
+    file_format, merged = read_capture(str(tmp_path / "merged.pcap"))
+    assert file_format == "pcap"
+    assert stats["packets"] == len(merged) == 1500
+    assert [packet[0] for packet in merged] == sorted(packet[0] for packet in merged)
+    assert sorted(merged) == sorted(expected)
+
+
+def test_merge_breaks_timestamp_ties_by_input_order(tmp_path):
+    timestamps = [1_700_000_000.0 + i * 0.001 for i in range(10)]
+    for host in (1, 2):
+        write_pcap(str(tmp_path / f"{host}.pcap"),
+                   [(timestamp, udp_packet(f"10.0.0.{host}", "10.1.0.1", 5060, 5060, b"x")) for timestamp in timestamps])
+
+    merge_pcaps([str(tmp_path / "2.pcap"), str(tmp_path / "1.pcap")], str(tmp_path / "merged.pcap"))
+    _, merged = read_capture(str(tmp_path / "merged.pcap"))
+    sources = [data[SLL_HEADER_SIZE + 15] for _, _, data in merged]  # Last byte of the source address
+    assert sources == [2, 1] * 10
+
+
+def test_merge_of_mixed_link_types_writes_pcapng_that_merges_again(tmp_path):
+    sll = list(random_udp_stream(200, seed=1, host=1))
+    raw = list(random_udp_stream(200, seed=2, host=2))
+    write_pcap(str(tmp_path / "sll.pcap"), sll)
+    write_raw_pcap(str(tmp_path / "raw.pcap"), raw)
+
+    merge_pcaps([str(tmp_path / "sll.pcap"), str(tmp_path / "raw.pcap")], str(tmp_path / "merged.pcapng"))
+    file_format, merged = read_capture(str(tmp_path / "merged.pcapng"))
+    assert file_format == "pcapng"
+    expected = [(timestamp_ns(timestamp), LINKTYPE_LINUX_SLL, frame) for timestamp, frame in sll]
+    expected += [(timestamp_ns(timestamp), LINKTYPE_RAW, frame[SLL_HEADER_SIZE:]) for timestamp, frame in raw]
+    assert merged == sorted(merged, key=lambda packet: packet[0])
+    assert sorted(merged) == sorted(expected)
+
+    # A merged pcapng is a valid input of another merge
+    more = list(random_udp_stream(100, seed=3, host=3))
+    write_pcap(str(tmp_path / "more.pcap"), more)
+    stats = merge_pcaps([str(tmp_path / "merged.pcapng"), str(tmp_path / "more.pcap")], str(tmp_path / "again.pcapng"))
+    _, again = read_capture(str(tmp_path / "again.pcapng"))
+    assert stats["packets"] == 500
+    assert sorted(again) == sorted(expected + [(timestamp_ns(timestamp), LINKTYPE_LINUX_SLL, frame) for timestamp, frame in more])
+
+
+def test_compressed_inputs_merge_like_uncompressed_ones(tmp_path):
+    for host in (1, 2):
+        write_pcap(str(tmp_path / f"{host}.pcap"), random_udp_stream(300, seed=host, host=host))
+    with open(str(tmp_path / "2.pcap"), "rb") as source, gzip.open(str(tmp_path / "2.pcap.gz"), "wb") as target:
+        shutil.copyfileobj(source, target)
+
+    merge_pcaps([str(tmp_path / "1.pcap"), str(tmp_path / "2.pcap")], str(tmp_path / "plain.pcap"))
+    stats = merge_pcaps([str(tmp_path / "1.pcap"), str(tmp_path / "2.pcap.gz")], str(tmp_path / "compressed.pcap"))
+    assert stats["compression"]["files"] == 1
+    assert read_capture(str(tmp_path / "compressed.pcap")) == read_capture(str(tmp_path / "plain.pcap"))
+
+
+def test_merge_skips_files_that_are_not_captures(tmp_path, capsys):
+    write_pcap(str(tmp_path / "1.pcap"), random_udp_stream(50))
+    (tmp_path / "broken.pcap").write_bytes(b"not a capture at all")
+
+    stats = merge_pcaps([str(tmp_path / "1.pcap"), str(tmp_path / "broken.pcap")], str(tmp_path / "merged.pcap"))
+    assert stats["packets"] == 50
+    assert "Skipping" in capsys.readouterr().out
+
+
+def test_merge_drops_copies_of_a_packet_captured_by_several_targets(tmp_path):
+    packets = list(random_udp_stream(300, seed=1))
+    write_pcap(str(tmp_path / "pcscf.pcap"), packets)
+    # The first half also went through the second target 2 ms later, the rest only went there 1 s later
+    write_pcap(str(tmp_path / "rtpengine.pcap"), [(timestamp + 0.002, routed_copy(frame)) for timestamp, frame in packets[:150]] +
+               [(timestamp + 1.0, routed_copy(frame)) for timestamp, frame in packets[150:]])
+
+    inputs = [str(tmp_path / "pcscf.pcap"), str(tmp_path / "rtpengine.pcap")]
+    stats = merge_pcaps(inputs, str(tmp_path / "merged.pcap"), PacketDeduplicator(window_ms=50))
+    _, merged = read_capture(str(tmp_path / "merged.pcap"))
+    assert stats["duplicates"] == {inputs[1]: 150}
+    assert stats["packets"] == len(merged) == 450
+    assert [data for _, _, data in merged].count(routed_copy(packets[0][1])) == 0
+    assert sorted(data for _, _, data in merged if data not in {frame for _, frame in packets}) == \
+        sorted(routed_copy(frame) for _, frame in packets[150:])
+
+
+def test_deduplicator_keeps_repeats_within_one_capture_unless_asked():
+    frame = udp_packet("10.0.0.1", "10.1.0.1", 5060, 5060, b"OPTIONS")
+    deduplicator = PacketDeduplicator()
+    assert not deduplicator.is_duplicate(0, 0, frame, LINKTYPE_LINUX_SLL)
+    assert not deduplicator.is_duplicate(1_000_000, 0, frame, LINKTYPE_LINUX_SLL)  # A retransmission
+    assert deduplicator.is_duplicate(2_000_000, 1, routed_copy(frame), LINKTYPE_LINUX_SLL)
+
+    deduplicator = PacketDeduplicator(same_source=True)
+    assert not deduplicator.is_duplicate(0, 0, frame, LINKTYPE_LINUX_SLL)
+    assert deduplicator.is_duplicate(1_000_000, 0, frame, LINKTYPE_LINUX_SLL)
+    assert deduplicator.dropped == {0: 1}
+
+
+def test_deduplicator_keeps_packets_that_differ_beyond_the_masked_fields():
+    frame = udp_packet("10.0.0.1", "10.1.0.1", 5060, 5060, b"OPTIONS")
+    other = udp_packet("10.0.0.1", "10.1.0.1", 5060, 5060, b"OPTIONZ")
+    deduplicator = PacketDeduplicator()
+    assert not deduplicator.is_duplicate(0, 0, frame, LINKTYPE_LINUX_SLL)
+    assert not deduplicator.is_duplicate(0, 1, other, LINKTYPE_LINUX_SLL)
+
+    # IPv6: only the hop limit differs between the copies
+    ipv6 = struct.pack(">IHBB16s16s", 0x60000000, 8, 17, 64, b"\x20" * 16, b"\x21" * 16) + struct.pack(">HHHH", 5060, 5060, 8, 0)
+    routed = ipv6[:7] + b"\x3f" + ipv6[8:]
+    assert not deduplicator.is_duplicate(0, 0, ipv6, LINKTYPE_RAW)
+    assert deduplicator.is_duplicate(0, 1, routed, LINKTYPE_RAW)
+
+
+def test_deduplicator_memory_is_bounded_by_time_and_count():
+    frames = [udp_packet("10.0.0.1", "10.1.0.1", 5060, 5060, bytes([i])) for i in range(3)]
+    deduplicator = PacketDeduplicator(window_ms=10)
+    assert not deduplicator.is_duplicate(0, 0, frames[0], LINKTYPE_LINUX_SLL)
+    assert not deduplicator.is_duplicate(20_000_000, 1, routed_copy(frames[0]), LINKTYPE_LINUX_SLL)
+
+    deduplicator = PacketDeduplicator(max_entries=2)
+    for frame in frames:
+        assert not deduplicator.is_duplicate(0, 0, frame, LINKTYPE_LINUX_SLL)
+    assert deduplicator.is_duplicate(0, 1, routed_copy(frames[2]), LINKTYPE_LINUX_SLL)
+    assert not deduplicator.is_duplicate(0, 1, routed_copy(frames[0]), LINKTYPE_LINUX_SLL)
+    assert len(deduplicator._seen) <= 2
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+from utils import aws_services
+from utils.aws_services import S3DownloadManager, resume_downloads
+from utils.resumable_download import PARTIAL_SUFFIX, DownloadManifest, resumable_download
+
+CHUNK = 1024
+
+
+class FakeBody:
+    def __init__(self, data):
+        self.data = data
+
+    def iter_chunks(self, chunk_size):
+        for start in range(0, len(self.data), chunk_size):
+            yield self.data[start:start + chunk_size]
+
+
+class FakeS3:
+    """Serves one object with ranged GETs, failing the ranges starting at `fail_from` or later and the first `outages` HEADs."""
+
+    def __init__(self, data, etag=None, fail_from=None, outages=0):
+        self.data = data
+        self.etag = etag or hashlib.md5(data).hexdigest()
+        self.fail_from = fail_from
+        self.outages = outages
+        self.heads = 0
+        self.ranges = []
+        self._lock = threading.Lock()
+
+    def head_object(self, Bucket, Key):
+        self.heads += 1
+        if self.heads <= self.outages:
+            raise ConnectionError("Network is unreachable")
+        if Key == "missing.pcap":
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {"ContentLength": len(self.data), "ETag": f'"{self.etag}"'}
+
+    def get_object(self, Bucket, Key, Range, IfMatch):
+        assert IfMatch == self.etag
+        start, end = (int(bound) for bound in Range[len("bytes="):].split("-"))
+        if self.fail_from is not None and start >= self.fail_from:
+            raise ConnectionError(f"Connection lost at byte {start}")
+        with self._lock:
+            self.ranges.append(start)
+        return {"Body": FakeBody(self.data[start:end + 1])}
+
+
+@pytest.fixture
+def data():
+    return os.urandom(10 * CHUNK + 123)
+
+
+def test_download_writes_every_range(tmp_path, data):
+    s3 = FakeS3(data)
+    local_path = str(tmp_path / "tcpdump_task1.pcap")
+    path, fetched = resumable_download(s3, "bucket", "key", local_path, DownloadManifest(str(tmp_path)), CHUNK, 4)
+    assert path == local_path and fetched == len(data)
+    assert open(local_path, 'rb').read() == data
+    assert not os.path.exists(local_path + PARTIAL_SUFFIX)
+    assert DownloadManifest(str(tmp_path)).get("key")["complete"]
+
+
+def test_interrupted_download_resumes_from_the_complete_bytes(tmp_path, data):
+    local_path = str(tmp_path / "tcpdump_task1.pcap")
+    with pytest.raises(ConnectionError):
+        resumable_download(FakeS3(data, fail_from=4 * CHUNK), "bucket", "key", local_path, DownloadManifest(str(tmp_path)), CHUNK, 1)
+    entry = DownloadManifest(str(tmp_path)).get("key")
+    assert entry["completeBytes"] == 4 * CHUNK and not entry["complete"]
+
+    s3 = FakeS3(data)
+    _, fetched = resumable_download(s3, "bucket", "key", local_path, DownloadManifest(str(tmp_path)), CHUNK, 4)
+    assert fetched == len(data) - 4 * CHUNK
+    assert min(s3.ranges) == 4 * CHUNK
+    assert open(local_path, 'rb').read() == data
+
+
+def test_replaced_object_restarts_from_scratch(tmp_path, data):
+    local_path = str(tmp_path / "tcpdump_task1.pcap")
+    with pytest.raises(ConnectionError):
+        resumable_download(FakeS3(data, fail_from=4 * CHUNK), "bucket", "key", local_path, DownloadManifest(str(tmp_path)), CHUNK, 1)
+
+    replaced = os.urandom(len(data))
+    s3 = FakeS3(replaced)
+    _, fetched = resumable_download(s3, "bucket", "key", local_path, DownloadManifest(str(tmp_path)), CHUNK, 4)
+    assert fetched == len(replaced) and min(s3.ranges) == 0
+    assert open(local_path, 'rb').read() == replaced
+
+
+def test_file_already_on_disk_is_not_fetched_again(tmp_path, data):
+    local_path = str(tmp_path / "tcpdump_task1.pcap")
+    with open(local_path, 'wb') as file:
+        file.write(data)
+    s3 = FakeS3(data)
+    _, fetched = resumable_download(s3, "bucket", "key", local_path, DownloadManifest(str(tmp_path)), CHUNK, 4)
+    assert fetched == 0 and s3.ranges == []
+    assert DownloadManifest(str(tmp_path)).get("key")["complete"]
+
+
+@pytest.fixture
+def s3_session(monkeypatch):
+    """Makes every S3DownloadManager use the FakeS3 client put in the returned list."""
+    clients = []
+
+    class Session:
+        def client(self, service, config=None):
+            return clients[-1]
+    monkeypatch.setattr(aws_services, "_session", lambda **kwargs: Session())
+    return clients
+
+
+def test_manager_keeps_retrying_through_an_outage_within_its_budget(tmp_path, data, s3_session, monkeypatch):
+    s3_session.append(FakeS3(data, outages=2))
+    backoffs = []
+    monkeypatch.setattr(aws_services.time, "sleep", backoffs.append)
+    with S3DownloadManager("lab", "bucket", "us-east-1", str(tmp_path), {"retries": 0, "retrySeconds": 60}) as downloader:
+        assert downloader.submit("tcpdump_task1.pcap").result() == str(tmp_path / "tcpdump_task1.pcap")
+    assert downloader.files["tcpdump_task1.pcap"]["attempts"] == 3 and backoffs == [1, 2]
+    assert open(str(tmp_path / "tcpdump_task1.pcap"), 'rb').read() == data
+
+
+def test_manager_gives_up_on_missing_objects_at_once(tmp_path, data, s3_session):
+    s3_session.append(FakeS3(data))
+    with S3DownloadManager("lab", "bucket", "us-east-1", str(tmp_path), {"retries": 5, "retrySeconds": 60}) as downloader:
+        assert downloader.submit("missing.pcap").result() is None
+    assert downloader.failed == ["missing.pcap"] and downloader.files["missing.pcap"]["attempts"] == 1
+
+
+def test_a_later_run_finishes_the_downloads_of_a_folder(tmp_path, s3_session):
+    mb = 1024 * 1024
+    data = os.urandom(5 * mb + 123)
+    s3_session.append(FakeS3(data, fail_from=2 * mb))
+    config = {"retries": 0, "retrySeconds": 0, "multipartChunksizeMB": 1, "maxConcurrencyPerFile": 1}
+    with S3DownloadManager("lab", "bucket", "us-east-1", str(tmp_path), config) as downloader:
+        assert downloader.submit("tcpdump_task1.pcap").result() is None
+
+    s3 = FakeS3(data)
+    s3_session.append(s3)
+    downloaders = resume_downloads(str(tmp_path), download_config=config)
+    assert [downloader.bucket_name for downloader in downloaders] == ["bucket"]
+    assert downloaders[0].bytes_downloaded == len(data) - 2 * mb and min(s3.ranges) == 2 * mb
+    assert open(str(tmp_path / "tcpdump_task1.pcap"), 'rb').read() == data
+    assert resume_downloads(str(tmp_path)) == []
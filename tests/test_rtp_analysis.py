@@ -0,0 +1,86 @@
+import random
+import struct
+
+import numpy as np
+
+from synthetic_pcap import rtp_packet, udp_packet, write_pcap
+from utils.rtp_analysis import JITTER_BLOCK, analyze_rtp, rfc3550_jitter
+
+START = 1_700_000_000.0
+SSRC = 0x1234ABCD
+
+
+def scalar_jitter(transit_delta, starts):
+    """RFC 3550 J += (|D| - J) / 16, one packet at a time, restarted at every stream start."""
+    jitter, values = 0.0, []
+    for index, delta in enumerate(transit_delta):
+        if index in starts:
+            jitter = 0.0
+        jitter += (abs(delta) - jitter) / 16
+        values.append(jitter)
+    return np.array(values)
+
+
+def test_blocked_jitter_matches_the_scalar_filter_across_blocks_and_restarts():
+    rng = np.random.default_rng(0)
+    count = 4 * JITTER_BLOCK + 37
+    transit_delta = rng.normal(0, 40, count)
+    # Streams starting mid-block, on a block boundary, at the last packet of a block and spanning several blocks
+    starts = np.array([0, 100, JITTER_BLOCK, 2 * JITTER_BLOCK - 1, 2 * JITTER_BLOCK + 5, 4 * JITTER_BLOCK + 36])
+    transit_delta[starts] = 0
+
+    expected = scalar_jitter(transit_delta, set(starts.tolist()))
+    assert np.allclose(rfc3550_jitter(transit_delta, starts), expected, rtol=1e-9, atol=1e-9)
+    assert np.allclose(rfc3550_jitter(transit_delta[:1], np.array([0])), [0.0])
+    assert len(rfc3550_jitter(np.zeros(0), np.zeros(0, dtype=np.int64))) == 0
+
+
+def receiver_report(reported_ssrc, fraction_lost, jitter):
+    block = struct.pack(">IB3sIIII", reported_ssrc, fraction_lost, b"\0\0\3", 65549, jitter, 0, 0)
+    return struct.pack(">BBHI", 0x81, 201, 7, 0xCAFE) + block
+
+
+def test_loss_duplicates_and_reordering_of_a_wrapping_stream(tmp_path):
+    rng = random.Random(1)
+    # 20 sequence numbers wrapping from 65530 through 0, with a wrapping RTP timestamp too
+    sequence = list(range(65530, 65550))
+    arrivals = []
+    for extended in sequence:
+        if extended in (65533, 65540, 65541):
+            continue  # Lost: one gap of 1 and one of 2
+        arrivals.append(extended)
+        if extended == 65535:
+            arrivals.append(extended)  # Duplicate
+    swap = arrivals.index(65545)
+    arrivals[swap], arrivals[swap + 1] = arrivals[swap + 1], arrivals[swap]  # 65546 arrives before 65545
+
+    packets, arrival_times, rtp_timestamps = [], [], []
+    for number, extended in enumerate(arrivals):
+        timestamp = START + number * 0.02 + rng.uniform(0, 0.004)
+        rtp_timestamp = (2 ** 32 - 800 + (extended - 65530) * 160) % 2 ** 32
+        packets.append((timestamp, udp_packet("10.0.1.10", "10.0.2.20", 20000, 40000,
+                                              rtp_packet(SSRC, extended % 65536, rtp_timestamp))))
+        arrival_times.append(round(timestamp * 1e6) / 1e6)
+        rtp_timestamps.append(2 ** 32 - 800 + (extended - 65530) * 160)
+    packets.append((START + 0.5, udp_packet("10.0.2.20", "10.0.1.10", 40001, 20001, receiver_report(SSRC, 25, 80))))
+    # Too short to be a stream
+    packets += [(START + i * 0.02, udp_packet("10.0.9.9", "10.0.2.20", 30000, 30000, rtp_packet(0x99, i, i * 160))) for i in range(3)]
+    packets.sort(key=lambda packet: packet[0])
+    write_pcap(str(tmp_path / "rtp.pcap"), packets)
+
+    result = analyze_rtp(str(tmp_path / "rtp.pcap"), min_packets=10)
+    assert result["rtcpPackets"] == 1
+    [stream] = result["streams"]
+    assert stream["ssrc"] == f"0x{SSRC:08x}" and stream["src"] == "10.0.1.10:20000" and stream["dst"] == "10.0.2.20:40000"
+    assert stream["clockRate"] == 8000
+    assert (stream["packets"], stream["expected"], stream["lost"]) == (18, 20, 3)
+    assert (stream["duplicates"], stream["reordered"], stream["gaps"], stream["maxGap"]) == (1, 1, 2, 2)
+    assert stream["lossPercent"] == 15.0
+    assert stream["rtcpReports"] == 1 and stream["rtcpLossPercent"] == round(25 / 256 * 100, 3)
+    assert stream["rtcpJitterMs"] == 10.0
+
+    transit_delta = [0.0] + [(arrival_times[i] - arrival_times[i - 1]) * 8000 - (rtp_timestamps[i] - rtp_timestamps[i - 1])
+                             for i in range(1, len(arrivals))]
+    jitter = scalar_jitter(transit_delta, {0})
+    assert abs(stream["jitterMs"] - jitter[-1] / 8) < 0.001
+    assert abs(stream["maxJitterMs"] - jitter.max() / 8) < 0.001
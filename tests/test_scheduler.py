@@ -0,0 +1,105 @@
+import asyncio
+import os
+import signal
+import time
+
+from utils.capture_report import CaptureReport
+from utils.scheduler import CaptureScheduler, wait_for_stop
+
+
+class StubCapture:
+    """Stands in for an EcsCapture/Ec2Capture, recording the phases it went through and when it started."""
+
+    def __init__(self, prepare_delay=0.0, prepare_error=None, started=True):
+        self.prepare_delay = prepare_delay
+        self.prepare_error = prepare_error
+        self.started = started
+        self.phases = []
+        self.started_at = None
+
+    async def prepare(self):
+        self.phases.append("prepare")
+        await asyncio.sleep(self.prepare_delay)
+        if self.prepare_error:
+            raise self.prepare_error
+        return True
+
+    async def start(self):
+        self.phases.append("start")
+        self.started_at = time.time()
+        return self.started
+
+    async def stop(self):
+        self.phases.append("stop")
+        return True
+
+    async def collect(self):
+        self.phases.append("collect")
+        return True
+
+    async def close(self):
+        self.phases.append("close")
+
+
+def test_captures_start_together_after_the_last_one_is_ready():
+    captures = {"slow": StubCapture(prepare_delay=0.2), "fast": StubCapture()}
+    report = CaptureReport("batch")
+    start_at = time.time() + 0.4
+
+    result = asyncio.run(CaptureScheduler(captures, report).run(lambda: wait_for_stop(duration=0.1, poll_interval=0.02), start_at))
+    assert result["reason"] == "duration" and sorted(result["captures"]) == ["fast", "slow"]
+    assert all(capture.started_at >= start_at for capture in captures.values())
+    assert result["startSkew"] < 0.1
+    assert all(capture.phases == ["prepare", "start", "stop", "collect", "close"] for capture in captures.values())
+    assert [phase["phase"] for phase in report.phases] == ["start barrier", "capturing"]
+    assert report.phases[1]["reason"] == "duration"
+
+
+def test_captures_failing_to_prepare_or_start_are_left_out(capsys):
+    captures = {"ok": StubCapture(), "broken": StubCapture(prepare_error=RuntimeError("no targets")), "idle": StubCapture(started=False)}
+    scheduler = CaptureScheduler(captures)
+
+    result = asyncio.run(scheduler.run(lambda: wait_for_stop(duration=0.05, poll_interval=0.01)))
+    assert result["captures"] == ["ok"]
+    assert scheduler.failed == {"broken": "prepare failed: no targets", "idle": "start failed on every target"}
+    assert captures["broken"].phases == ["prepare", "close"]
+    assert captures["idle"].phases == ["prepare", "start", "close"]
+    assert captures["ok"].phases == ["prepare", "start", "stop", "collect", "close"]
+    assert "Capture broken: prepare failed: no targets" in capsys.readouterr().out
+
+
+def test_nothing_is_stopped_when_no_capture_started():
+    captures = {"broken": StubCapture(prepare_error=RuntimeError("no targets"))}
+    stopped = []
+
+    async def stop():
+        stopped.append(True)
+        return "duration"
+
+    result = asyncio.run(CaptureScheduler(captures).run(stop, time.time() + 60))
+    assert result == {"captures": [], "reason": None, "startSkew": 0}
+    assert stopped == []
+
+
+def test_wait_for_stop_after_the_duration():
+    start = time.monotonic()
+    assert asyncio.run(wait_for_stop(duration=0.2, poll_interval=1)) == "duration"
+    assert 0.2 <= time.monotonic() - start < 0.5
+
+
+def test_wait_for_stop_when_the_stop_file_appears(tmp_path):
+    stop_file = str(tmp_path / "stop")
+
+    async def main():
+        asyncio.get_running_loop().call_later(0.1, lambda: open(stop_file, "w").close())
+        return await wait_for_stop(duration=5, stop_file=stop_file, poll_interval=0.02)
+
+    assert asyncio.run(main()) == "stop file"
+
+
+def test_wait_for_stop_on_sigint():
+    async def main():
+        asyncio.get_running_loop().call_later(0.1, os.kill, os.getpid(), signal.SIGINT)
+        return await wait_for_stop(duration=5, poll_interval=0.02)
+
+    assert asyncio.run(main()) == "SIGINT"
@@ -0,0 +1,76 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from utils.segment_collector import SegmentCollector
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+UPLOAD_SEGMENT_SCRIPT = os.path.join(ROOT, "pcapScript", "uploadSegment.sh")
+CAPTURE_ID = "20240101120000"
+TARGETS = ["0123456789abcdef0123456789abcdef", "i-0abc123def4567890"]
+
+
+class FakeS3:
+    def __init__(self, keys):
+        self.keys = keys
+
+    def get_paginator(self, operation):
+        assert operation == "list_objects_v2"
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        yield {"Contents": [{"Key": key} for key in self.keys if key.startswith(Prefix)]}
+
+
+class FakeDownloader:
+    bucket_name = "captures"
+
+    def __init__(self, keys):
+        self.s3_client = FakeS3(keys)
+
+
+def uploaded_name(tmp_path, ring_file, codec=""):
+    """Run uploadSegment.sh on a tcpdump ring buffer file the way tcpdump -z does, returning the key it uploads."""
+    with open(ring_file, "wb") as file:
+        file.write(b"\xd4\xc3\xb2\xa1" + bytes(20))
+    node = tmp_path / "node"
+    node.write_text('#!/bin/sh\nbasename "$2" > "$ECX_UPLOADED"\n')
+    node.chmod(0o755)
+    env = dict(os.environ, ECX_BUCKET="captures", ECX_COMPRESS=codec, ECX_NODE=str(node), ECX_UPLOADED=str(tmp_path / "uploaded"))
+    subprocess.run(["sh", UPLOAD_SEGMENT_SCRIPT, str(ring_file)], env=env, check=True)
+    assert not os.path.exists(ring_file)
+    return (tmp_path / "uploaded").read_text().strip()
+
+
+@pytest.mark.parametrize("leg", ["", "_sip", "_media"])
+@pytest.mark.parametrize("codec", ["", "gzip", "zstd"])
+def test_segments_uploaded_by_the_script_are_collected(tmp_path, leg, codec):
+    if codec and not shutil.which(codec):
+        pytest.skip(f"{codec} not installed")
+    keys = [uploaded_name(tmp_path, tmp_path / f"tcpdump_{target}_{CAPTURE_ID}{leg}.pcap{index}", codec)
+            for target in TARGETS for index in (0, 12)]
+    assert all(key.endswith({"": ".pcap", "gzip": ".pcap.gz", "zstd": ".pcap.zst"}[codec]) for key in keys)
+
+    collector = SegmentCollector(FakeDownloader(keys), TARGETS, CAPTURE_ID)
+    assert sorted(collector._list_new_segments()) == sorted(keys)
+    # Listed once only
+    assert collector._list_new_segments() == []
+
+
+def test_near_miss_names_are_not_collected():
+    target = TARGETS[0]
+    near_misses = [
+        f"tcpdump_{target}_20240101120001_sip_17040000000001.pcap.gz",  # Another capture
+        f"tcpdump_{target}_{CAPTURE_ID}9_17040000000001.pcap",  # Another capture id starting with this one
+        f"tcpdump_{target}_{CAPTURE_ID}_sip.pcap",  # Last file of a capture without rotation
+        f"tcpdump_{target}_{CAPTURE_ID}_sip.pcap3",  # Ring buffer file not renamed yet
+        f"tcpdump_{target}_{CAPTURE_ID}_sip_17040000000001.pcap.bz2",
+        f"tcpdump_{target}_{CAPTURE_ID}_SIP_17040000000001.pcap",
+        f"tcpdump_{target}_{CAPTURE_ID}_sip_17040000000001.pcap.gz.tmp",
+        f"tcpdump_other_{CAPTURE_ID}_17040000000001.pcap",  # A target that isn't captured
+    ]
+    segment = f"tcpdump_{target}_{CAPTURE_ID}_sip_17040000000001.pcap.gz"
+    collector = SegmentCollector(FakeDownloader(near_misses + [segment]), TARGETS, CAPTURE_ID)
+    assert collector._list_new_segments() == [segment]
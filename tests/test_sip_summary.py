@@ -0,0 +1,49 @@
+from synthetic_pcap import sip_call, sip_calls, write_pcap
+from utils.sip_summary import capture_source, merge_dialogs, summarize_sip, summarize_sip_file
+
+START = 1_700_000_000.0
+
+
+def test_capture_source_strips_the_capture_and_segment_suffixes():
+    assert capture_source("/runs/tcpdump_task1.pcap") == "task1"
+    assert capture_source("tcpdump_i-0abc123.pcapng") == "i-0abc123"
+    assert capture_source("tcpdump_task1_1700000000001.pcap.gz") == "task1"
+    assert capture_source("tcpdump_task1.pcap3.zst") == "task1"
+    # Fewer than 12 digits is part of the target name, not a segment
+    assert capture_source("tcpdump_task_12345.pcap") == "task_12345"
+
+
+def test_calls_seen_by_two_tasks_are_merged_and_retransmissions_left_out(tmp_path):
+    # taskA sees calls 0, 1 and 3 answered, call 2 rejected, and the INVITE of call 0 sent twice
+    packets_a = sip_calls(4, START, rtp_packets=5)
+    packets_a = [packet for packet in packets_a if b"call-2@ecx" not in packet[1]] + sip_call(2, START + 0.1, rtp_packets=5, status=486)
+    packets_a.append((START + 0.5, packets_a[0][1]))
+    write_pcap(str(tmp_path / "tcpdump_taskA.pcap"), sorted(packets_a, key=lambda packet: packet[0]))
+    # taskB, a rotated segment, sees call 3 a little later and call 4
+    packets_b = [(timestamp + 0.002, frame) for timestamp, frame in sip_call(3, START + 0.15, rtp_packets=5)]
+    packets_b += sip_call(4, START + 0.2, rtp_packets=5)
+    write_pcap(str(tmp_path / "tcpdump_taskB_1700000000001.pcap"), sorted(packets_b, key=lambda packet: packet[0]))
+
+    file_a = summarize_sip_file(str(tmp_path / "tcpdump_taskA.pcap"))
+    assert (file_a["source"], file_a["messages"], file_a["retransmissions"]) == ("taskA", 22, 1)
+    _, answered, _, status = file_a["dialogs"]["call-2@ecx"]
+    assert file_a["methods"]["INVITE"] == 4 and (answered, status) == (None, 486)
+
+    summary = summarize_sip([str(tmp_path)], workers=1)
+    assert (summary["files"], summary["messages"], summary["retransmissions"]) == (2, 34, 1)
+    assert summary["methods"] == {"INVITE": 6, "ACK": 5, "BYE": 5}
+    assert summary["responses"] == {"100": 6, "200": 10, "486": 1}
+    assert summary["calls"] == {"total": 5, "answered": 4, "failed": 1, "noFinalResponse": 0}
+    assert summary["failures"] == {"486": 1}
+    assert summary["setupLatency"]["count"] == 4 and summary["setupLatency"]["maxMs"] == 200.0
+    assert summary["sources"] == {
+        "taskA": {"files": 1, "messages": 22, "retransmissions": 1, "errors": 1, "calls": 4},
+        "taskB": {"files": 1, "messages": 12, "retransmissions": 0, "errors": 0, "calls": 2},
+    }
+
+
+def test_merge_dialogs_keeps_the_first_invite_and_answer_and_the_last_final_response():
+    dialogs = {}
+    merge_dialogs(dialogs, {"call-1": [100, None, None, None], "call-2": [100, 300, 300, 200]})
+    merge_dialogs(dialogs, {"call-1": [90, 250, 260, 200], "call-2": [110, 320, 400, 200], "call-3": [500, None, 600, 486]})
+    assert dialogs == {"call-1": [90, 250, 260, 200], "call-2": [100, 300, 400, 200], "call-3": [500, None, 600, 486]}
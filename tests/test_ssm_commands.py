@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from utils import aws_services
+from utils.aws_services import poll_ssm_commands, send_ssm_commands
+
+
+class FakeSsm:
+    """SSM client whose invocations stay InProgress for `polls` polls before reporting `status`."""
+
+    def __init__(self, polls=0, status="Success"):
+        self.polls = polls
+        self.status = status
+        self.sent = []
+        self.listed = 0
+
+    def send_command(self, InstanceIds, DocumentName, Parameters, Comment):
+        self.sent.append({"InstanceIds": InstanceIds, "Parameters": Parameters})
+        return {"Command": {"CommandId": f"command-{len(self.sent)}"}}
+
+    def get_paginator(self, operation):
+        client = self
+
+        class Paginator:
+            def paginate(self, CommandId):
+                client.listed += 1
+                status = client.status if client.listed > client.polls else "InProgress"
+                instance_ids = client.sent[int(CommandId.split("-")[1]) - 1]["InstanceIds"]
+                yield {"CommandInvocations": [{"InstanceId": instance_id, "Status": status} for instance_id in instance_ids]}
+        return Paginator()
+
+
+@pytest.fixture
+def ssm(monkeypatch):
+    client = FakeSsm()
+
+    class Session:
+        def client(self, service, region_name):
+            return client
+    monkeypatch.setattr(aws_services, "_session", lambda **kwargs: Session())
+    return client
+
+
+async def collect(sent, timeout):
+    return [result async for result in poll_ssm_commands("profile", sent, timeout, poll_interval=0.01)]
+
+
+def test_commands_carry_their_execution_timeout_in_batches(ssm):
+    instance_ids = [f"i-{i:04d}" for i in range(60)]
+    sent = send_ssm_commands("profile", {"us-east-2": instance_ids}, ["sudo pkill tcpdump"], execution_timeout=7200)
+    assert [len(batch) for _, batch in sent["us-east-2"]] == [50, 10]
+    assert all(command["Parameters"] == {"commands": ["sudo pkill tcpdump"], "executionTimeout": ["7200"]} for command in ssm.sent)
+
+    send_ssm_commands("profile", {"us-east-2": instance_ids[:1]}, ["true"])
+    assert "executionTimeout" not in ssm.sent[-1]["Parameters"]
+
+
+def test_polling_waits_for_the_final_status_of_long_invocations(ssm):
+    ssm.polls = 20
+    sent = send_ssm_commands("profile", {"us-east-2": ["i-1", "i-2"]}, ["upload"])
+    assert sorted(asyncio.run(collect(sent, timeout=5))) == [("i-1", "Success", ""), ("i-2", "Success", "")]
+    assert ssm.listed == 21
+
+
+def test_polling_reports_invocations_still_running_after_the_timeout(ssm):
+    ssm.polls = 10 ** 6
+    sent = send_ssm_commands("profile", {"us-east-2": ["i-1"]}, ["upload"])
+    assert asyncio.run(collect(sent, timeout=0.05)) == [("i-1", "TimedOut", "No result after 0.05s")]
@@ -0,0 +1,104 @@
+import argparse
+import json
+import random
+
+import pytest
+
+import pcap_tools
+from captures import read_capture, timestamp_ns, write_raw_pcap
+from synthetic_pcap import random_udp_stream, write_pcap
+from utils.pcap_merge import merge_pcaps
+from utils.time_index import (TIME_INDEX_SUFFIX, TIME_OFFSETS_SUFFIX, TimeIndexer, build_time_index, load_time_index,
+                              parse_window_time, slice_capture)
+
+
+def merged_capture(tmp_path, raw=False, packets=2000):
+    """Merge two synthetic captures with a time index, the second one raw IP for a pcapng merge."""
+    write_pcap(str(tmp_path / "1.pcap"), random_udp_stream(packets // 2, seed=1, host=1))
+    (write_raw_pcap if raw else write_pcap)(str(tmp_path / "2.pcap"), random_udp_stream(packets // 2, seed=2, host=2))
+    merged = str(tmp_path / ("merged.pcapng" if raw else "merged.pcap"))
+    merge_pcaps([str(tmp_path / "1.pcap"), str(tmp_path / "2.pcap")], merged, time_indexer=TimeIndexer(interval=7))
+    return merged
+
+
+def windows(packets, count=40, seed=0):
+    """Windows around, inside and across the capture, some starting or ending exactly on a packet."""
+    rng = random.Random(seed)
+    first, last = packets[0][0], packets[-1][0]
+    yield first - 10 ** 9, first - 1
+    yield last + 1, last + 10 ** 9
+    yield first - 10 ** 9, last + 10 ** 9
+    yield first, first
+    yield last, last
+    for _ in range(count):
+        start = rng.choice(packets)[0] if rng.random() < 0.5 else rng.randint(first, last)
+        end = rng.choice(packets)[0] if rng.random() < 0.5 else rng.randint(start, last)
+        yield start, max(start, end)
+
+
+@pytest.mark.parametrize("raw", [False, True], ids=["pcap", "pcapng"])
+def test_slice_holds_exactly_the_packets_of_the_window(tmp_path, raw):
+    merged = merged_capture(tmp_path, raw)
+    file_format, packets = read_capture(merged)
+    assert file_format == ("pcapng" if raw else "pcap")
+
+    for number, (start_ns, end_ns) in enumerate(windows(packets)):
+        output = str(tmp_path / f"slice{number}.{file_format}")
+        stats = slice_capture(merged, start_ns, end_ns, output)
+        expected = [packet for packet in packets if start_ns <= packet[0] <= end_ns]
+        _, sliced = read_capture(output)
+        assert sliced == expected, (start_ns, end_ns)
+        assert stats["packets"] == len(expected)
+
+
+def test_separate_pass_builds_the_same_index_as_the_merge(tmp_path):
+    merged = merged_capture(tmp_path)
+    with open(merged + TIME_INDEX_SUFFIX) as index_file, open(merged + TIME_OFFSETS_SUFFIX, "rb") as offsets_file:
+        merge_index, merge_offsets = json.load(index_file), offsets_file.read()
+
+    assert build_time_index(merged, interval=7) == 2000
+    assert load_time_index(merged) == merge_index
+    with open(merged + TIME_OFFSETS_SUFFIX, "rb") as offsets_file:
+        assert offsets_file.read() == merge_offsets
+
+
+def test_slice_refuses_a_missing_or_outdated_index(tmp_path):
+    merged = merged_capture(tmp_path)
+    with open(merged, "ab") as capture:
+        capture.write(b"\0" * 16)
+    assert load_time_index(merged) is None
+    with pytest.raises(FileNotFoundError):
+        slice_capture(merged, 0, 2 * 10 ** 18, str(tmp_path / "slice.pcap"))
+
+
+def test_slice_command_reports_captures_that_cant_be_indexed(tmp_path, capsys):
+    # Two pcapng files concatenated, e.g. with cat: several sections
+    with open(merged_capture(tmp_path, raw=True), "rb") as capture:
+        data = capture.read()
+    (tmp_path / "sections.pcapng").write_bytes(data + data)
+
+    args = argparse.Namespace(capture=str(tmp_path / "sections.pcapng"), start="0", end="2000000000", duration=None, output=None)
+    assert pcap_tools.slice_command(args) == 1
+    assert "several pcapng sections" in capsys.readouterr().out
+
+
+def test_slice_command_builds_the_index_and_writes_the_window(tmp_path):
+    write_pcap(str(tmp_path / "capture.pcap"), random_udp_stream(500, start=1_700_000_000.0, rate=100.0))
+    _, packets = read_capture(str(tmp_path / "capture.pcap"))
+
+    args = argparse.Namespace(capture=str(tmp_path / "capture.pcap"), start="1700000001", end=None, duration=2.0,
+                              output=str(tmp_path / "slice.pcap"))
+    assert not pcap_tools.slice_command(args)
+    _, sliced = read_capture(str(tmp_path / "slice.pcap"))
+    assert sliced == [packet for packet in packets if timestamp_ns(1_700_000_001) <= packet[0] <= timestamp_ns(1_700_000_003)]
+
+
+def test_window_bounds_accept_epoch_iso_and_time_of_day():
+    reference_ns = parse_window_time("2024-01-11T14:02:10+00:00")
+    assert reference_ns == 1_704_981_730 * 10 ** 9
+    assert parse_window_time("1704981730.5") == 1_704_981_730_500_000_000
+    assert parse_window_time("2024-01-11T14:02:10Z") == reference_ns
+    local_noon = parse_window_time("2024-01-11T12:00:00")
+    assert parse_window_time("12:00:00", local_noon) == local_noon
+    with pytest.raises(ValueError):
+        parse_window_time("12:00:00")
@@ -1,49 +1,135 @@
-import boto3
+import asyncio
+import configparser
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.resumable_download import DownloadManifest, resumable_download
+
+
+def _session(**kwargs):
+    # boto3 takes longer to import than the rest of the tool, so it's loaded on first use, off the path to the first prompt
+    import boto3
+    return boto3.Session(**kwargs)
 
 
 def read_aws_sso_profiles():
-    # Read AWS CLI configurations including SSO profiles
-    session = boto3.Session()
-    return session.available_profiles
+    """
+    Read the AWS CLI named profiles, SSO profiles included, in the order boto3 lists them.
+
+    The config and credentials files are parsed directly rather than through a boto3 session,
+    which would load botocore just to list them.
+    """
+    profiles = []
+    # Lenient like botocore: duplicate sections or options keep the last value instead of failing
+    config = configparser.RawConfigParser(strict=False)
+    credentials = configparser.RawConfigParser(strict=False)
+    try:
+        config.read(os.path.expanduser(os.environ.get("AWS_CONFIG_FILE", "~/.aws/config")))
+        credentials.read(os.path.expanduser(os.environ.get("AWS_SHARED_CREDENTIALS_FILE", "~/.aws/credentials")))
+    except configparser.Error:
+        # botocore's own parser accepts more than configparser does
+        try:
+            return _session().available_profiles
+        except Exception as e:
+            print(f"Couldn't read the AWS profiles: {e}")
+            return []
+
+    for section in config.sections():
+        if section == "default":
+            profiles.append(section)
+        elif section.startswith("profile "):
+            profiles.append(section[len("profile "):].strip())
+    profiles += [section for section in credentials.sections() if section not in profiles]
+    return profiles
+
+
+ECS_DESCRIBE_TASKS_BATCH_SIZE = 100
+DISCOVERY_MAX_WORKERS = 16
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _describe_ecs_cluster(ecs_client, cluster_arn):
+    """
+    Collect every task of a single ECS cluster with its IP addresses.
+
+    Parameters:
+    - ecs_client: boto3 ECS client of the cluster region.
+    - cluster_arn: ARN of the cluster to describe.
+
+    Returns:
+    A dictionary with the "tasks" list and the "ipAddresses" dict of the cluster.
+    """
+    task_arns = []
+    for page in ecs_client.get_paginator('list_tasks').paginate(cluster=cluster_arn):
+        task_arns.extend(page['taskArns'])
+
+    task_details = {}
+    for batch in _chunks(task_arns, ECS_DESCRIBE_TASKS_BATCH_SIZE):
+        for task in ecs_client.describe_tasks(cluster=cluster_arn, tasks=batch)['tasks']:
+            task_details[task['taskArn']] = task
+
+    task_ip_dict = {}
+    for task_arn in task_arns:
+        task_id = task_arn.split('/')[2]
+        network_interface = (task_details.get(task_arn, {}).get('containers') or [{}])[0].get('networkInterfaces') or [{}]
+        task_ip_dict[task_id] = [
+            network_interface[0].get('privateIpv4Address', 'IPv4 N/A'),
+            network_interface[0].get('privateIpv6Address', 'IPv6 N/A'),
+        ]
+
+    return {
+        "tasks": [task_arn.split('/')[2] for task_arn in task_arns],
+        "ipAddresses": task_ip_dict,
+    }
+
+
+def _list_matching_ecs_clusters(ecs_client, cluster_key_name):
+    cluster_arns = []
+    for page in ecs_client.get_paginator('list_clusters').paginate():
+        cluster_arns.extend(arn for arn in page['clusterArns'] if cluster_key_name.lower() in arn.lower())
+    return cluster_arns
 
 
 def get_ecs_clusters(profile_name, regions, cluster_key_name):
     """
-    Create an ECS client using boto3 in the specified AWS region.
-    
+    Discover the ECS clusters and tasks matching a key name in the given regions.
+
+    Regions are listed concurrently, then every matching cluster is described
+    concurrently. All list calls are paginated and describe_tasks is batched.
+
     Parameters:
     - profile_name: AWS CLI named profile to use for authentication.
-    - region_name: The AWS region in which the ECS client will be created.
+    - regions: List of AWS regions to look for ECS clusters.
     - cluster_key_name: The key name to look for in the ECS clusters name.
-    
+
     Returns:
-    A boto3 ECS client object.
+    A dictionary of {region: {cluster_name: {"tasks": [...], "ipAddresses": {...}}}}.
     """
     clusters = {}
     try:
         # Assuming AWS credentials are configured in the environment or via AWS CLI
-        session = boto3.Session(profile_name=profile_name)
-
-        # Create an ECS client in the specified region
-        for region in regions:
-            ecs_client = session.client('ecs', region_name=region)
-            clusters[region] = {}
-            for cluster in ecs_client.list_clusters()['clusterArns']:
-                if cluster_key_name.lower() in cluster.lower():
-                    clusters[region][cluster.split("/")[1]] = {} 
-                    tasks = ecs_client.list_tasks(cluster=cluster)['taskArns']
-
-                    task_ip_dict = {}
-                    for task_arn in tasks:
-                        task_details = ecs_client.describe_tasks(cluster=cluster, tasks=[task_arn])['tasks'][0]
-                        task_id = task_arn.split('/')[2]
-                        task_ip_dict[task_id] = []
-                        task_ip_dict[task_id].append(task_details.get('containers', [{}])[0].get('networkInterfaces', [{}])[0].get('privateIpv4Address', 'IPv4 N/A'))
-                        task_ip_dict[task_id].append(task_details.get('containers', [{}])[0].get('networkInterfaces', [{}])[0].get('privateIpv6Address', 'IPv6 N/A'))
-
-                    clusters[region][cluster.split("/")[1]]["tasks"] = [task_arn.split('/')[2] for task_arn in tasks]
-                    clusters[region][cluster.split("/")[1]]["ipAddresses"] = task_ip_dict
+        session = _session(profile_name=profile_name)
+
+        # Clients are thread-safe but sessions are not, so create them up front
+        ecs_clients = {region: session.client('ecs', region_name=region) for region in regions}
+
+        with ThreadPoolExecutor(max_workers=DISCOVERY_MAX_WORKERS) as executor:
+            listed = {region: executor.submit(_list_matching_ecs_clusters, ecs_clients[region], cluster_key_name)
+                      for region in regions}
+
+            described = {}
+            for region in regions:
+                clusters[region] = {}
+                for cluster_arn in listed[region].result():
+                    described[(region, cluster_arn)] = executor.submit(_describe_ecs_cluster, ecs_clients[region], cluster_arn)
+
+            for (region, cluster_arn), future in described.items():
+                clusters[region][cluster_arn.split("/")[1]] = future.result()
 
         return clusters
     except Exception as e:
@@ -51,9 +137,38 @@ def get_ecs_clusters(profile_name, regions, cluster_key_name):
         return None
 
 
+EC2_CAPTURABLE_STATES = ['pending', 'running', 'stopping', 'stopped']
+
+
+def _describe_ec2_region(ec2_client, instance_key_name):
+    """
+    List the EC2 instances of one region whose Name tag contains the key name.
+
+    The Name tag and instance state are filtered on the server side and every
+    result page is read.
+    """
+    instances = []
+    filters = [
+        {'Name': 'tag:Name', 'Values': [f"*{instance_key_name}*"]},
+        {'Name': 'instance-state-name', 'Values': EC2_CAPTURABLE_STATES},
+    ]
+    for page in ec2_client.get_paginator('describe_instances').paginate(Filters=filters):
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                for tag in instance.get('Tags', []):
+                    if tag['Key'] == 'Name' and instance_key_name in tag['Value']:
+                        instances.append({
+                            'InstanceId': instance['InstanceId'],
+                            'InstanceName': tag['Value'],
+                            'State': instance['State']['Name'],
+                            'PrivateIpAddress': instance.get('PrivateIpAddress', 'N/A'),
+                        })
+    return instances
+
+
 def get_ec2_instances(profile_name, regions, instance_key_name):
     """
-    Get EC2 instances information using boto3.
+    Get EC2 instances information using boto3, querying all regions concurrently.
 
     Parameters:
     - profile_name: AWS CLI named profile to use for authentication.
@@ -67,27 +182,16 @@ def get_ec2_instances(profile_name, regions, instance_key_name):
 
     try:
         # Create a session using the specified AWS CLI profile
-        session = boto3.Session(profile_name=profile_name)
-
-        for region in regions:
-            # Create an EC2 client in the specified region
-            ec2_client = session.client('ec2', region_name=region)
-            instances_info[region] = []
-
-            # Describe EC2 instances
-            response = ec2_client.describe_instances()
-            
-            for reservation in response['Reservations']:
-                for instance in reservation['Instances']:
-                    for tag in instance['Tags']:
-                        if tag['Key'] == 'Name' and instance_key_name in tag['Value']:
-                            instance_info = {
-                                'InstanceId': instance['InstanceId'],
-                                'InstanceName': tag['Value'],
-                                'State': instance['State']['Name'],
-                                'PrivateIpAddress': instance.get('PrivateIpAddress', 'N/A'),
-                            }
-                            instances_info[region].append(instance_info)
+        session = _session(profile_name=profile_name)
+
+        # One client per region, created before the fan-out since sessions are not thread-safe
+        ec2_clients = {region: session.client('ec2', region_name=region) for region in regions}
+
+        with ThreadPoolExecutor(max_workers=min(DISCOVERY_MAX_WORKERS, max(len(regions), 1))) as executor:
+            futures = {region: executor.submit(_describe_ec2_region, ec2_clients[region], instance_key_name)
+                       for region in regions}
+            for region in regions:
+                instances_info[region] = futures[region].result()
 
         return instances_info
     except Exception as e:
@@ -95,9 +199,125 @@ def get_ec2_instances(profile_name, regions, instance_key_name):
         return None
 
 
-def get_pcap_from_s3(profile_name, bucket_name, prefix, region_name, local_folder="./"):
+SSM_SEND_COMMAND_BATCH_SIZE = 50
+SSM_TERMINAL_STATUSES = {'Success', 'Failed', 'Cancelled', 'TimedOut', 'Terminated',
+                         'DeliveryTimedOut', 'ExecutionTimedOut', 'Undeliverable', 'InvalidPlatform', 'AccessDenied'}
+
+# Shell snippet setting INSTANCE_ID on the target itself, so one command text fits a whole batch (works with IMDSv1 and IMDSv2)
+EC2_INSTANCE_ID_SHELL = ('TOKEN=$(curl -s -X PUT http://169.254.169.254/latest/api/token -H "X-aws-ec2-metadata-token-ttl-seconds: 60"); '
+                         'INSTANCE_ID=$(curl -s -H "X-aws-ec2-metadata-token: $TOKEN" http://169.254.169.254/latest/meta-data/instance-id)')
+
+
+def send_ssm_commands(profile_name, targets, commands, comment="ECXCapture", execution_timeout=None):
+    """
+    Send one AWS-RunShellScript command to many EC2 instances, in batches of up to 50 instances.
+
+    Parameters:
+    - profile_name: AWS CLI named profile to use for authentication.
+    - targets: A dictionary of {region: [instance_id, ...]}.
+    - commands: List of shell commands, run as one script on every instance.
+    - comment: Comment attached to the SSM command.
+    - execution_timeout: Seconds the script may run on an instance, the AWS-RunShellScript default (3600) when None.
+
+    Returns:
+    A dictionary of {region: [(command_id, [instance_id, ...]), ...]} for the batches that were sent.
+    """
+    session = _session(profile_name=profile_name)
+    sent = {}
+    parameters = {'commands': commands}
+    if execution_timeout:
+        parameters['executionTimeout'] = [str(int(execution_timeout))]
+
+    for region, instance_ids in targets.items():
+        ssm_client = session.client('ssm', region_name=region)
+        sent[region] = []
+        for batch in _chunks(list(instance_ids), SSM_SEND_COMMAND_BATCH_SIZE):
+            try:
+                response = ssm_client.send_command(
+                    InstanceIds=batch,
+                    DocumentName='AWS-RunShellScript',
+                    Parameters=parameters,
+                    Comment=comment,
+                )
+                sent[region].append((response['Command']['CommandId'], batch))
+            except Exception as e:
+                print(f"Error sending SSM command to {batch} in {region}: {e}")
+
+    return sent
+
+
+async def poll_ssm_commands(profile_name, sent, timeout, poll_interval=2):
+    """
+    Wait for SSM commands to finish, yielding every instance as soon as its invocation ends.
+
+    A single poller lists the invocations of every pending command with
+    list_command_invocations, instead of waiting on one process per instance.
+
+    Parameters:
+    - profile_name: AWS CLI named profile to use for authentication.
+    - sent: The result of send_ssm_commands.
+    - timeout: Seconds after which instances still running are reported as "TimedOut". SSM ends the
+      invocations itself after their execution timeout, so this should be longer than that.
+    - poll_interval: Seconds between two polls.
+
+    Yields:
+    Tuples (instance_id, status, status_details).
     """
-    Create an S3 client using boto3 in the specified AWS region.
+    session = _session(profile_name=profile_name)
+    ssm_clients = {region: session.client('ssm', region_name=region) for region in sent}
+    pending = {(region, command_id): set(instance_ids) for region, batches in sent.items() for command_id, instance_ids in batches}
+    deadline = asyncio.get_running_loop().time() + timeout
+
+    def list_invocations(region, command_id):
+        paginator = ssm_clients[region].get_paginator('list_command_invocations')
+        return [invocation for page in paginator.paginate(CommandId=command_id) for invocation in page['CommandInvocations']]
+
+    while pending:
+        keys = list(pending)
+        results = await asyncio.gather(*(asyncio.to_thread(list_invocations, *key) for key in keys), return_exceptions=True)
+
+        for key, invocations in zip(keys, results):
+            if isinstance(invocations, Exception):
+                print(f"Error polling SSM command {key[1]}: {invocations}")
+                continue
+            for invocation in invocations:
+                instance_id = invocation['InstanceId']
+                if instance_id in pending[key] and invocation['Status'] in SSM_TERMINAL_STATUSES:
+                    pending[key].discard(instance_id)
+                    yield instance_id, invocation['Status'], invocation.get('StatusDetails', '')
+            if not pending[key]:
+                del pending[key]
+
+        if not pending:
+            break
+
+        if asyncio.get_running_loop().time() >= deadline:
+            for instance_ids in pending.values():
+                for instance_id in instance_ids:
+                    yield instance_id, 'TimedOut', f"No result after {timeout}s"
+            break
+
+        await asyncio.sleep(poll_interval)
+
+
+def _fetch_pcap(s3_client, bucket_name, prefix, local_folder, manifest, transfer_config=None):
+    os.makedirs(local_folder, exist_ok=True)
+    local_path = os.path.join(local_folder, prefix)
+    from boto3.s3.transfer import TransferConfig
+    transfer_config = transfer_config or TransferConfig()
+    local_path, fetched = resumable_download(s3_client, bucket_name, prefix, local_path, manifest,
+                                             chunksize=transfer_config.multipart_chunksize,
+                                             max_concurrency=transfer_config.max_request_concurrency)
+    if fetched:
+        print(f"Downloaded {prefix} to {local_path}")
+    else:
+        print(f"{prefix} is already downloaded to {local_path}")
+    return local_path, fetched
+
+
+def get_pcap_from_s3(profile_name, bucket_name, prefix, region_name, local_folder="./", s3_client=None, transfer_config=None):
+    """
+    Download a pcap file from the S3 bucket, resuming a previous partial download when possible.
     
     Parameters:
     - profile_name: AWS CLI named profile to use for authentication.
@@ -105,23 +325,177 @@ def get_pcap_from_s3(profile_name, bucket_name, prefix, region_name, local_folde
     - prefix: The name of the pcap file to upload.
     - local_folder: The local folder where the pcap will be downloaded.
     - region_name: The AWS region in which the S3 client will be created.
+    - s3_client: An existing S3 client to reuse, a new one is created when missing.
+    - transfer_config: boto3 TransferConfig giving the part size and per-file concurrency.
     
     Returns:
-    A boto3 S3 client object.
+    The local path of the downloaded pcap, or None on failure.
     """
     try:
-        os.makedirs(local_folder, exist_ok=True)
-        # Assuming AWS credentials are configured in the environment or via AWS CLI
-        session = boto3.Session(profile_name=profile_name, region_name=region_name)
+        if s3_client is None:
+            # Assuming AWS credentials are configured in the environment or via AWS CLI
+            session = _session(profile_name=profile_name, region_name=region_name)
 
-        # Create an S3 client in the specified region
-        s3_client = session.client('s3')
-        local_path = os.path.join(local_folder, prefix)
-        s3_client.download_file(bucket_name, prefix, local_path)
-        
-        print(f"Downloaded {prefix} to {local_path}")
+            # Create an S3 client in the specified region
+            s3_client = session.client('s3')
+        local_path, _ = _fetch_pcap(s3_client, bucket_name, prefix, local_folder, DownloadManifest(local_folder), transfer_config)
+        return local_path
 
     except Exception as e:
         print(f"Error listing/Downloading objects in bucket {bucket_name}: {e}")
         print("Check if the machine has permissions to access to the S3 bucket!!")
-        return None
\ No newline at end of file
+        return None
+
+
+DEFAULT_DOWNLOAD_MAX_FILES = 8
+DEFAULT_DOWNLOAD_MAX_CONCURRENCY_PER_FILE = 8
+DEFAULT_DOWNLOAD_CHUNKSIZE_MB = 16
+DEFAULT_DOWNLOAD_RETRIES = 3
+# Failed downloads keep being retried for this long after `retries`, so a short network outage doesn't lose the file
+DEFAULT_DOWNLOAD_RETRY_SECONDS = 300
+MAX_DOWNLOAD_BACKOFF = 30
+# S3 errors that no retry will fix
+PERMANENT_S3_ERRORS = {'404', 'NoSuchKey', 'NoSuchBucket', '403', 'AccessDenied'}
+
+
+class S3DownloadManager:
+    """
+    Download many pcaps from one S3 bucket at once over a single pooled client.
+
+    Parameters:
+    - profile_name: AWS CLI named profile to use for authentication.
+    - bucket_name: The name of the S3 bucket holding the pcaps.
+    - region_name: The AWS region of the bucket.
+    - local_folder: The local folder where the pcaps will be downloaded.
+    - download_config: The "downloads" section of the config file.
+    """
+
+    def __init__(self, profile_name, bucket_name, region_name, local_folder, download_config=None):
+        download_config = download_config or {}
+        max_files = download_config.get("maxConcurrentFiles", DEFAULT_DOWNLOAD_MAX_FILES)
+        per_file = download_config.get("maxConcurrencyPerFile", DEFAULT_DOWNLOAD_MAX_CONCURRENCY_PER_FILE)
+        chunksize = download_config.get("multipartChunksizeMB", DEFAULT_DOWNLOAD_CHUNKSIZE_MB) * 1024 * 1024
+
+        self.profile_name = profile_name
+        self.bucket_name = bucket_name
+        self.region_name = region_name
+        self.local_folder = local_folder
+        self.retries = download_config.get("retries", DEFAULT_DOWNLOAD_RETRIES)
+        self.retry_seconds = download_config.get("retrySeconds", DEFAULT_DOWNLOAD_RETRY_SECONDS)
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config as BotoConfig
+        self.transfer_config = TransferConfig(multipart_threshold=chunksize, multipart_chunksize=chunksize,
+                                              max_concurrency=per_file, use_threads=True)
+
+        session = _session(profile_name=profile_name, region_name=region_name)
+        # Enough pooled connections for every part of every file in flight
+        self.s3_client = session.client('s3', config=BotoConfig(max_pool_connections=max_files * per_file))
+        self._executor = ThreadPoolExecutor(max_workers=max_files, thread_name_prefix="s3-download")
+        self._lock = threading.Lock()
+        self._started_at = None
+        self._finished_at = None
+        self.bytes_downloaded = 0
+        self.files_downloaded = 0
+        self.files_skipped = 0
+        self.failed = []
+        # {key: {"seconds", "bytes", "attempts", "ok"}} of every finished download
+        self.files = {}
+        self.manifest = DownloadManifest(local_folder)
+
+    def _download(self, key):
+        local_path, fetched = None, 0
+        start = time.monotonic()
+        # Where the file comes from, so `pcap_tools.py download` can finish it in a later run
+        self.manifest.update(key, bucket=self.bucket_name, region=self.region_name, profile=self.profile_name)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                local_path, fetched = _fetch_pcap(self.s3_client, self.bucket_name, key, self.local_folder,
+                                                  self.manifest, self.transfer_config)
+                break
+            except Exception as e:
+                # Every retry resumes from the bytes already on disk
+                print(f"Error downloading {key} from bucket {self.bucket_name} (attempt {attempt}): {e}")
+                if getattr(e, 'response', {}).get('Error', {}).get('Code') in PERMANENT_S3_ERRORS:
+                    break
+                if attempt > self.retries and time.monotonic() - start >= self.retry_seconds:
+                    break
+                time.sleep(min(2 ** (attempt - 1), MAX_DOWNLOAD_BACKOFF))
+
+        with self._lock:
+            self._finished_at = time.monotonic()
+            self.files[key] = {"seconds": self._finished_at - start, "bytes": fetched, "attempts": attempt, "ok": local_path is not None}
+            if local_path:
+                self.bytes_downloaded += fetched
+                self.files_downloaded += 1
+                if not fetched:
+                    self.files_skipped += 1
+            else:
+                self.failed.append(key)
+        return local_path
+
+    def submit(self, key):
+        """Queue the download of one object, returning a Future of its local path (None on failure)."""
+        with self._lock:
+            if self._started_at is None:
+                self._started_at = time.monotonic()
+        return self._executor.submit(self._download, key)
+
+    @property
+    def elapsed(self):
+        if self._started_at is None or self._finished_at is None:
+            return 0.0
+        return self._finished_at - self._started_at
+
+    @property
+    def throughput(self):
+        """Aggregate throughput in bytes per second."""
+        return self.bytes_downloaded / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        summary = (f"Downloaded {self.files_downloaded} files, {self.bytes_downloaded / 1024 / 1024:.1f} MB "
+                   f"in {self.elapsed:.1f}s ({self.throughput / 1024 / 1024:.1f} MB/s)")
+        if self.files_skipped:
+            summary += f", {self.files_skipped} already on disk"
+        if self.failed:
+            summary += f", {len(self.failed)} failed"
+        return summary
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def resume_downloads(local_folder, profile_name=None, download_config=None):
+    """
+    Finish the downloads of a capture folder that a previous run left incomplete (e.g. after a network outage).
+
+    The bucket, region and profile of every file come from the download manifest of the folder,
+    and each file resumes from the bytes already on disk.
+
+    Parameters:
+    - local_folder: The capture folder holding the .ecx_manifest.json.
+    - profile_name: AWS CLI named profile to use instead of the one recorded in the manifest.
+    - download_config: The "downloads" section of the config file.
+
+    Returns:
+    A list of the S3DownloadManager used, one per bucket, empty when nothing was left to download.
+    """
+    pending = {}
+    for key, entry in DownloadManifest(local_folder).entries.items():
+        if not entry.get("complete") and entry.get("bucket"):
+            pending.setdefault((profile_name or entry.get("profile"), entry["bucket"], entry.get("region")), []).append(key)
+
+    downloaders = []
+    for (profile, bucket_name, region_name), keys in pending.items():
+        with S3DownloadManager(profile, bucket_name, region_name, local_folder, download_config) as downloader:
+            for future in [downloader.submit(key) for key in keys]:
+                future.result()
+        downloaders.append(downloader)
+    return downloaders
\ No newline at end of file
@@ -0,0 +1,166 @@
+import json
+import os
+import struct
+import time
+from array import array
+from utils.packets import is_sip, parse_sip, parse_transport
+from utils.pcap_merge import PCAPNG_IDB, PcapReader
+
+
+CALL_INDEX_SUFFIX = ".calls.json"
+CALL_OFFSETS_SUFFIX = ".calls.bin"
+
+
+class CallIndexer:
+    """
+    Build a SIP Call-ID index of a capture while it is written.
+
+    Every SIP message is attached to its Call-ID, and the RTP/RTCP endpoints
+    negotiated in its SDP are remembered so later UDP packets to or from those
+    endpoints are attached to the same call. The index maps each call to the
+    file offsets of its packets, so one call can be extracted without a rescan.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self._media = {}
+
+    def _call(self, call_id):
+        call = self.calls.get(call_id)
+        if call is None:
+            call = self.calls[call_id] = {"offsets": array('Q'), "sip": 0, "media": set()}
+        return call
+
+    def add(self, offset, data, linktype):
+        transport = parse_transport(data, linktype)
+        if transport is None:
+            return
+        protocol, src_ip, src_port, dst_ip, dst_port, payload = transport
+
+        if is_sip(payload):
+            sip = parse_sip(payload)
+            if sip:
+                call = self._call(sip["call_id"])
+                call["offsets"].append(offset)
+                call["sip"] += 1
+                for endpoint in sip["media"]:
+                    call["media"].add(endpoint)
+                    self._media[endpoint] = sip["call_id"]
+                return
+
+        if protocol == "udp" and self._media:
+            call_id = self._media.get((dst_ip, dst_port)) or self._media.get((src_ip, src_port))
+            if call_id:
+                self.calls[call_id]["offsets"].append(offset)
+
+    def save(self, capture_file, file_format, interface_block_offsets=()):
+        """Write the index next to the capture: <capture>.calls.json and <capture>.calls.bin."""
+        calls = {}
+        position = 0
+        with open(capture_file + CALL_OFFSETS_SUFFIX, 'wb') as offsets_file:
+            for call_id, call in self.calls.items():
+                call["offsets"].tofile(offsets_file)
+                calls[call_id] = {
+                    "start": position,
+                    "count": len(call["offsets"]),
+                    "sipPackets": call["sip"],
+                    "media": sorted([ip, port] for ip, port in call["media"]),
+                }
+                position += len(call["offsets"])
+
+        with open(capture_file + CALL_INDEX_SUFFIX, 'w') as index_file:
+            json.dump({
+                "format": file_format,
+                "captureSize": os.path.getsize(capture_file),
+                "interfaceBlockOffsets": list(interface_block_offsets),
+                "calls": calls,
+            }, index_file)
+
+
+def build_call_index(capture_file):
+    """
+    Index an existing capture (e.g. merged with mergecap) in a separate pass.
+
+    Returns:
+    The number of calls indexed.
+    """
+    indexer = CallIndexer()
+    with PcapReader(capture_file) as reader:
+        interface_block_offsets = []
+        if reader.format == "pcapng":
+            interface_block_offsets = [offset for block_type, offset, _, _ in reader._iter_blocks() if block_type == PCAPNG_IDB]
+        for _, _, _, _, _, data, link_id, record_offset in reader:
+            indexer.add(record_offset, data, reader.linktypes[link_id])
+        indexer.save(capture_file, reader.format, interface_block_offsets)
+    return len(indexer.calls)
+
+
+def load_call_index(capture_file):
+    """Return the call index of a capture, or None when it is missing or outdated."""
+    try:
+        with open(capture_file + CALL_INDEX_SUFFIX, 'r') as index_file:
+            index = json.load(index_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if index.get("captureSize") != os.path.getsize(capture_file):
+        return None
+    return index
+
+
+def _block_reader(capture, file_format):
+    # Returns a function reading the whole record/block at an offset
+    header = capture.read(24)
+    if file_format == "pcap":
+        endian = "<" if struct.unpack("<I", header[:4])[0] in (0xA1B2C3D4, 0xA1B23C4D) else ">"
+
+        def read_record(offset):
+            capture.seek(offset)
+            record_header = capture.read(16)
+            caplen = struct.unpack(endian + "I", record_header[8:12])[0]
+            return record_header + capture.read(caplen)
+        return header, read_record
+
+    endian = "<" if struct.unpack("<I", header[8:12])[0] == 0x1A2B3C4D else ">"
+
+    def read_block(offset):
+        capture.seek(offset)
+        block_header = capture.read(8)
+        length = struct.unpack(endian + "I", block_header[4:8])[0]
+        return block_header + capture.read(length - 8)
+    return read_block(0), read_block
+
+
+def extract_call(capture_file, call_id, output_file):
+    """
+    Write every indexed packet of one call (SIP signalling and RTP/RTCP media) into a small capture.
+
+    Parameters:
+    - capture_file: Merged capture with a call index next to it.
+    - call_id: SIP Call-ID of the call to extract.
+    - output_file: Path of the capture to write.
+
+    Returns:
+    A dictionary with the number of packets written and seconds it took.
+    """
+    start = time.monotonic()
+    index = load_call_index(capture_file)
+    if index is None:
+        raise FileNotFoundError(f"No up-to-date call index for {capture_file}")
+    call = index["calls"].get(call_id)
+    if call is None:
+        raise KeyError(f"Call-ID {call_id} not found in {capture_file}")
+
+    offsets = array('Q')
+    with open(capture_file + CALL_OFFSETS_SUFFIX, 'rb') as offsets_file:
+        offsets_file.seek(call["start"] * offsets.itemsize)
+        offsets.fromfile(offsets_file, call["count"])
+
+    with open(capture_file, 'rb') as capture, open(output_file, 'wb') as output:
+        file_header, read_record = _block_reader(capture, index["format"])
+        output.write(file_header)
+        for interface_offset in index["interfaceBlockOffsets"]:
+            output.write(read_record(interface_offset))
+        for offset in offsets:
+            output.write(read_record(offset))
+
+    return {"packets": len(offsets), "seconds": time.monotonic() - start}
@@ -0,0 +1,314 @@
+import asyncio
+import os
+import time
+from utils.aws_services import EC2_INSTANCE_ID_SHELL, S3DownloadManager, poll_ssm_commands, send_ssm_commands
+from utils.capture_report import CaptureReport
+from utils.command_runner import report_failures
+from utils.common import ecs_command_args
+from utils.compression import resolve_compression
+from utils.exec_session import EXEC_SESSION_SHELL, ExecSessionRunner
+from utils.live_stream import LIVE_ENCODE_COMMAND
+from utils.segment_collector import SegmentCollector
+
+
+# Seconds a target may take to upload its pcaps, the default execution timeout of AWS-RunShellScript
+DEFAULT_UPLOAD_TIMEOUT = 3600
+# Extra seconds the SSM polling waits for invocations to report that they timed out on the instance
+SSM_POLL_GRACE = 120
+PCAP_SCRIPT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pcapScript")
+
+# Commands, {leg}/{snaplen}/{capture_filter} come from the service capture profile
+TCP_DUMP_ECS_COMMAND = "tcpdump -i any -U -s{snaplen} -w ./pcapScript/tcpdump_{task_id}{leg}.pcap '{capture_filter}'"
+PCAP_ECS_PATH = "./pcapScript/tcpdump_{task_id}{leg}.pcap"
+MV_PCAP_TO_S3_ECS_COMMAND = "env {upload_env} /root/.nvm/versions/node/v16.19.0/bin/node ./pcapScript/savePcap.js ./pcapScript/tcpdump_{task_id}{leg}.pcap{extension} {bucket_name}"
+TCP_DUMP_EC2_COMMAND = "sudo tcpdump -i any -U -s{snaplen} -w /home/ec2-user/tcpdump_{instance_id}{leg}.pcap '{capture_filter}'"
+STOP_TCP_DUMP_EC2_COMMAND = "sudo pkill tcpdump && sleep 1"
+PCAP_EC2_PATH = "/home/ec2-user/tcpdump_{instance_id}{leg}.pcap"
+MV_PCAP_TO_S3_EC2_COMMAND = "sudo aws s3 cp /home/ec2-user/tcpdump_{instance_id}{leg}.pcap{extension} s3://{bucket_name}/tcpdump_{instance_id}{leg}.pcap{extension}"
+# EC2 instances can upload with savePcap.js too (uploads.ec2Uploader "node"), it needs node and a global aws-sdk on the instance
+PCAP_UPLOAD_SCRIPT_PATH = os.path.join(PCAP_SCRIPT_DIR, "savePcap.js")
+INSTALL_PCAP_UPLOADER_EC2_COMMAND = "cat > /home/ec2-user/savePcap.js <<'ECX_EOF'\n{script}\nECX_EOF"
+MV_PCAP_TO_S3_EC2_NODE_COMMAND = "sudo env {upload_env} {node_env} $(command -v node) /home/ec2-user/savePcap.js /home/ec2-user/tcpdump_{instance_id}{leg}.pcap{extension} {bucket_name}"
+# Rotating capture: tcpdump hands every finished segment to uploadSegment.sh, the last one is uploaded at stop
+SEGMENT_UPLOAD_SCRIPT_PATH = os.path.join(PCAP_SCRIPT_DIR, "uploadSegment.sh")
+TCP_DUMP_ECS_ROTATING_COMMAND = "env ECX_BUCKET={bucket_name} ECX_COMPRESS={codec} ECX_LEVEL={level} {upload_env} tcpdump -i any -U -s{snaplen} -C {file_size} -W {file_count} -Z root -z ./pcapScript/uploadSegment.sh -w ./pcapScript/tcpdump_{task_id}_{capture_id}{leg}.pcap '{capture_filter}'"
+INSTALL_SEGMENT_UPLOADER_ECS_COMMAND = "mkdir -p ./pcapScript && cat > ./pcapScript/uploadSegment.sh <<'ECX_EOF'\n{script}\nECX_EOF\nchmod +x ./pcapScript/uploadSegment.sh"
+MV_SEGMENTS_TO_S3_ECS_COMMAND = "sh -c 'for f in ./pcapScript/tcpdump_{task_id}_{capture_id}*.pcap[0-9]*; do ECX_BUCKET={bucket_name} ECX_COMPRESS={codec} ECX_LEVEL={level} {upload_env} ./pcapScript/uploadSegment.sh $f; done'"
+INSTALL_SEGMENT_UPLOADER_EC2_COMMAND = "cat > /home/ec2-user/uploadSegment.sh <<'ECX_EOF'\n{script}\nECX_EOF\nchmod +x /home/ec2-user/uploadSegment.sh"
+TCP_DUMP_EC2_ROTATING_COMMAND = "sudo env ECX_BUCKET={bucket_name} ECX_UPLOADER={uploader} ECX_COMPRESS={codec} ECX_LEVEL={level} {upload_env} {node_env} tcpdump -i any -U -s{snaplen} -C {file_size} -W {file_count} -Z root -z /home/ec2-user/uploadSegment.sh -w /home/ec2-user/tcpdump_{instance_id}_{capture_id}{leg}.pcap '{capture_filter}'"
+TCP_DUMP_EC2_STOP_AND_MV_SEGMENTS_COMMAND = 'sudo pkill tcpdump; sleep 1; for f in /home/ec2-user/tcpdump_{instance_id}_{capture_id}*.pcap[0-9]*; do sudo env ECX_BUCKET={bucket_name} ECX_UPLOADER={uploader} ECX_COMPRESS={codec} ECX_LEVEL={level} {upload_env} {node_env} /home/ec2-user/uploadSegment.sh "$f"; done'
+# Live capture: tcpdump writes to the session instead of a file, see utils/live_stream.py
+TCP_DUMP_ECS_LIVE_COMMAND = "sh -c \"tcpdump -i any -U -s{snaplen} -w - '{capture_filter}' 2>/dev/null | %s\"" % LIVE_ENCODE_COMMAND
+TCP_DUMP_EC2_LIVE_COMMAND = "sudo tcpdump -i any -U -s{snaplen} -w - '{capture_filter}' 2>/dev/null | %s" % LIVE_ENCODE_COMMAND
+
+
+def leg_commands(template, legs, **fields):
+    # One command per capture leg of the service profile
+    return [template.format(leg=leg["suffix"], snaplen=leg["snaplen"], capture_filter=leg["filter"], **fields) for leg in legs]
+
+
+def side_by_side(commands, in_shell=False):
+    # Run the tcpdump of every capture leg in the same session
+    joined = commands[0] if len(commands) == 1 else " & ".join(commands) + "; wait"
+    return f'sh -c "{joined}"' if in_shell else joined
+
+
+def one_after_another(commands, in_shell=False):
+    joined = " && ".join(commands)
+    return f'sh -c "{joined}"' if in_shell and len(commands) > 1 else joined
+
+
+def compress_commands(pcap_path, legs, compression, sudo=False, **fields):
+    # Compress the pcap of every capture leg in place before it is moved to S3
+    if not compression:
+        return []
+    return leg_commands(("sudo " if sudo else "") + compression["command"].replace("{path}", pcap_path), legs, **fields)
+
+
+def ecs_capture_targets(ecs_clusters):
+    # {task_id: (region, cluster_name)} of the clusters found by get_ecs_clusters
+    return {task_id: (region, cluster_name)
+            for region, clusters in ecs_clusters.items()
+            for cluster_name, cluster_info in clusters.items()
+            for task_id in cluster_info.get("tasks", [])}
+
+
+def ec2_capture_targets(ec2_instances):
+    # {region: [instance_id, ...]} of the instances found by get_ec2_instances
+    return {region: [instance.get("InstanceId") for instance in instances] for region, instances in ec2_instances.items()}
+
+
+def capture_settings(config_data):
+    """
+    Gather the settings shared by every capture from the config file.
+
+    Parameters:
+    - config_data: The whole config file.
+
+    Returns:
+    A dictionary with "rotation", "compression", the "upload_fields" of the upload commands
+    and downloaded file names and the "upload_timeout", plus the "execution" and "downloads" sections.
+    Raises ValueError for an unknown compression codec.
+    """
+    capture_config = config_data.get("capture", {})
+    compression = resolve_compression(capture_config)
+    # The same fields whether compression is enabled or not
+    upload_fields = {"extension": compression["extension"], "codec": compression["codec"], "level": compression["level"]} if compression \
+        else {"extension": "", "codec": "", "level": ""}
+    uploads = config_data.get("uploads", {})
+    upload_fields["upload_env"] = (f"ECX_PART_SIZE_MB={uploads.get('partSizeMB', 16)} ECX_UPLOAD_PARALLELISM={uploads.get('parallelism', 4)} "
+                                   f"ECX_UPLOAD_RETRIES={uploads.get('retries', 3)}")
+    upload_fields["uploader"] = uploads.get("ec2Uploader", "aws")
+    upload_fields["node_env"] = "ECX_NODE=$(command -v node) NODE_PATH=$(npm root -g)" if upload_fields["uploader"] == "node" else ""
+    return {
+        "rotation": capture_config.get("rotation", {}),
+        "compression": compression,
+        "upload_fields": upload_fields,
+        "upload_timeout": uploads.get("timeoutSeconds", DEFAULT_UPLOAD_TIMEOUT),
+        "execution": config_data.get("execution"),
+        "downloads": config_data.get("downloads"),
+    }
+
+
+class ServiceCapture:
+    """
+    tcpdump capture of one service across its targets, split in phases so several
+    captures can be driven side by side: prepare, start, stop and collect.
+
+    Parameters:
+    - profile: AWS SSO profile.
+    - targets: The targets of the service, their shape depends on the subclass.
+    - legs: Capture legs of the service profile (see resolve_capture_profile).
+    - settings: Settings from capture_settings.
+    - bucket: The bucket config of the environment, {"name": ..., "region": ...}.
+    - pcaps_folder: Local folder the pcaps are downloaded to.
+    - capture_id: Id of the capture, part of the rotated segment names.
+    - name: Name of the capture in the report, e.g. "PCSCF@prod".
+    - report: CaptureReport recording the timings of every phase and target.
+    """
+
+    def __init__(self, profile, targets, legs, settings, bucket, pcaps_folder, capture_id, name=None, report=None):
+        self.profile = profile
+        self.targets = targets
+        self.legs = legs
+        self.settings = settings
+        self.rotation = settings["rotation"]
+        self.upload_fields = settings["upload_fields"]
+        self.bucket_name = bucket.get("name")
+        self.bucket_region = bucket.get("region")
+        self.pcaps_folder = pcaps_folder
+        self.capture_id = capture_id
+        self.name = name
+        self.report = report or CaptureReport(name)
+        self.downloader = None
+        self.segment_collector = None
+        self._downloads = []
+
+    def _open_downloader(self):
+        self.downloader = S3DownloadManager(self.profile, self.bucket_name, self.bucket_region, self.pcaps_folder, self.settings["downloads"])
+
+    def _collect_segments(self, started_targets):
+        # Download finished segments while the capture is running
+        if self.rotation.get("enabled"):
+            self.segment_collector = SegmentCollector(self.downloader, started_targets, self.capture_id, self.rotation.get("pollSeconds", 15))
+            self.segment_collector.start()
+
+    def _download(self, target):
+        if not self.segment_collector:
+            for leg in self.legs:
+                self._downloads.append(asyncio.wrap_future(self.downloader.submit(
+                    f"tcpdump_{target}{leg['suffix']}.pcap{self.upload_fields['extension']}")))
+
+    async def _finish_downloads(self):
+        with self.report.phase("download", self.name) as phase:
+            await asyncio.gather(*self._downloads)
+            if self.segment_collector:
+                await self.segment_collector.finish()
+            phase["bytes"] = self.downloader.bytes_downloaded
+        for key, download in self.downloader.files.items():
+            self.report.target("download", key, download["seconds"], self.name, download["ok"], download["attempts"], download["bytes"])
+
+    async def close(self):
+        if self.downloader:
+            self.downloader.close()
+
+
+class EcsCapture(ServiceCapture):
+    """
+    Capture of an ECS service, `targets` being {task_id: (region, cluster_name)}.
+
+    Each task gets one execute-command session for the whole capture: tcpdump is
+    started in its background, stopped with SIGINT and the pcap uploaded through it.
+    """
+
+    async def prepare(self):
+        """Open a session on every task, returning how many are ready."""
+        self._open_downloader()
+        self.sessions = ExecSessionRunner.from_config(self.settings["execution"])
+        with self.report.phase("open session", self.name, targets=len(self.targets)):
+            session_results = await self.sessions.open_all({
+                task_id: ecs_command_args(region, self.profile, cluster_name, task_id, EXEC_SESSION_SHELL)
+                for task_id, (region, cluster_name) in self.targets.items()
+            })
+        self.report.command_results("open session", session_results, self.name)
+        return len(report_failures(session_results, "open session"))
+
+    async def _install_segment_uploader(self, task_ids):
+        # tcpdump hands the rotated segments to uploadSegment.sh, pushed through the session like on EC2
+        with open(SEGMENT_UPLOAD_SCRIPT_PATH, 'r') as script_file:
+            command = INSTALL_SEGMENT_UPLOADER_ECS_COMMAND.format(script=script_file.read().strip())
+        results = await asyncio.gather(*(self.sessions.run_on(task_id, command) for task_id in task_ids))
+        return report_failures(dict(zip(task_ids, results)), "install the segment uploader")
+
+    async def start(self):
+        """Start tcpdump on every ready task at once, returning the started task ids."""
+        tcpdump_template = TCP_DUMP_ECS_ROTATING_COMMAND if self.rotation.get("enabled") else TCP_DUMP_ECS_COMMAND
+        with self.report.phase("start", self.name, targets=len(self.sessions.sessions)):
+            task_ids = list(self.sessions.sessions)
+            if self.rotation.get("enabled"):
+                task_ids = await self._install_segment_uploader(task_ids)
+            start_results = await self.sessions.start_all({
+                task_id: leg_commands(tcpdump_template, self.legs, task_id=task_id, bucket_name=self.bucket_name, capture_id=self.capture_id,
+                                      file_size=self.rotation.get("fileSizeMB", 100), file_count=self.rotation.get("fileCount", 10),
+                                      **self.upload_fields)
+                for task_id in task_ids
+            })
+        self.report.command_results("start", start_results, self.name)
+        self.running_tasks = report_failures(start_results, "start tcpdump")
+        if self.running_tasks:
+            self.sessions.keep_alive()
+            self._collect_segments(self.running_tasks)
+        return self.running_tasks
+
+    async def stop(self):
+        # SIGINT tcpdump itself and wait for it to flush its pcap
+        with self.report.phase("stop", self.name, targets=len(self.running_tasks)):
+            stop_results = await self.sessions.interrupt_all(self.running_tasks)
+        self.report.command_results("stop", stop_results, self.name)
+        report_failures(stop_results, "stop tcpdump")
+
+    def _upload_command(self, task_id):
+        if self.segment_collector:
+            return MV_SEGMENTS_TO_S3_ECS_COMMAND.format(task_id=task_id, bucket_name=self.bucket_name, capture_id=self.capture_id,
+                                                        **self.upload_fields)
+        return one_after_another(compress_commands(PCAP_ECS_PATH, self.legs, self.settings["compression"], task_id=task_id) + leg_commands(
+            MV_PCAP_TO_S3_ECS_COMMAND, self.legs, task_id=task_id, bucket_name=self.bucket_name, **self.upload_fields))
+
+    async def collect(self):
+        """Move the pcap files to S3 from all tasks at once, downloading each one as soon as its upload is done."""
+        with self.report.phase("upload", self.name, targets=len(self.running_tasks)):
+            # A multi-GB pcap can take longer than any other command, it gets the upload timeout
+            uploads = [self.sessions.run_on(task_id, self._upload_command(task_id), self.settings["upload_timeout"]) for task_id in self.running_tasks]
+            for upload in asyncio.as_completed(uploads):
+                result = await upload
+                self.report.command_results("upload", {result.target: result}, self.name)
+                if report_failures({result.target: result}, "upload pcap"):
+                    self._download(result.target)
+        await self._finish_downloads()
+
+    async def close(self):
+        if getattr(self, "sessions", None):
+            await self.sessions.close_all()
+        await super().close()
+
+
+class Ec2Capture(ServiceCapture):
+    """
+    Capture of an EC2 service, `targets` being {region: [instance_id, ...]}.
+
+    Start and stop are each one SSM command per batch of instances.
+    """
+
+    async def prepare(self):
+        """Build the start/stop scripts, returning the number of instances."""
+        self._open_downloader()
+        fields = dict(self.upload_fields, instance_id="${INSTANCE_ID}", bucket_name=self.bucket_name, capture_id=self.capture_id)
+
+        install_script = []
+        if self.upload_fields["uploader"] == "node":
+            with open(PCAP_UPLOAD_SCRIPT_PATH, 'r') as script_file:
+                install_script = [INSTALL_PCAP_UPLOADER_EC2_COMMAND.format(script=script_file.read().strip())]
+
+        if self.rotation.get("enabled"):
+            with open(SEGMENT_UPLOAD_SCRIPT_PATH, 'r') as script_file:
+                self.start_script = [EC2_INSTANCE_ID_SHELL, *install_script, INSTALL_SEGMENT_UPLOADER_EC2_COMMAND.format(script=script_file.read().strip()),
+                                     side_by_side(leg_commands(TCP_DUMP_EC2_ROTATING_COMMAND, self.legs, file_size=self.rotation.get("fileSizeMB", 100),
+                                                               file_count=self.rotation.get("fileCount", 10), **fields))]
+            self.stop_script = [EC2_INSTANCE_ID_SHELL, TCP_DUMP_EC2_STOP_AND_MV_SEGMENTS_COMMAND.format(**fields)]
+        else:
+            self.start_script = [EC2_INSTANCE_ID_SHELL, *install_script, side_by_side(leg_commands(TCP_DUMP_EC2_COMMAND, self.legs, **fields))]
+            mv_template = MV_PCAP_TO_S3_EC2_NODE_COMMAND if self.upload_fields["uploader"] == "node" else MV_PCAP_TO_S3_EC2_COMMAND
+            self.stop_script = [EC2_INSTANCE_ID_SHELL, one_after_another(
+                [STOP_TCP_DUMP_EC2_COMMAND] + compress_commands(PCAP_EC2_PATH, self.legs, self.settings["compression"], sudo=True, **fields)
+                + leg_commands(mv_template, self.legs, **fields))]
+        return sum(len(instance_ids) for instance_ids in self.targets.values())
+
+    async def start(self):
+        """Start tcpdump on all instances with one SSM command per batch of instances, returning the instance ids."""
+        with self.report.phase("start", self.name, targets=sum(len(instance_ids) for instance_ids in self.targets.values())):
+            start_commands = await asyncio.to_thread(send_ssm_commands, self.profile, self.targets, self.start_script)
+        self.started_targets = {region: [instance_id for _, batch in batches for instance_id in batch] for region, batches in start_commands.items()}
+        started = [instance_id for instance_ids in self.started_targets.values() for instance_id in instance_ids]
+        self._collect_segments(started)
+        return started
+
+    async def stop(self):
+        # Stop tcpdump and move the pcap file to S3 on all instances
+        with self.report.phase("stop", self.name):
+            self.stop_commands = await asyncio.to_thread(send_ssm_commands, self.profile, self.started_targets, self.stop_script,
+                                                         execution_timeout=self.settings["upload_timeout"])
+        self._stopped_at = time.monotonic()
+
+    async def collect(self):
+        """Download each pcap from S3 as soon as its instance finished uploading it."""
+        with self.report.phase("upload", self.name):
+            async for instance_id, status, details in poll_ssm_commands(self.profile, self.stop_commands,
+                                                                        self.settings["upload_timeout"] + SSM_POLL_GRACE):
+                # From the stop command to the end of the upload, as seen by the SSM polling
+                self.report.target("upload", instance_id, time.monotonic() - self._stopped_at, self.name, status == "Success",
+                                   error=None if status == "Success" else f"{status} {details}")
+                if status != "Success":
+                    print(f"Failed to stop tcpdump and upload pcap on {instance_id}: {status} {details}")
+                    continue
+                self._download(instance_id)
+        await self._finish_downloads()
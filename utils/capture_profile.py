@@ -0,0 +1,97 @@
+import ctypes
+import ctypes.util
+import shutil
+import struct
+import subprocess
+import tempfile
+
+
+DEFAULT_CAPTURE_FILTER = "port not 22"
+DEFAULT_SNAPLEN = 0
+DEFAULT_SIP_FILTER = "port 5060 or port 5061"
+# Linux cooked header + IPv6 + UDP + RTP header with a few CSRCs/extension words
+DEFAULT_RTP_HEADER_SNAPLEN = 128
+LINKTYPE_LINUX_SLL = 113
+
+
+def resolve_capture_profile(service_config):
+    """
+    Turn the "captureProfile" of a captureServices entry into the tcpdump processes to run on each target.
+
+    Parameters:
+    - service_config: The captureServices entry of the selected service.
+
+    Returns:
+    A list of capture legs, dictionaries with "suffix" (added to the pcap name), "snaplen" and "filter".
+    With rtpHeadersOnly, SIP is captured in full by one tcpdump and everything else
+    by a second one truncated to the RTP headers.
+    """
+    profile = service_config.get("captureProfile", {})
+    capture_filter = profile.get("filter", DEFAULT_CAPTURE_FILTER)
+    snaplen = profile.get("snaplen", DEFAULT_SNAPLEN)
+
+    if not profile.get("rtpHeadersOnly"):
+        return [{"suffix": "", "snaplen": snaplen, "filter": capture_filter}]
+
+    sip_filter = profile.get("sipFilter", DEFAULT_SIP_FILTER)
+    return [
+        {"suffix": "_sip", "snaplen": snaplen, "filter": f"({capture_filter}) and ({sip_filter})"},
+        {"suffix": "_media", "snaplen": profile.get("mediaSnaplen", DEFAULT_RTP_HEADER_SNAPLEN),
+         "filter": f"({capture_filter}) and not ({sip_filter})"},
+    ]
+
+
+class _BpfProgram(ctypes.Structure):
+    _fields_ = [("bf_len", ctypes.c_uint), ("bf_insns", ctypes.c_void_p)]
+
+
+def _compile_with_libpcap(libpcap, capture_filter, linktype):
+    libpcap.pcap_open_dead.restype = ctypes.c_void_p
+    libpcap.pcap_geterr.restype = ctypes.c_char_p
+    handle = libpcap.pcap_open_dead(linktype, 65535)
+    program = _BpfProgram()
+    try:
+        if libpcap.pcap_compile(ctypes.c_void_p(handle), ctypes.byref(program), capture_filter.encode(), 1, 0xFFFFFFFF) != 0:
+            return libpcap.pcap_geterr(ctypes.c_void_p(handle)).decode(errors="replace")
+        libpcap.pcap_freecode(ctypes.byref(program))
+        return None
+    finally:
+        libpcap.pcap_close(ctypes.c_void_p(handle))
+
+
+def validate_capture_filter(capture_filter, linktype=LINKTYPE_LINUX_SLL):
+    """
+    Check a BPF filter locally before it is sent to every target.
+
+    The filter is compiled with libpcap when it is installed, or with `tcpdump -d`
+    otherwise. Without either, only basic checks are made.
+
+    Returns:
+    None when the filter is valid, otherwise an error message.
+    """
+    if not capture_filter.strip():
+        return "Capture filter is empty"
+    if "'" in capture_filter:
+        return "Capture filter can't contain single quotes"
+    if capture_filter.count("(") != capture_filter.count(")"):
+        return "Unbalanced parentheses in capture filter"
+
+    library = ctypes.util.find_library("pcap")
+    if library:
+        try:
+            return _compile_with_libpcap(ctypes.CDLL(library), capture_filter, linktype)
+        except OSError:
+            pass
+
+    if shutil.which("tcpdump"):
+        # An empty capture of the right link type lets tcpdump compile without opening an interface
+        with tempfile.NamedTemporaryFile(suffix=".pcap") as empty_capture:
+            empty_capture.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, linktype))
+            empty_capture.flush()
+            result = subprocess.run(["tcpdump", "-d", "-r", empty_capture.name, capture_filter], capture_output=True, text=True)
+        if result.returncode != 0:
+            return result.stderr.strip()
+        return None
+
+    print("libpcap/tcpdump not found locally, the capture filter is only checked by the targets.")
+    return None
@@ -0,0 +1,153 @@
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+DEFAULT_STATSD_PREFIX = "ecxcapture"
+
+
+class CaptureReport:
+    """
+    Timings of one capture run: every phase (discovery, session open, start, stop, upload,
+    download, merge...) and every target within a phase, with bytes moved, attempts and errors.
+
+    Every record is also handed to the hooks as it is made, e.g. statsd_hook to export the
+    timings to a local metrics sink while the capture runs.
+
+    Parameters:
+    - run: Name of the run, e.g. the captured service.
+    - hooks: Callables taking each record (a dictionary with its "kind", "phase", "seconds"...).
+    """
+
+    def __init__(self, run, hooks=None):
+        self.run = run
+        self.hooks = hooks or []
+        self.started_at = datetime.now()
+        self._start = time.monotonic()
+        self.phases = []
+        self.targets = []
+
+    def _record(self, records, record):
+        records.append(record)
+        for hook in self.hooks:
+            try:
+                hook(record)
+            except Exception as e:
+                print(f"Metrics hook failed: {e}")
+
+    @contextmanager
+    def phase(self, phase, capture=None, **details):
+        """
+        Time a phase of the capture, as `with report.phase("start", "PCSCF@prod"):`.
+
+        The yielded dictionary can be filled with details of the phase (e.g. "targets").
+        An exception raised in the phase marks it failed and is raised again.
+        """
+        record = {"kind": "phase", "phase": phase, "capture": capture, "ok": True, **details}
+        start = time.monotonic()
+        try:
+            yield record
+        except Exception as e:
+            record["ok"] = False
+            record["error"] = str(e)
+            raise
+        finally:
+            record["offset"] = round(start - self._start, 3)
+            record["seconds"] = round(time.monotonic() - start, 3)
+            self._record(self.phases, record)
+
+    def target(self, phase, target, seconds, capture=None, ok=True, attempts=1, bytes=0, error=None):
+        """Record how one target did in a phase."""
+        self._record(self.targets, {"kind": "target", "phase": phase, "capture": capture, "target": target, "seconds": round(seconds, 3),
+                                    "ok": ok, "attempts": attempts, "bytes": bytes, "error": error or None})
+
+    def command_results(self, phase, results, capture=None):
+        """Record the CommandResult of every target of a phase."""
+        for target, result in results.items():
+            self.target(phase, target, result.duration, capture, result.ok, result.attempts,
+                        error=None if result.ok else ("timed out" if result.timed_out else result.stderr.strip()))
+
+    def to_dict(self):
+        totals = {}
+        for record in self.targets:
+            total = totals.setdefault(record["phase"], {"targets": 0, "failures": 0, "retries": 0, "bytes": 0, "slowest": None})
+            total["targets"] += 1
+            total["failures"] += not record["ok"]
+            total["retries"] += max(record["attempts"] - 1, 0)
+            total["bytes"] += record["bytes"]
+            if total["slowest"] is None or record["seconds"] > total["slowest"]["seconds"]:
+                total["slowest"] = {"target": record["target"], "capture": record["capture"], "seconds": record["seconds"]}
+        return {
+            "run": self.run,
+            "startedAt": self.started_at.isoformat(timespec="seconds"),
+            "seconds": round(time.monotonic() - self._start, 3),
+            "phases": self.phases,
+            "targetTotals": totals,
+            "targets": self.targets,
+        }
+
+    def write(self, path):
+        """Write the report as JSON, returning the path or None when it can't be written."""
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, 'w') as report_file:
+                json.dump(self.to_dict(), report_file, indent=2)
+            return path
+        except OSError as e:
+            print(f"Error writing the capture report {path}: {e}")
+            return None
+
+    def summary(self):
+        """One line per phase, slowest first, naming its slowest target."""
+        report = self.to_dict()
+        lines = []
+        for record in sorted(report["phases"], key=lambda record: record["seconds"], reverse=True):
+            line = f"{record['phase']}{' ' + record['capture'] if record['capture'] else ''}: {record['seconds']:.1f}s"
+            totals = report["targetTotals"].get(record["phase"])
+            if totals and totals["slowest"]:
+                line += f", slowest target {totals['slowest']['target']} ({totals['slowest']['seconds']:.1f}s)"
+                if totals["failures"]:
+                    line += f", {totals['failures']} failed"
+            if not record["ok"]:
+                line += f", failed: {record.get('error')}"
+            lines.append(line)
+        return lines
+
+
+def statsd_hook(address, prefix=DEFAULT_STATSD_PREFIX):
+    """
+    Report hook sending every record to a StatsD daemon over UDP.
+
+    Phases are sent as `{prefix}.phase.{phase}:{ms}|ms`, targets as `{prefix}.target.{phase}:{ms}|ms`
+    plus `.bytes` and `.failures` counters.
+
+    Parameters:
+    - address: "host:port" of the StatsD daemon.
+    - prefix: Prefix of the metric names.
+    """
+    host, _, port = address.rpartition(":")
+    destination = (host or "127.0.0.1", int(port))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(record):
+        name = f"{prefix}.{record['kind']}.{record['phase']}".replace(" ", "_")
+        metrics = [f"{name}:{record['seconds'] * 1000:.0f}|ms"]
+        if record.get("bytes"):
+            metrics.append(f"{name}.bytes:{record['bytes']}|c")
+        if not record["ok"]:
+            metrics.append(f"{name}.failures:1|c")
+        sock.sendto("\n".join(metrics).encode(), destination)
+
+    return send
+
+
+def report_from_config(run, report_config=None):
+    """Create the CaptureReport of a run with the hooks of the "report" section of the config file."""
+    report_config = report_config or {}
+    hooks = []
+    if report_config.get("statsd"):
+        hooks.append(statsd_hook(report_config["statsd"], report_config.get("statsdPrefix", DEFAULT_STATSD_PREFIX)))
+    return CaptureReport(run, hooks)
@@ -0,0 +1,241 @@
+import asyncio
+import os
+import signal
+import time
+from dataclasses import dataclass
+
+
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_TIMEOUT = 300
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 1.0
+DEFAULT_STARTUP_GRACE = 2.0
+# Seconds an interrupted command gets to exit before it is killed
+DEFAULT_STOP_TIMEOUT = 10
+
+
+@dataclass
+class CommandResult:
+    """Outcome of a command run against one target (ECS task or EC2 instance)."""
+    target: str
+    returncode: int = None
+    stdout: str = ""
+    stderr: str = ""
+    duration: float = 0.0
+    attempts: int = 0
+    timed_out: bool = False
+    running: bool = False  # A long-running command still alive after its startup grace period
+
+    @property
+    def ok(self):
+        return (self.returncode == 0 or self.running) and not self.timed_out
+
+
+class CommandRunner:
+    """
+    Run local CLI commands (aws ecs execute-command, aws ssm ...) against many targets at once.
+
+    Every target gets its own timeout and retries with exponential backoff, while
+    a semaphore bounds how many CLI processes run at the same time.
+
+    Parameters:
+    - max_concurrency: Maximum number of commands running at once.
+    - timeout: Seconds a single attempt may take before it is killed.
+    - retries: How many times a failed attempt is retried.
+    - backoff: Seconds to wait before the first retry, doubled on every retry.
+    - startup_grace: Seconds a long-running command must survive to count as started.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, startup_grace=DEFAULT_STARTUP_GRACE):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.startup_grace = startup_grace
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @classmethod
+    def from_config(cls, execution_config):
+        execution_config = execution_config or {}
+        return cls(
+            max_concurrency=execution_config.get("maxConcurrency", DEFAULT_MAX_CONCURRENCY),
+            timeout=execution_config.get("timeoutSeconds", DEFAULT_TIMEOUT),
+            retries=execution_config.get("retries", DEFAULT_RETRIES),
+            backoff=execution_config.get("backoffSeconds", DEFAULT_BACKOFF),
+            startup_grace=execution_config.get("startupGraceSeconds", DEFAULT_STARTUP_GRACE),
+        )
+
+    async def _spawn_process(self, args):
+        return await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            stdin=asyncio.subprocess.PIPE,
+            start_new_session=os.name == 'posix',
+        )
+
+    async def _with_retries(self, target, attempt):
+        result = CommandResult(target)
+        start = time.monotonic()
+        delay = self.backoff
+
+        for attempt_number in range(1, self.retries + 2):
+            result.attempts = attempt_number
+            try:
+                async with self._semaphore:
+                    done = await attempt(result)
+            except OSError as e:
+                result.stderr = str(e)
+                done = False
+            if done:
+                break
+            if attempt_number <= self.retries:
+                await asyncio.sleep(delay)
+                delay *= 2
+
+        result.duration = time.monotonic() - start
+        return result
+
+    async def run(self, target, args):
+        """
+        Run a command to completion against one target.
+
+        Returns:
+        A CommandResult with the exit code, output and duration of the last attempt.
+        """
+        async def attempt(result):
+            process = await self._spawn_process(args)
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), self.timeout)
+                result.timed_out = False
+            except asyncio.TimeoutError:
+                await stop_process(process)
+                result.timed_out = True
+                result.returncode = process.returncode
+                result.stderr = f"Timed out after {self.timeout}s"
+                return False
+            result.returncode = process.returncode
+            result.stdout = stdout.decode(errors="replace")
+            result.stderr = stderr.decode(errors="replace")
+            return process.returncode == 0
+
+        return await self._with_retries(target, attempt)
+
+    async def spawn(self, target, args):
+        """
+        Start a long-running command (e.g. a tcpdump session) against one target.
+
+        The command counts as started when it is still running after the startup
+        grace period, or when it exits cleanly within it.
+
+        Returns:
+        A tuple (process, CommandResult). `process` is None when every attempt failed.
+        """
+        process_holder = {}
+
+        async def attempt(result):
+            process = await self._spawn_process(args)
+            try:
+                await asyncio.wait_for(process.wait(), self.startup_grace)
+            except asyncio.TimeoutError:
+                process_holder["process"] = process
+                result.running = True
+                return True
+            result.returncode = process.returncode
+            result.stderr = (await process.stderr.read()).decode(errors="replace")
+            if process.returncode == 0:
+                process_holder["process"] = process
+                return True
+            return False
+
+        result = await self._with_retries(target, attempt)
+        return process_holder.get("process"), result
+
+    async def run_all(self, commands):
+        """
+        Run commands against many targets at once.
+
+        Parameters:
+        - commands: A dictionary of {target: args}.
+
+        Returns:
+        A dictionary of {target: CommandResult}.
+        """
+        results = await asyncio.gather(*(self.run(target, args) for target, args in commands.items()))
+        return dict(zip(commands, results))
+
+    async def spawn_all(self, commands):
+        """
+        Start long-running commands against many targets at once.
+
+        Returns:
+        A tuple (processes, results): {target: process} for started targets and {target: CommandResult} for all.
+        """
+        spawned = await asyncio.gather(*(self.spawn(target, args) for target, args in commands.items()))
+        processes = {target: process for target, (process, _) in zip(commands, spawned) if process is not None}
+        results = {target: result for target, (_, result) in zip(commands, spawned)}
+        return processes, results
+
+    async def stop_all(self, processes, timeout=DEFAULT_STOP_TIMEOUT):
+        """
+        Stop long-running commands on every target at once, killing the ones still running after `timeout` seconds.
+
+        Returns:
+        A dictionary of {target: CommandResult}.
+        """
+        async def stop(target, process):
+            start = time.monotonic()
+            await stop_process(process, timeout)
+            stderr = (await process.stderr.read()).decode(errors="replace") if process.stderr else ""
+            return CommandResult(target, returncode=process.returncode, stderr=stderr,
+                                 duration=time.monotonic() - start, attempts=1)
+
+        results = await asyncio.gather(*(stop(target, process) for target, process in processes.items()))
+        return dict(zip(processes, results))
+
+
+async def stop_process(process, timeout=DEFAULT_STOP_TIMEOUT):
+    """
+    Interrupt a process and the processes it started, escalating to kill when it doesn't exit within the timeout.
+
+    On POSIX the processes are spawned in their own session, so the whole group is signalled: the aws
+    CLI ignores SIGINT while session-manager-plugin runs, and a plugin left behind would keep the pipes open.
+    """
+    if process.returncode is not None:
+        return
+    try:
+        if os.name == 'posix':
+            os.killpg(process.pid, signal.SIGINT)  # Same as Ctrl+C in a terminal, lets the session close cleanly
+        else:
+            process.terminate()
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        if os.name == 'posix':
+            _kill_group(process)
+        else:
+            process.kill()
+        await process.wait()
+    except ProcessLookupError:
+        pass
+    if os.name == 'posix':
+        # Whatever is left of the group once its leader exited
+        _kill_group(process)
+
+
+def _kill_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def report_failures(results, action):
+    """Print the targets whose command failed, returning the successful target ids."""
+    succeeded = []
+    for target, result in results.items():
+        if result.ok:
+            succeeded.append(target)
+        else:
+            reason = "timed out" if result.timed_out else f"exit code {result.returncode}"
+            print(f"Failed to {action} on {target} ({reason}, {result.attempts} attempts): {result.stderr.strip()}")
+    return succeeded
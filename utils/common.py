@@ -1,80 +1,108 @@
 import glob
 import os
 import subprocess
-import asyncio
 import json
+from utils.call_index import CallIndexer, build_call_index
+from utils.pcap_merge import PacketDeduplicator, merge_pcaps
+from utils.time_index import DEFAULT_INDEX_INTERVAL, TimeIndexer, build_time_index
 from datetime import datetime
 
 
+CAPTURE_FILE_PATTERNS = ['tcpdump_*.pcap', 'tcpdump_*.pcapng', 'tcpdump_*.pcap.gz', 'tcpdump_*.pcap.zst']
+
+
 def has_nested_dicts(input_dict):
     return any(isinstance(value, dict) for value in input_dict.values())
 
 
-def merge_pcap_files_and_open(output_file, input_folder, wireshark_filter='None'):
-    input_files = glob.glob(os.path.join(input_folder, '*.pcap'))
+def list_capture_files(input_folder, output_file=None):
+    # Per-target captures only, never a previous merged output. Several folders can be given as a list
+    input_folders = [input_folder] if isinstance(input_folder, str) else input_folder
+    excluded = {os.path.abspath(output_file)} if output_file else set()
+    input_files = []
+    for folder in input_folders:
+        for pattern in CAPTURE_FILE_PATTERNS:
+            input_files += glob.glob(os.path.join(folder, pattern))
+    return sorted(f for f in input_files if os.path.abspath(f) not in excluded)
+
+
+def merge_pcap_files_and_open(output_file, input_folder, wireshark_filter='None', merge_config=None, download_throughput=None,
+                              open_wireshark=True):
+    merge_config = merge_config or {}
+    input_files = list_capture_files(input_folder, output_file)
 
     # Check if there are any pcap files in the folder
     if not input_files:
         print(f"No pcap files found in {input_folder}")
-        return
+        return False
     
-    mergecap_command = ['mergecap', '-w', output_file, *input_files]
-    subprocess.run(mergecap_command)
+    if merge_config.get("engine", "native") == "mergecap":
+        mergecap_command = ['mergecap', '-w', output_file, *input_files]
+        subprocess.run(mergecap_command)
+        if merge_config.get("callIndex") and os.path.exists(output_file):
+            print(f"Indexed {build_call_index(output_file)} calls")
+        if merge_config.get("timeIndex") and os.path.exists(output_file):
+            build_time_index(output_file, merge_config.get("timeIndexInterval", DEFAULT_INDEX_INTERVAL))
+    else:
+        dedup_config = merge_config.get("dedup", {})
+        deduplicator = None
+        if dedup_config.get("enabled"):
+            deduplicator = PacketDeduplicator(dedup_config.get("windowMs", 50), dedup_config.get("maxEntries", 1_000_000),
+                                              dedup_config.get("sameSource", False))
+
+        indexer = CallIndexer() if merge_config.get("callIndex") else None
+        time_indexer = TimeIndexer(merge_config.get("timeIndexInterval", DEFAULT_INDEX_INTERVAL)) if merge_config.get("timeIndex") else None
+        stats = merge_pcaps(input_files, output_file, deduplicator, indexer, time_indexer)
+        print(f"Merged {stats['packets']} packets from {len(input_files)} files in {stats['seconds']:.1f}s")
+        if indexer:
+            print(f"Indexed {len(indexer.calls)} calls")
+        for input_file, duplicates in stats["duplicates"].items():
+            print(f"Dropped {duplicates} duplicate packets from {os.path.basename(input_file)}")
+        compression = stats["compression"]
+        if compression["files"] and compression["bytes"]:
+            saved_bytes = compression["uncompressed_bytes"] - compression["bytes"]
+            summary = (f"Compressed captures: {compression['uncompressed_bytes'] / 1024 / 1024:.1f} MB -> "
+                       f"{compression['bytes'] / 1024 / 1024:.1f} MB (ratio {compression['uncompressed_bytes'] / compression['bytes']:.1f}x)")
+            if download_throughput:
+                # Estimated from the download rate, upload time saved on the targets comes on top
+                summary += f", about {saved_bytes / download_throughput:.1f}s of download saved"
+            print(summary)
+
+    # Check if the output file was created
+    if not os.path.exists(output_file):
+        print(f"Error: Failed to create {output_file}")
+        return False
+    if open_wireshark:
+        open_in_wireshark(output_file, wireshark_filter)
+    return True
 
-    wireshark_command = ['wireshark', output_file]
+
+def open_in_wireshark(pcap_file, wireshark_filter=None):
+    wireshark_command = ['wireshark', pcap_file]
 
     if wireshark_filter:
         wireshark_command.extend(['-Y', wireshark_filter])
 
-    # Check if the output file was created
-    if os.path.exists(output_file):
-        subprocess.run(wireshark_command)
-    else:
-        print(f"Error: Failed to create {output_file}")
+    subprocess.run(wireshark_command)
 
 
-async def run_ecs_command(region, sso_profile, cluster_name, task_id, cmd):
-    process = subprocess.Popen(
-        ["aws", "ecs", "execute-command",
-        "--cluster", cluster_name,
-        "--task", task_id,
-        "--command", cmd,
-        "--interactive",
-        "--region", region,
-        "--profile", sso_profile],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        stdin=subprocess.PIPE,
-        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == 'nt' else 0,
-    )
-    return process
-
-
-async def run_ec2_command(region, sso_profile, instance_id, cmd):
-    process = subprocess.Popen(
-        ["aws", "ssm", "send-command",
-        "--instance-ids", instance_id,
-        '--document-name', 'AWS-RunShellScript',
-        '--parameters', f"commands='{cmd}'",
-        "--region", region,
-        "--profile", sso_profile],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        stdin=subprocess.PIPE,
-        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == 'nt' else 0,
-    )
-    return process
-
-
-def stop_command(process):
-    try:
-        if os.name == 'posix':
-            process.terminate()  # Send interrupt signal (Ctrl+C) to stop command
-        else:
-            process.kill()
-    except asyncio.CancelledError as e:
-        print(f"Error stopping command: {e}")
-        pass  # Ignore CancelledError when the process is terminated
+def ecs_command_args(region, sso_profile, cluster_name, task_id, cmd):
+    return ["aws", "ecs", "execute-command",
+            "--cluster", cluster_name,
+            "--task", task_id,
+            "--command", cmd,
+            "--interactive",
+            "--region", region,
+            "--profile", sso_profile]
+
+
+def ssm_session_args(region, sso_profile, instance_id, cmd):
+    return ["aws", "ssm", "start-session",
+            "--target", instance_id,
+            "--document-name", "AWS-StartInteractiveCommand",
+            "--parameters", json.dumps({"command": [cmd]}),
+            "--region", region,
+            "--profile", sso_profile]
 
 
 def read_config(config_file_path):
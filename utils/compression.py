@@ -0,0 +1,90 @@
+import gzip
+import subprocess
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# codec: (file extension, default level, command compressing {path} in place on the target)
+COMPRESSION_CODECS = {
+    "gzip": (".gz", 6, "gzip -f -{level} {path}"),
+    "zstd": (".zst", 3, "zstd -q -f --rm -{level} {path}"),
+}
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+STREAM_BUFFER_SIZE = 1024 * 1024
+
+
+def resolve_compression(capture_config):
+    """
+    Read the "compression" settings of the capture config.
+
+    Parameters:
+    - capture_config: The "capture" section of the config file.
+
+    Returns:
+    None when compression is disabled, otherwise a dictionary with the "codec", "level",
+    "extension" of compressed files and "command" template compressing a {path} in place.
+    """
+    compression = capture_config.get("compression", {})
+    if not compression.get("enabled"):
+        return None
+
+    codec = compression.get("codec", "gzip")
+    if codec not in COMPRESSION_CODECS:
+        raise ValueError(f"Unknown compression codec '{codec}', use one of {', '.join(COMPRESSION_CODECS)}")
+    extension, default_level, command = COMPRESSION_CODECS[codec]
+    level = compression.get("level", default_level)
+    return {"codec": codec, "level": level, "extension": extension,
+            "command": command.replace("{level}", str(level))}
+
+
+def detect_compression(path):
+    """Return "gzip" or "zstd" from the magic bytes of the file, None when it isn't compressed."""
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic == ZSTD_MAGIC:
+        return "zstd"
+    return None
+
+
+class _ProcessStream:
+    # Read the output of a decompressing process like a file
+    def __init__(self, command):
+        self._process = subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=STREAM_BUFFER_SIZE)
+
+    def read(self, size=-1):
+        return self._process.stdout.read(size)
+
+    def close(self):
+        self._process.stdout.close()
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+
+
+def open_decompressed(path):
+    """
+    Open a gzip or zstd compressed file as a stream of its uncompressed bytes.
+
+    zstd files are read with the `zstandard` package when installed, otherwise
+    through the `zstd` command line tool.
+
+    Parameters:
+    - path: Path of the compressed file.
+
+    Returns:
+    A binary file-like object supporting read() and close().
+    """
+    codec = detect_compression(path)
+    if codec == "gzip":
+        return gzip.open(path, 'rb')
+    if codec == "zstd":
+        if zstandard:
+            return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_size=STREAM_BUFFER_SIZE, closefd=True)
+        return _ProcessStream(['zstd', '-dcq', path])
+    raise ValueError(f"{path} is neither gzip nor zstd compressed")
@@ -0,0 +1,195 @@
+import asyncio
+import re
+import time
+from utils.command_runner import CommandResult, CommandRunner, stop_process
+
+
+EXEC_SESSION_SHELL = "/bin/sh"
+# Session Manager closes sessions idle for 20 minutes by default
+DEFAULT_KEEPALIVE_INTERVAL = 60
+# Split in the command sent, so the echo of the command by the remote terminal never matches
+DONE_MARKER = re.compile(r"__ECX_DONE__ (\d+) (\d+)")
+DONE_MARKER_COMMAND = 'echo "__ECX_""DONE__ {token} $?"'
+
+
+class ExecSession:
+    """
+    One interactive shell on a target (e.g. `aws ecs execute-command --command /bin/sh --interactive`)
+    kept open for a whole capture, so every command after the first one skips the session setup.
+
+    Commands are written to the shell's stdin, each followed by an echo of a
+    marker carrying its exit code, and their output is read up to that marker.
+    Any process running a shell on its stdin/stdout works, e.g. a local `sh` standing in for the AWS CLI.
+
+    Parameters:
+    - target: ECS task id.
+    - args: Command line opening the session.
+    """
+
+    def __init__(self, target, args):
+        self.target = target
+        self.args = args
+        self.process = None
+        self._lines = asyncio.Queue()
+        self._reader = None
+        self._token = 0
+        self._lock = asyncio.Lock()
+
+    async def open(self, spawn_process, timeout):
+        """Start the session and wait until its shell answers, returning whether it did."""
+        self.process = await spawn_process(self.args)
+        self._reader = asyncio.create_task(self._read_lines())
+        # Without the terminal echoing every command back the output holds only what the commands print
+        returncode, _ = await self.send("stty -echo 2>/dev/null; true", timeout)
+        return returncode == 0
+
+    async def _read_lines(self):
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                await self._lines.put(None)
+                return
+            await self._lines.put(line.decode(errors="replace").rstrip("\r\n"))
+
+    async def send(self, command, timeout):
+        """
+        Run a command in the session shell.
+
+        Returns:
+        A tuple (returncode, output). returncode is None when the session ended or the command timed out.
+        """
+        async with self._lock:
+            self._token += 1
+            token = str(self._token)
+            try:
+                self.process.stdin.write(f"{command}\n{DONE_MARKER_COMMAND.format(token=token)}\n".encode())
+                await self.process.stdin.drain()
+            except ConnectionError:
+                return None, "Session ended"
+
+            output = []
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    line = await asyncio.wait_for(self._lines.get(), max(deadline - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    return None, "\n".join(output)
+                if line is None:
+                    return None, "\n".join(output)
+                marker = DONE_MARKER.search(line)
+                if marker and marker.group(1) == token:
+                    return int(marker.group(2)), "\n".join(output)
+                output.append(line)
+
+    async def close(self, timeout=10):
+        if self.process is None or self.process.returncode is not None:
+            return
+        try:
+            self.process.stdin.write(b"exit\n")
+            await self.process.stdin.drain()
+            self.process.stdin.close()
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            await stop_process(self.process, timeout)
+        if self._reader:
+            self._reader.cancel()
+
+
+class ExecSessionRunner(CommandRunner):
+    """
+    Run the commands of a capture over one persistent session per target instead of a session per command.
+
+    Long-running commands (tcpdump) are started in the background of the session
+    shell and stopped with a real SIGINT, waiting for them to flush their files.
+    Timeouts, retries and concurrency come from the same "execution" settings as CommandRunner.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sessions = {}
+        self._keepalive = None
+
+    async def _send(self, target, command, timeout=None):
+        session = self.sessions[target]
+        start = time.monotonic()
+        returncode, output = await session.send(command, timeout or self.timeout)
+        return CommandResult(target, returncode=returncode, stdout=output,
+                             stderr="" if returncode is not None else (output or "Session ended"),
+                             duration=time.monotonic() - start, attempts=1, timed_out=returncode is None)
+
+    async def open_all(self, commands):
+        """
+        Open a session on every target at once.
+
+        Parameters:
+        - commands: A dictionary of {target: args} opening the session.
+
+        Returns:
+        A dictionary of {target: CommandResult}.
+        """
+        async def open_session(target, args):
+            async def attempt(result):
+                session = ExecSession(target, args)
+                if await session.open(self._spawn_process, self.timeout):
+                    self.sessions[target] = session
+                    result.returncode = 0
+                    result.timed_out = False
+                    return True
+                still_running = session.process.returncode is None
+                await session.close()
+                result.returncode = session.process.returncode
+                # A shell that never answered may still exit cleanly once its stdin is closed
+                result.timed_out = still_running
+                result.stderr = f"No answer from the session after {self.timeout}s" if still_running \
+                    else (await session.process.stderr.read()).decode(errors="replace")
+                return False
+
+            return await self._with_retries(target, attempt)
+
+        results = await asyncio.gather(*(open_session(target, args) for target, args in commands.items()))
+        return dict(zip(commands, results))
+
+    async def start_all(self, commands):
+        """
+        Start long-running commands in the background of every session.
+
+        A target counts as started when all its commands are still running after the startup grace period.
+
+        Parameters:
+        - commands: A dictionary of {target: [command, ...]}.
+
+        Returns:
+        A dictionary of {target: CommandResult}.
+        """
+        def background(target_commands):
+            started = "; ".join(f'{command} >/dev/null 2>&1 & ECX_PIDS="$ECX_PIDS $!"' for command in target_commands)
+            return f"ECX_PIDS=; {started}; sleep {self.startup_grace}; kill -0 $ECX_PIDS"
+
+        results = await asyncio.gather(*(self._send(target, background(target_commands), self.timeout + self.startup_grace)
+                                         for target, target_commands in commands.items()))
+        return dict(zip(commands, results))
+
+    async def interrupt_all(self, targets):
+        """Send SIGINT to the commands started on the targets and wait for them to exit."""
+        stop = 'kill -INT $ECX_PIDS; ECX_RC=$?; wait; ECX_PIDS=; (exit $ECX_RC)'
+        results = await asyncio.gather(*(self._send(target, stop) for target in targets))
+        return dict(zip(targets, results))
+
+    async def run_on(self, target, command, timeout=None):
+        """Run a command to completion in the session of one target, within `timeout` seconds (the execution timeout by default)."""
+        return await self._send(target, command, timeout)
+
+    def keep_alive(self, interval=DEFAULT_KEEPALIVE_INTERVAL):
+        """Send a no-op through every session periodically, until close_all, so long captures don't look idle."""
+        async def ping():
+            while True:
+                await asyncio.sleep(interval)
+                await asyncio.gather(*(self._send(target, "true") for target in list(self.sessions)))
+
+        self._keepalive = asyncio.create_task(ping())
+
+    async def close_all(self):
+        if self._keepalive:
+            self._keepalive.cancel()
+        await asyncio.gather(*(session.close() for session in self.sessions.values()))
+        self.sessions = {}
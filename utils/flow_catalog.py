@@ -0,0 +1,361 @@
+import glob
+import os
+import socket
+import sqlite3
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from utils.common import list_capture_files
+from utils.packets import IPPROTO_TCP, IPPROTO_UDP, SIP_START, sip_call_id
+from utils.pcap_merge import CompressedPcapReader, open_capture
+from utils.rtp_analysis import packet_columns, transport_columns
+from utils.sip_summary import capture_source
+
+
+ARCHIVE_DIR = "./Pcaps/"
+DEFAULT_CATALOG_FILE = os.path.join(ARCHIVE_DIR, "flow_catalog.sqlite")
+DEFAULT_QUERY_LIMIT = 200
+# Compressed captures are summarized this many bytes of packets at a time, whatever their size
+DECOMPRESSED_CHUNK_BYTES = 64 * 1024 * 1024
+PROTOCOL_NAMES = {IPPROTO_UDP: "udp", IPPROTO_TCP: "tcp"}
+# First byte of a SIP request or response, checked on every payload before any parsing
+SIP_FIRST_BYTES = np.frombuffer(bytes({start[0] for start in SIP_START}), dtype=np.uint8)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, service TEXT, env TEXT, started TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY, run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE, path TEXT UNIQUE NOT NULL,
+    source TEXT, size INTEGER, mtime_ns INTEGER, packets INTEGER, first_ns INTEGER, last_ns INTEGER);
+CREATE TABLE IF NOT EXISTS flows (
+    id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE, protocol TEXT,
+    src_ip TEXT, src_port INTEGER, dst_ip TEXT, dst_port INTEGER, first_ns INTEGER, last_ns INTEGER, packets INTEGER, bytes INTEGER);
+CREATE TABLE IF NOT EXISTS flow_calls (
+    flow_id INTEGER NOT NULL REFERENCES flows(id) ON DELETE CASCADE, call_id TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS files_run ON files(run_id);
+CREATE INDEX IF NOT EXISTS flows_file ON flows(file_id);
+CREATE INDEX IF NOT EXISTS flows_src_ip ON flows(src_ip);
+CREATE INDEX IF NOT EXISTS flows_dst_ip ON flows(dst_ip);
+CREATE INDEX IF NOT EXISTS flows_src_port ON flows(src_port);
+CREATE INDEX IF NOT EXISTS flows_dst_port ON flows(dst_port);
+CREATE INDEX IF NOT EXISTS flow_calls_call_id ON flow_calls(call_id);
+CREATE INDEX IF NOT EXISTS flow_calls_flow ON flow_calls(flow_id);
+"""
+
+
+def open_catalog(catalog_file=DEFAULT_CATALOG_FILE):
+    """Open the catalog, creating it when missing."""
+    os.makedirs(os.path.dirname(catalog_file) or ".", exist_ok=True)
+    connection = sqlite3.connect(catalog_file)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def run_capture_files(run_folder):
+    """Per-target captures of a run folder, or its merged/live pcap when they are gone."""
+    capture_files = list_capture_files(run_folder)
+    if capture_files:
+        return capture_files
+    # {service}/{env}/{timestamp}/{service}.pcap
+    service = os.path.basename(os.path.dirname(os.path.dirname(os.path.abspath(run_folder))))
+    return [path for path in (os.path.join(run_folder, f"{service}.pcap"), os.path.join(run_folder, f"{service}_live.pcap"))
+            if os.path.isfile(path)]
+
+
+def find_runs(paths):
+    """Run folders under the given paths: run folders themselves, or archives laid out as {service}/{env}/{timestamp}/."""
+    runs = {}
+    for path in paths:
+        folders = [path] if run_capture_files(path) else sorted(glob.glob(os.path.join(path, "*", "*", "*", "")))
+        for folder in folders:
+            capture_files = run_capture_files(folder)
+            if capture_files:
+                runs[os.path.abspath(folder)] = [os.path.abspath(capture_file) for capture_file in capture_files]
+    return runs
+
+
+def _decompressed_chunks(reader, chunk_bytes=DECOMPRESSED_CHUNK_BYTES):
+    # The packets of a compressed capture copied back to back, `chunk_bytes` at a time, with the same columns as packet_columns
+    while True:
+        data = bytearray()
+        timestamps, offsets, caplens, links = array('q'), array('q'), array('q'), array('q')
+        for timestamp_ns, _, _, caplen, _, packet, link_id, _ in reader:
+            timestamps.append(timestamp_ns)
+            offsets.append(len(data))
+            caplens.append(caplen)
+            links.append(reader.linktypes[link_id])
+            data += packet
+            if len(data) >= chunk_bytes:
+                break
+        if not timestamps:
+            return
+        yield (np.frombuffer(data, dtype=np.uint8), np.frombuffer(timestamps, dtype=np.int64), np.frombuffer(offsets, dtype=np.int64),
+               np.frombuffer(caplens, dtype=np.int64), np.frombuffer(links, dtype=np.int64))
+        if len(data) < chunk_bytes:
+            return
+
+
+def _address(ipv4, high, low):
+    if ipv4:
+        return socket.inet_ntop(socket.AF_INET, int(low).to_bytes(4, "big"))
+    return socket.inet_ntop(socket.AF_INET6, ((int(high) << 64) | int(low)).to_bytes(16, "big"))
+
+
+def _chunk_flows(buf, timestamps, offsets, caplens, linktypes):
+    # Flows of a set of packets: {(protocol, src_ip, src_port, dst_ip, dst_port): [first_ns, last_ns, packets, bytes, call_ids]}
+    columns = transport_columns(buf, timestamps, offsets, caplens, linktypes, (IPPROTO_UDP, IPPROTO_TCP), 0)
+    payload, length = columns["payload"], columns["length"]
+    if not len(payload):
+        return {}
+    candidates = np.flatnonzero(length >= 16)
+    candidates = candidates[np.isin(buf[payload[candidates]], SIP_FIRST_BYTES)]
+    call_ids = {}
+    for row in candidates:
+        call_id = sip_call_id(buf[payload[row]:payload[row] + length[row]])
+        if call_id is not None:
+            call_ids[row] = call_id
+
+    keys = [columns[name] for name in ("dport", "dst_lo", "dst_hi", "sport", "src_lo", "src_hi", "ipv4", "protocol")]
+    order = np.lexsort(keys)
+    change = np.zeros(len(order), dtype=bool)
+    change[0] = True
+    for key in keys:
+        key = key[order]
+        change[1:] |= key[1:] != key[:-1]
+    starts = np.flatnonzero(change)
+    packet_ts = columns["ts"][order]
+    first = np.minimum.reduceat(packet_ts, starts)
+    last = np.maximum.reduceat(packet_ts, starts)
+    sizes = np.add.reduceat(caplens[columns["packet"]][order], starts)
+    counts = np.diff(np.append(starts, len(order)))
+
+    flow_calls = [set() for _ in starts]
+    if call_ids:
+        flow_of_row = np.empty(len(order), dtype=np.int64)
+        flow_of_row[order] = np.cumsum(change) - 1
+        for row, call_id in call_ids.items():
+            flow_calls[flow_of_row[row]].add(call_id)
+
+    flows = {}
+    for flow, row in enumerate(order[starts]):
+        ipv4 = bool(columns["ipv4"][row])
+        key = (PROTOCOL_NAMES[int(columns["protocol"][row])],
+               _address(ipv4, columns["src_hi"][row], columns["src_lo"][row]), int(columns["sport"][row]),
+               _address(ipv4, columns["dst_hi"][row], columns["dst_lo"][row]), int(columns["dport"][row]))
+        flows[key] = [int(first[flow]), int(last[flow]), int(counts[flow]), int(sizes[flow]), flow_calls[flow]]
+    return flows
+
+
+def summarize_flows(capture_file):
+    """
+    Summarize the UDP/TCP flows of one capture.
+
+    The capture is decoded into columnar arrays and the packets are grouped by 5-tuple with array
+    operations; only the payloads starting like a SIP message are parsed, for their Call-ID.
+    Compressed captures are decompressed and summarized DECOMPRESSED_CHUNK_BYTES at a time.
+
+    Returns:
+    A dictionary with the "file", its "packets", "first" and "last" timestamps (nanoseconds) and its
+    "flows" as (protocol, src_ip, src_port, dst_ip, dst_port, first_ns, last_ns, packets, bytes, call_ids) tuples.
+    """
+    flows = {}
+    summary = {"file": capture_file, "packets": 0, "first": None, "last": None}
+
+    def add(buf, timestamps, offsets, caplens, linktypes):
+        if not len(timestamps):
+            return
+        first, last = int(timestamps.min()), int(timestamps.max())
+        summary["packets"] += len(timestamps)
+        summary["first"] = first if summary["first"] is None else min(summary["first"], first)
+        summary["last"] = last if summary["last"] is None else max(summary["last"], last)
+        for key, (first, last, packets, size, call_ids) in _chunk_flows(buf, timestamps, offsets, caplens, linktypes).items():
+            flow = flows.get(key)
+            if flow is None:
+                flows[key] = [first, last, packets, size, call_ids]
+                continue
+            flow[0], flow[1] = min(flow[0], first), max(flow[1], last)
+            flow[2] += packets
+            flow[3] += size
+            flow[4] |= call_ids
+
+    with open_capture(capture_file) as reader:
+        if isinstance(reader, CompressedPcapReader):
+            for chunk in _decompressed_chunks(reader):
+                add(*chunk)
+        else:
+            buf = np.frombuffer(reader._mm, dtype=np.uint8)
+            add(buf, *packet_columns(reader, buf))
+            del buf
+
+    summary["flows"] = [(*key, first, last, packets, size, sorted(call_ids))
+                        for key, (first, last, packets, size, call_ids) in sorted(flows.items())]
+    return summary
+
+
+def _run_id(connection, run_folder):
+    row = connection.execute("SELECT id FROM runs WHERE path = ?", (run_folder,)).fetchone()
+    if row:
+        return row[0]
+    # {service}/{env}/{timestamp}/
+    env_folder, started = os.path.split(run_folder.rstrip(os.sep))
+    service_folder, env = os.path.split(env_folder)
+    return connection.execute("INSERT INTO runs (path, service, env, started) VALUES (?, ?, ?, ?)",
+                              (run_folder, os.path.basename(service_folder), env, started)).lastrowid
+
+
+def _store(connection, run_id, stat, summary):
+    # Replace what the catalog had for the file
+    connection.execute("DELETE FROM files WHERE path = ?", (summary["file"],))
+    file_id = connection.execute(
+        "INSERT INTO files (run_id, path, source, size, mtime_ns, packets, first_ns, last_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (run_id, summary["file"], capture_source(summary["file"]), stat.st_size, stat.st_mtime_ns, summary["packets"],
+         summary["first"], summary["last"])).lastrowid
+    insert_flow = "INSERT INTO flows (file_id, protocol, src_ip, src_port, dst_ip, dst_port, first_ns, last_ns, packets, bytes) " \
+                  "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    connection.executemany(insert_flow, ((file_id, *flow[:9]) for flow in summary["flows"] if not flow[9]))
+    for flow in summary["flows"]:
+        if flow[9]:
+            flow_id = connection.execute(insert_flow, (file_id, *flow[:9])).lastrowid
+            connection.executemany("INSERT INTO flow_calls (flow_id, call_id) VALUES (?, ?)", ((flow_id, call_id) for call_id in flow[9]))
+
+
+def catalog_runs(paths, catalog_file=DEFAULT_CATALOG_FILE, workers=None):
+    """
+    Add capture runs to the flow catalog, only the files that are new or changed since they were cataloged.
+
+    The captures are summarized in parallel by a process pool, largest first, and written to the
+    catalog as they come back. Files that no longer exist are removed from the catalog.
+
+    Parameters:
+    - paths: Run folders, or archives laid out as {service}/{env}/{timestamp}/ (e.g. DEFAULT_PCAP_DIR).
+    - catalog_file: Path of the SQLite catalog.
+    - workers: Number of processes, the number of CPUs by default.
+
+    Returns:
+    A dictionary with the number of "runs" and "files" found, the files "indexed", "unchanged",
+    "failed" and "removed", the "flows" and "packets" added, the "workers" used and "seconds".
+    """
+    start = time.monotonic()
+    runs = find_runs(paths)
+    connection = open_catalog(catalog_file)
+    try:
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in connection.execute("SELECT path, size, mtime_ns FROM files")}
+        stats = {}
+        for run_folder, capture_files in runs.items():
+            for capture_file in capture_files:
+                stats[capture_file] = (run_folder, os.stat(capture_file))
+        pending = [capture_file for capture_file, (_, stat) in stats.items()
+                   if known.get(capture_file) != (stat.st_size, stat.st_mtime_ns)]
+        pending.sort(key=lambda capture_file: stats[capture_file][1].st_size, reverse=True)
+        workers = max(1, min(workers or os.cpu_count() or 1, len(pending) or 1))
+
+        result = {"runs": len(runs), "files": len(stats), "indexed": 0, "unchanged": len(stats) - len(pending), "failed": 0,
+                  "removed": 0, "flows": 0, "packets": 0, "workers": workers}
+
+        def add(summary):
+            run_folder, stat = stats[summary["file"]]
+            with connection:
+                _store(connection, _run_id(connection, run_folder), stat, summary)
+            result["indexed"] += 1
+            result["flows"] += len(summary["flows"])
+            result["packets"] += summary["packets"]
+
+        if workers == 1:
+            for capture_file in pending:
+                try:
+                    add(summarize_flows(capture_file))
+                except Exception as e:
+                    result["failed"] += 1
+                    print(f"Error cataloging {capture_file}: {e}")
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(summarize_flows, capture_file): capture_file for capture_file in pending}
+                for future in as_completed(futures):
+                    try:
+                        add(future.result())
+                    except Exception as e:
+                        result["failed"] += 1
+                        print(f"Error cataloging {futures[future]}: {e}")
+
+        with connection:
+            missing = [(path,) for path in known if not os.path.exists(path)]
+            connection.executemany("DELETE FROM files WHERE path = ?", missing)
+            connection.execute("DELETE FROM runs WHERE id NOT IN (SELECT run_id FROM files)")
+            result["removed"] = len(missing)
+    finally:
+        connection.close()
+    result["seconds"] = time.monotonic() - start
+    return result
+
+
+def query_flows(catalog_file=DEFAULT_CATALOG_FILE, ip=None, port=None, protocol=None, call_id=None, service=None, env=None,
+                start_ns=None, end_ns=None, limit=DEFAULT_QUERY_LIMIT):
+    """
+    Find the flows of past runs in the catalog, without opening any capture.
+
+    Parameters:
+    - ip/port: Address or port on either side of the flow.
+    - protocol: "udp" or "tcp".
+    - call_id: SIP Call-ID carried by the flow.
+    - service/env: Service and environment of the run.
+    - start_ns/end_ns: Only flows active in this window, epoch nanoseconds.
+    - limit: Maximum number of flows returned, latest first.
+
+    Returns:
+    A list of dictionaries with the "run" folder, its "service", "env" and "started" time, the
+    capture "file" and its "source" task or instance, the flow "protocol", "src", "srcPort",
+    "dst", "dstPort", "first" and "last" timestamps, "packets", "bytes" and "callIds".
+    """
+    conditions, parameters = [], []
+    if ip:
+        conditions.append("(flows.src_ip = ? OR flows.dst_ip = ?)")
+        parameters += [ip, ip]
+    if port is not None:
+        conditions.append("(flows.src_port = ? OR flows.dst_port = ?)")
+        parameters += [port, port]
+    if protocol:
+        conditions.append("flows.protocol = ?")
+        parameters.append(protocol)
+    if call_id:
+        conditions.append("flows.id IN (SELECT flow_id FROM flow_calls WHERE call_id = ?)")
+        parameters.append(call_id)
+    if service:
+        conditions.append("runs.service = ?")
+        parameters.append(service)
+    if env:
+        conditions.append("runs.env = ?")
+        parameters.append(env)
+    if start_ns is not None:
+        conditions.append("flows.last_ns >= ?")
+        parameters.append(start_ns)
+    if end_ns is not None:
+        conditions.append("flows.first_ns <= ?")
+        parameters.append(end_ns)
+
+    connection = open_catalog(catalog_file)
+    try:
+        rows = connection.execute(
+            "SELECT flows.id, runs.path, runs.service, runs.env, runs.started, files.path, files.source, flows.protocol, flows.src_ip, "
+            "flows.src_port, flows.dst_ip, flows.dst_port, flows.first_ns, flows.last_ns, flows.packets, flows.bytes "
+            "FROM flows JOIN files ON files.id = flows.file_id JOIN runs ON runs.id = files.run_id "
+            f"{'WHERE ' + ' AND '.join(conditions) if conditions else ''} ORDER BY flows.first_ns DESC LIMIT ?",
+            parameters + [limit]).fetchall()
+        call_ids = {}
+        flow_ids = [row[0] for row in rows]
+        for chunk in range(0, len(flow_ids), 500):
+            chunk_ids = flow_ids[chunk:chunk + 500]
+            for flow_id, flow_call_id in connection.execute(
+                    f"SELECT flow_id, call_id FROM flow_calls WHERE flow_id IN ({','.join('?' * len(chunk_ids))})", chunk_ids):
+                call_ids.setdefault(flow_id, []).append(flow_call_id)
+    finally:
+        connection.close()
+
+    names = ["run", "service", "env", "started", "file", "source", "protocol", "src", "srcPort", "dst", "dstPort", "first", "last",
+             "packets", "bytes"]
+    return [dict(zip(names, row[1:]), callIds=sorted(call_ids.get(row[0], []))) for row in rows]
@@ -0,0 +1,186 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_INVENTORY_CACHE_FILE = os.path.expanduser("~/.ecxcapture/inventory_cache.json")
+DEFAULT_INVENTORY_TTL = 300
+DEFAULT_INVENTORY_MAX_STALE = 3600
+
+_cache_lock = threading.Lock()
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="inventory-refresh")
+
+
+def _cache_key(profile_name, server_type, service_id, region):
+    return f"{profile_name}|{server_type}|{service_id}|{region}"
+
+
+def _read_cache(cache_file):
+    try:
+        with open(cache_file, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _write_cache_entries(cache_file, entries):
+    # Re-read under the lock so concurrent refreshes don't drop each other's entries
+    with _cache_lock:
+        cache = _read_cache(cache_file)
+        cache.update(entries)
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as file:
+            json.dump(cache, file)
+        os.replace(tmp_file, cache_file)
+
+
+def _discover_and_store(discover, profile_name, server_type, service_id, regions, cache_file):
+    inventory = discover(profile_name, regions, service_id)
+    if inventory is None:
+        return None
+    now = time.time()
+    _write_cache_entries(cache_file, {
+        _cache_key(profile_name, server_type, service_id, region): {"fetchedAt": now, "targets": targets}
+        for region, targets in inventory.items()
+    })
+    return inventory
+
+
+def get_cached_inventory(profile_name, server_type, service_id, regions, discover, cache_config=None, force_refresh=False):
+    """
+    Return the targets of a service from the on-disk inventory cache, discovering them when needed.
+
+    Parameters:
+    - profile_name: AWS CLI named profile used for discovery.
+    - server_type: "ecs" or "ec2", part of the cache key.
+    - service_id: The service key name passed to the discovery function.
+    - regions: List of AWS regions to look up.
+    - discover: get_ecs_clusters or get_ec2_instances.
+    - cache_config: The "inventoryCache" section of the config file.
+    - force_refresh: Ignore cached entries and rediscover everything.
+
+    Returns:
+    A tuple (inventory, refresh). `inventory` has the same shape as the discovery
+    function result. `refresh` is a Future of the revalidated inventory when stale
+    entries were served, otherwise None.
+    """
+    cache_config = cache_config or {}
+    if not cache_config.get("enabled", True):
+        return discover(profile_name, regions, service_id), None
+
+    cache_file = os.path.expanduser(cache_config.get("file", DEFAULT_INVENTORY_CACHE_FILE))
+    ttl = cache_config.get("ttlSeconds", DEFAULT_INVENTORY_TTL)
+    max_stale = cache_config.get("maxStaleSeconds", DEFAULT_INVENTORY_MAX_STALE)
+    stale_while_revalidate = cache_config.get("staleWhileRevalidate", True)
+
+    if force_refresh:
+        return _discover_and_store(discover, profile_name, server_type, service_id, regions, cache_file), None
+
+    cache = _read_cache(cache_file)
+    now = time.time()
+    inventory = {}
+    stale_regions = []
+    missing_regions = []
+
+    for region in regions:
+        entry = cache.get(_cache_key(profile_name, server_type, service_id, region))
+        age = now - entry["fetchedAt"] if entry else None
+        if entry is None or age > ttl + (max_stale if stale_while_revalidate else 0):
+            missing_regions.append(region)
+        else:
+            inventory[region] = entry["targets"]
+            if age > ttl:
+                stale_regions.append(region)
+
+    if missing_regions:
+        fresh = _discover_and_store(discover, profile_name, server_type, service_id, missing_regions, cache_file)
+        if fresh is None:
+            return None, None
+        inventory.update(fresh)
+
+    refresh = None
+    if stale_regions:
+        refresh = _refresh_executor.submit(_discover_and_store, discover, profile_name, server_type,
+                                           service_id, stale_regions, cache_file)
+
+    # Keep the configured region order
+    return {region: inventory[region] for region in regions if region in inventory}, refresh
+
+
+def resolve_inventory_refresh(inventory, refresh, timeout=None):
+    """
+    Merge the result of a background revalidation into the inventory served from cache.
+
+    Parameters:
+    - inventory: The inventory returned by get_cached_inventory.
+    - refresh: The refresh Future returned by get_cached_inventory, or None.
+    - timeout: Seconds to wait for the refresh before keeping the cached inventory.
+
+    Returns:
+    A tuple (inventory, changed) where `changed` tells whether the refresh found different targets.
+    """
+    if refresh is None:
+        return inventory, False
+
+    try:
+        fresh = refresh.result(timeout=timeout)
+    except Exception as e:
+        print(f"Inventory refresh failed, using cached targets: {e}")
+        return inventory, False
+
+    if fresh is None:
+        return inventory, False
+
+    merged = dict(inventory)
+    merged.update(fresh)
+    return merged, merged != inventory
+
+
+class InventoryPrefetch:
+    """
+    Discover the targets of several services in the background, e.g. every service of the config
+    while the user is still choosing one, so the targets are usually ready when a service is picked.
+
+    Parameters:
+    - profile_name: AWS CLI named profile used for discovery.
+    - regions: List of AWS regions to look up.
+    - cache_config: The "inventoryCache" section of the config file.
+    - force_refresh: Ignore cached entries and rediscover everything.
+    """
+
+    def __init__(self, profile_name, regions, cache_config=None, force_refresh=False):
+        self.profile_name = profile_name
+        self.regions = regions
+        self.cache_config = cache_config
+        self.force_refresh = force_refresh
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="inventory-prefetch")
+        self._futures = {}
+
+    def start(self, server_type, service_id, discover):
+        """Start discovering the targets of a service unless it was already started."""
+        key = (server_type, service_id)
+        if key not in self._futures:
+            self._futures[key] = self._executor.submit(get_cached_inventory, self.profile_name, server_type, service_id,
+                                                       self.regions, discover, self.cache_config, self.force_refresh)
+
+    def started(self, server_type, service_id):
+        return (server_type, service_id) in self._futures
+
+    def get(self, server_type, service_id, discover):
+        """
+        Return the targets of a service as get_cached_inventory does, waiting for its background
+        discovery, or discovering them now when it wasn't started.
+        """
+        self.start(server_type, service_id, discover)
+        try:
+            return self._futures[(server_type, service_id)].result()
+        except Exception as e:
+            print(f"Discovery failed: {e}")
+            return None, None
+
+    def close(self):
+        # Services nobody picked are not waited for, the ones already running still fill the cache
+        self._executor.shutdown(wait=False, cancel_futures=True)
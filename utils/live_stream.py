@@ -0,0 +1,258 @@
+import asyncio
+import errno
+import os
+import struct
+import subprocess
+import time
+from utils.pcap_merge import PCAP_MAGIC_NS, PCAP_MAGIC_US, PcapFormatError, PcapWriter
+
+
+DEFAULT_MAX_DELAY = 1.0
+DEFAULT_BUFFER_PACKETS = 10000
+DEFAULT_HEADER_TIMEOUT = 30
+FLUSH_INTERVAL = 0.2
+# The session runs the command in a remote pty that would mangle binary data, so pcap bytes travel as hex lines.
+# od only waits for one 32 byte line, unlike base64 which buffers ~30 KB before printing anything
+LIVE_ENCODE_COMMAND = "od -An -v -tx1 -w32"
+
+
+class PcapStreamParser:
+    """
+    Incremental parser of the classic pcap stream written by `tcpdump -w -`.
+
+    Parameters:
+    - name: Name of the stream, used in error messages.
+    """
+
+    def __init__(self, name=""):
+        self.name = name
+        self.linktype = None
+        self.nanosecond = False
+        self._buffer = bytearray()
+        self._record = None
+
+    def feed(self, data):
+        """Add bytes from the stream, returning the packets they completed as (timestamp_ns, caplen, origlen, data)."""
+        buffer = self._buffer
+        buffer += data
+        offset = 0
+        if self._record is None:
+            if len(buffer) < 24:
+                return []
+            if struct.unpack_from("<I", buffer, 0)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+                endian = "<"
+            elif struct.unpack_from(">I", buffer, 0)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+                endian = ">"
+            else:
+                raise PcapFormatError(f"{self.name} is not streaming a pcap")
+            self.nanosecond = struct.unpack_from(endian + "I", buffer, 0)[0] == PCAP_MAGIC_NS
+            self.linktype = struct.unpack_from(endian + "I", buffer, 20)[0] & 0x0FFFFFFF
+            self._record = struct.Struct(endian + "IIII")
+            offset = 24
+
+        record = self._record
+        fraction_ns = 1 if self.nanosecond else 1000
+        end = len(buffer)
+        packets = []
+        while offset + 16 <= end:
+            ts_sec, ts_frac, caplen, origlen = record.unpack_from(buffer, offset)
+            if offset + 16 + caplen > end:
+                break
+            packets.append((ts_sec * 1_000_000_000 + ts_frac * fraction_ns, caplen, origlen,
+                            bytes(buffer[offset + 16:offset + 16 + caplen])))
+            offset += 16 + caplen
+        del buffer[:offset]
+        return packets
+
+
+class LiveStream:
+    """
+    Live tcpdump output of one target, read from the stdout of its session.
+
+    Decoded packets wait in a bounded queue, the per-stream buffer. When it is
+    full the stream stops reading its session, so a target sending faster than
+    the merge writes is held back through its own pipe without slowing the others.
+    Any asyncio StreamReader works as `stdout`, e.g. a local process replaying a pcap.
+
+    Parameters:
+    - target: ECS task id or EC2 instance id, with the capture leg suffix.
+    - stdout: StreamReader of the session output, hex lines as written by LIVE_ENCODE_COMMAND.
+    - buffer_packets: Maximum number of packets buffered for this stream.
+    """
+
+    def __init__(self, target, stdout, buffer_packets=DEFAULT_BUFFER_PACKETS):
+        self.target = target
+        self.stdout = stdout
+        self.queue = asyncio.Queue(buffer_packets)
+        self.parser = PcapStreamParser(target)
+        self.header_received = asyncio.Event()
+        self.last_packet_at = time.monotonic()
+        self.packets = 0
+        self.blocked = False
+        self.ended = False
+        self.error = None
+
+    async def pump(self, arrived):
+        """Read the session until it ends, setting `arrived` whenever a packet is queued."""
+        try:
+            while True:
+                line = await self.stdout.readline()
+                if not line:
+                    break
+                try:
+                    data = bytes.fromhex(line.decode('ascii', 'replace'))
+                except ValueError:
+                    continue  # Session banners and other text printed by the session
+                for packet in self.parser.feed(data):
+                    # A stream held back by its full buffer is not quiet, the merge must wait for it
+                    self.blocked = True
+                    await self.queue.put(packet)
+                    self.blocked = False
+                    self.last_packet_at = time.monotonic()
+                    self.packets += 1
+                    arrived.set()
+                if self.parser.linktype is not None:
+                    self.header_received.set()
+        except PcapFormatError as e:
+            self.error = str(e)
+        finally:
+            self.ended = True
+            self.header_received.set()
+            arrived.set()
+
+
+async def merge_live_streams(streams, output_file, max_delay=DEFAULT_MAX_DELAY, header_timeout=DEFAULT_HEADER_TIMEOUT):
+    """
+    Merge live streams by timestamp into one growing pcap (or a FIFO Wireshark reads) until every stream ends.
+
+    A packet is written once every other stream has a later packet buffered or has
+    been quiet for `max_delay` seconds, so an idle or slow target delays the output
+    by at most `max_delay` instead of stalling it. Packets arriving after that are
+    written anyway and counted as late.
+
+    Parameters:
+    - streams: List of LiveStream.
+    - output_file: Path of the output pcap or FIFO.
+    - max_delay: Seconds to wait for a quiet stream before writing packets of the others.
+    - header_timeout: Seconds to wait for the pcap header of every stream before writing.
+
+    Returns:
+    A dictionary with the number of packets written, late packets, dropped packets and seconds the merge took.
+    """
+    start = time.monotonic()
+    arrived = asyncio.Event()
+    pumps = [asyncio.create_task(stream.pump(arrived)) for stream in streams]
+    stats = {"packets": 0, "late": 0, "dropped": 0}
+    writer = None
+    try:
+        # The output header needs the link types, known from the header of each stream
+        headers = [asyncio.create_task(stream.header_received.wait()) for stream in streams]
+        await asyncio.wait(headers, timeout=header_timeout)
+        for header in headers:
+            header.cancel()
+        linktypes = {(index, 0, 0): stream.parser.linktype for index, stream in enumerate(streams) if stream.parser.linktype is not None}
+        nanosecond = any(stream.parser.nanosecond for stream in streams)
+        # Opening a FIFO blocks until its reader opens it
+        writer = await asyncio.to_thread(PcapWriter, output_file, linktypes, nanosecond)
+
+        heads = {}
+        active = set(range(len(streams)))
+        last_written = 0
+        last_flush = time.monotonic()
+        while active:
+            arrived.clear()
+            for index in list(active):
+                stream = streams[index]
+                if index not in heads and not stream.queue.empty():
+                    heads[index] = stream.queue.get_nowait()
+                if index not in heads and stream.ended and stream.queue.empty():
+                    active.discard(index)
+
+            now = time.monotonic()
+            waiting_on = [streams[index] for index in active
+                          if index not in heads and (streams[index].blocked or now - streams[index].last_packet_at < max_delay)]
+            if heads and not waiting_on:
+                index = min(heads, key=lambda i: heads[i][0])
+                timestamp_ns, caplen, origlen, data = heads.pop(index)
+                try:
+                    writer.write(timestamp_ns, caplen, origlen, data, (index, 0, 0), streams[index].parser.linktype)
+                except PcapFormatError:
+                    stats["dropped"] += 1  # Link type that showed up after the header was written
+                    continue
+                stats["packets"] += 1
+                if timestamp_ns < last_written:
+                    stats["late"] += 1
+                last_written = max(last_written, timestamp_ns)
+                if now - last_flush >= FLUSH_INTERVAL:
+                    await asyncio.to_thread(writer.flush)
+                    last_flush = time.monotonic()
+                continue
+
+            # Nothing can be written yet: flush what was, then wait for packets or a stream to go quiet
+            await asyncio.to_thread(writer.flush)
+            last_flush = time.monotonic()
+            timeout = min((max_delay - (now - stream.last_packet_at) for stream in waiting_on if not stream.blocked), default=max_delay)
+            try:
+                await asyncio.wait_for(arrived.wait(), max(timeout, 0.01))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        for pump in pumps:
+            pump.cancel()
+        if writer:
+            writer.close()
+
+    for stream in streams:
+        if stream.error:
+            print(f"Live stream of {stream.target} stopped: {stream.error}")
+    stats["seconds"] = time.monotonic() - start
+    return stats
+
+
+class LiveOutput:
+    """
+    Output of the live merge: a FIFO with Wireshark reading it, or a regular growing pcap.
+
+    Parameters:
+    - path: Path of the output.
+    - mode: "fifo" to start Wireshark on a named pipe, "file" to only write a growing pcap.
+    - wireshark_filter: Display filter given to Wireshark.
+    """
+
+    def __init__(self, path, mode="fifo", wireshark_filter=None):
+        self.path = path
+        self.mode = mode
+        self.wireshark_filter = wireshark_filter
+        self.wireshark = None
+        self._reader_probe = None
+
+    async def open(self, timeout=DEFAULT_HEADER_TIMEOUT):
+        """Create the output, in fifo mode start Wireshark and wait until it reads the pipe."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if self.mode != "fifo":
+            return
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.mkfifo(self.path)
+        wireshark_command = ['wireshark', '-k', '-i', self.path]
+        if self.wireshark_filter:
+            wireshark_command.extend(['-Y', self.wireshark_filter])
+        self.wireshark = subprocess.Popen(wireshark_command)
+
+        # A non-blocking open only succeeds once a reader has the pipe open. The probe stays open
+        # so Wireshark doesn't see the end of the pipe before the merge opens it for writing
+        deadline = time.monotonic() + timeout
+        while self._reader_probe is None:
+            try:
+                self._reader_probe = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+                if self.wireshark.poll() is not None or time.monotonic() > deadline:
+                    raise OSError(f"Wireshark did not open {self.path}")
+                await asyncio.sleep(0.1)
+
+    def close(self):
+        if self._reader_probe is not None:
+            os.close(self._reader_probe)
+            self._reader_probe = None
@@ -0,0 +1,182 @@
+import re
+import socket
+import struct
+
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+SIP_METHODS = (b"INVITE", b"ACK", b"BYE", b"CANCEL", b"OPTIONS", b"REGISTER", b"PRACK", b"SUBSCRIBE",
+               b"NOTIFY", b"PUBLISH", b"INFO", b"REFER", b"MESSAGE", b"UPDATE")
+SIP_START = tuple(method + b" " for method in SIP_METHODS) + (b"SIP/2.0 ",)
+
+_CALL_ID_RE = re.compile(rb"^(?:call-id|i)[ \t]*:[ \t]*(\S+)", re.IGNORECASE | re.MULTILINE)
+_CSEQ_RE = re.compile(rb"^cseq[ \t]*:[ \t]*(\d+)[ \t]+(\w+)", re.IGNORECASE | re.MULTILINE)
+
+
+def network_layer_offset(linktype, data):
+    """Offset of the IP header in a frame, or None for link types we can't strip."""
+    if linktype == LINKTYPE_LINUX_SLL:
+        return 16
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return 20
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        return 0
+    if linktype == LINKTYPE_ETHERNET:
+        offset = 14
+        # Skip 802.1Q/802.1ad tags
+        while len(data) >= offset + 4 and data[offset - 2:offset] in (b"\x81\x00", b"\x88\xa8"):
+            offset += 4
+        return offset
+    return None
+
+
+def parse_transport(data, linktype):
+    """
+    Decode the IP and UDP/TCP headers of a frame.
+
+    Returns:
+    A tuple (protocol, src_ip, src_port, dst_ip, dst_port, payload), or None when
+    the frame isn't UDP/TCP over IPv4/IPv6 (or is a non-first IPv4 fragment).
+    """
+    offset = network_layer_offset(linktype, data)
+    if offset is None or len(data) < offset + 20:
+        return None
+
+    version = data[offset] >> 4
+    if version == 4:
+        header_length = (data[offset] & 0x0F) * 4
+        total_length, fragment, protocol = struct.unpack_from(">H2xH1xB", data, offset + 2)
+        if fragment & 0x1FFF:
+            return None
+        src_ip = socket.inet_ntop(socket.AF_INET, bytes(data[offset + 12:offset + 16]))
+        dst_ip = socket.inet_ntop(socket.AF_INET, bytes(data[offset + 16:offset + 20]))
+        end = min(len(data), offset + total_length) if total_length else len(data)
+        offset += header_length
+    elif version == 6 and len(data) >= offset + 40:
+        payload_length, protocol = struct.unpack_from(">HB", data, offset + 4)
+        src_ip = socket.inet_ntop(socket.AF_INET6, bytes(data[offset + 8:offset + 24]))
+        dst_ip = socket.inet_ntop(socket.AF_INET6, bytes(data[offset + 24:offset + 40]))
+        end = min(len(data), offset + 40 + payload_length)
+        offset += 40
+    else:
+        return None
+
+    if protocol == IPPROTO_UDP and end >= offset + 8:
+        src_port, dst_port = struct.unpack_from(">HH", data, offset)
+        return "udp", src_ip, src_port, dst_ip, dst_port, data[offset + 8:end]
+    if protocol == IPPROTO_TCP and end >= offset + 20:
+        src_port, dst_port = struct.unpack_from(">HH", data, offset)
+        data_offset = (data[offset + 12] >> 4) * 4
+        return "tcp", src_ip, src_port, dst_ip, dst_port, data[offset + data_offset:end]
+    return None
+
+
+def is_sip(payload):
+    return bytes(payload[:10]).startswith(SIP_START)
+
+
+def parse_sip(payload):
+    """
+    Extract the fields we index from a SIP message.
+
+    Returns:
+    A dictionary with "call_id", "method" (request method, or CSeq method for responses),
+    "status" (response code or None), "cseq" and "media" (list of (ip, port) RTP
+    endpoints from the SDP body), or None when the payload isn't SIP.
+    """
+    payload = bytes(payload)
+    if not payload.startswith(SIP_START):
+        return None
+
+    header_end = payload.find(b"\r\n\r\n")
+    headers = payload if header_end < 0 else payload[:header_end]
+    body = b"" if header_end < 0 else payload[header_end + 4:]
+
+    call_id = _CALL_ID_RE.search(headers)
+    if not call_id:
+        return None
+
+    first_line = headers.split(b"\r\n", 1)[0]
+    cseq = _CSEQ_RE.search(headers)
+    status = None
+    if first_line.startswith(b"SIP/2.0 "):
+        try:
+            status = int(first_line[8:11])
+        except ValueError:
+            return None
+        method = cseq.group(2).decode(errors="replace").upper() if cseq else None
+    else:
+        method = first_line.split(b" ", 1)[0].decode()
+
+    return {
+        "call_id": call_id.group(1).decode(errors="replace"),
+        "method": method,
+        "status": status,
+        "cseq": int(cseq.group(1)) if cseq else None,
+        "media": parse_sdp_media(body) if body else [],
+    }
+
+
+def sip_call_id(payload):
+    """Call-ID of a SIP message, without parsing the rest of it, or None when the payload isn't SIP."""
+    payload = bytes(payload)
+    if not payload.startswith(SIP_START):
+        return None
+    header_end = payload.find(b"\r\n\r\n")
+    call_id = _CALL_ID_RE.search(payload, 0, header_end if header_end >= 0 else len(payload))
+    return call_id.group(1).decode(errors="replace") if call_id else None
+
+
+def parse_sdp_media(body):
+    """
+    Return the (ip, port) RTP endpoints announced in an SDP body, and their RTCP endpoints.
+
+    RTCP uses the a=rtcp attribute when present and port + 1 otherwise.
+    """
+    endpoints = []
+    session_ip = None
+    media_ip = None
+    media_port = None
+    rtcp_port = None
+
+    def flush():
+        if media_port:
+            ip = media_ip or session_ip
+            if ip:
+                endpoints.append((ip, media_port))
+                endpoints.append((ip, rtcp_port or media_port + 1))
+
+    for line in body.split(b"\n"):
+        line = line.strip()
+        if line.startswith(b"c="):
+            parts = line[2:].split()
+            if len(parts) >= 3:
+                ip = parts[2].split(b"/")[0].decode(errors="replace")
+                if media_port is None:
+                    session_ip = ip
+                else:
+                    media_ip = ip
+        elif line.startswith(b"m="):
+            flush()
+            parts = line[2:].split()
+            media_ip = None
+            rtcp_port = None
+            try:
+                media_port = int(parts[1].split(b"/")[0]) if len(parts) > 1 else None
+            except ValueError:
+                media_port = None
+        elif line.startswith(b"a=rtcp:"):
+            try:
+                rtcp_port = int(line[7:].split()[0])
+            except (ValueError, IndexError):
+                pass
+    flush()
+    return [endpoint for endpoint in endpoints if endpoint[1]]
@@ -0,0 +1,620 @@
+import collections
+import heapq
+import itertools
+import mmap
+import os
+import struct
+import time
+from array import array
+from utils.compression import detect_compression, open_decompressed
+from utils.packets import network_layer_offset
+
+
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_IDB = 0x00000001
+PCAPNG_OBSOLETE_PB = 0x00000002
+PCAPNG_EPB = 0x00000006
+
+PCAP_GLOBAL_HEADER = struct.Struct("<IHHiIII")
+PCAP_RECORD_HEADER = struct.Struct("<IIII")
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024
+RELEASE_WINDOW = 4 * 1024 * 1024
+
+
+class PcapFormatError(ValueError):
+    """Raised when a file is neither a valid pcap nor pcapng capture."""
+
+
+class PcapReader:
+    """
+    Memory-mapped reader of a pcap or pcapng file.
+
+    Iterating yields tuples (timestamp_ns, source_index, sequence, caplen, origlen, data, link_id, record_offset)
+    in file order, so several readers can be merged with heapq.merge without a key function.
+    `link_id` identifies the interface a packet was captured on and maps to
+    its link type through the `linktypes` dictionary. `record_offset` is the
+    file offset of the packet record (pcap) or block (pcapng).
+
+    Parameters:
+    - path: Path of the capture file.
+    - source_index: Position of the file among the merged inputs, used to break timestamp ties.
+    """
+
+    def __init__(self, path, source_index=0):
+        self.path = path
+        self.source_index = source_index
+        self.linktypes = {}
+        self.nanosecond = False
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._released = 0
+        if size and hasattr(mmap, "MADV_SEQUENTIAL"):
+            self._mm.madvise(mmap.MADV_SEQUENTIAL)
+        if size >= 4 and struct.unpack_from("<I", self._mm, 0)[0] == PCAPNG_SHB:
+            self.format = "pcapng"
+            self._scan_pcapng_interfaces(self._iter_block_data())
+        else:
+            self.format = "pcap"
+            self._read_pcap_header(self._mm)
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        if self.format == "pcapng":
+            return self._iter_pcapng()
+        return self._iter_pcap()
+
+    def _release(self, offset):
+        # Drop the mapped pages already consumed so resident memory stays bounded on large inputs
+        if offset - self._released < RELEASE_WINDOW or not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        end = offset - offset % mmap.PAGESIZE
+        self._mm.madvise(mmap.MADV_DONTNEED, self._released, end - self._released)
+        self._released = end
+
+    def records(self):
+        """
+        Iterate over the packet records without copying their data, yielding tuples
+        (timestamp_ns, data_offset, caplen, link_id) where `data_offset` is the file
+        offset of the packet data, e.g. to build columnar arrays over the mapped file.
+        """
+        mm = self._mm
+        end = len(mm)
+        if self.format == "pcap":
+            record = struct.Struct(self._endian + "IIII")
+            fraction_ns = 1 if self.nanosecond else 1000
+            link_id = (self.source_index, 0, 0)
+            offset = PCAP_GLOBAL_HEADER.size
+            while offset + 16 <= end:
+                ts_sec, ts_frac, caplen, _ = record.unpack_from(mm, offset)
+                offset += 16
+                if offset + caplen > end:
+                    break
+                yield ts_sec * 1_000_000_000 + ts_frac * fraction_ns, offset, caplen, link_id
+                offset += caplen
+            return
+
+        section = -1
+        interfaces = []
+        for block_type, offset, block_length, endian in self._iter_blocks():
+            if block_type == PCAPNG_SHB:
+                section += 1
+                interfaces = []
+            elif block_type == PCAPNG_IDB:
+                linktype, tsresol, tsoffset = self._parse_idb(mm, offset, block_length, endian)
+                link_id = (self.source_index, section, len(interfaces))
+                self.linktypes[link_id] = linktype
+                interfaces.append((link_id, self._timestamp_converter(tsresol, tsoffset)))
+            elif block_type == PCAPNG_EPB:
+                interface_id, ts_high, ts_low, caplen = struct.unpack_from(endian + "IIII", mm, offset + 8)
+                link_id, to_ns = interfaces[interface_id]
+                yield to_ns((ts_high << 32) | ts_low), offset + 28, caplen, link_id
+            elif block_type == PCAPNG_OBSOLETE_PB:
+                interface_id, _, ts_high, ts_low, caplen = struct.unpack_from(endian + "HHIII", mm, offset + 8)
+                link_id, to_ns = interfaces[interface_id]
+                yield to_ns((ts_high << 32) | ts_low), offset + 28, caplen, link_id
+
+    def record_offsets(self):
+        """
+        File offsets of every packet record of a classic pcap file, found in one pass reading
+        only the captured lengths. The record headers can then be decoded all at once.
+        """
+        if self.format != "pcap":
+            raise PcapFormatError(f"{self.path} is not a classic pcap file")
+        mm = self._mm
+        end = len(mm)
+        caplen_field = struct.Struct(self._endian + "I")
+        offsets = array('q')
+        append = offsets.append
+        offset = PCAP_GLOBAL_HEADER.size
+        while offset + 16 <= end:
+            next_offset = offset + 16 + caplen_field.unpack_from(mm, offset + 8)[0]
+            if next_offset > end:
+                break
+            append(offset)
+            offset = next_offset
+        return offsets
+
+    ########################################## pcap
+    def _read_pcap_header(self, header):
+        if len(header) < PCAP_GLOBAL_HEADER.size:
+            raise PcapFormatError(f"{self.path} is too short to be a pcap file")
+        magic_le = struct.unpack_from("<I", header, 0)[0]
+        magic_be = struct.unpack_from(">I", header, 0)[0]
+        if magic_le in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            self._endian = "<"
+            magic = magic_le
+        elif magic_be in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            self._endian = ">"
+            magic = magic_be
+        else:
+            raise PcapFormatError(f"{self.path} is not a pcap/pcapng file")
+        self.nanosecond = magic == PCAP_MAGIC_NS
+        _, _, _, _, _, self.snaplen, linktype = struct.unpack_from(self._endian + "IHHiIII", header, 0)
+        self.linktypes[(self.source_index, 0, 0)] = linktype & 0x0FFFFFFF
+
+    def _iter_pcap(self):
+        mm = self._mm
+        end = len(mm)
+        record = struct.Struct(self._endian + "IIII")
+        fraction_ns = 1 if self.nanosecond else 1000
+        link_id = (self.source_index, 0, 0)
+        source_index = self.source_index
+        offset = PCAP_GLOBAL_HEADER.size
+        sequence = 0
+
+        while offset + 16 <= end:
+            ts_sec, ts_frac, caplen, origlen = record.unpack_from(mm, offset)
+            offset += 16
+            if offset + caplen > end:
+                break  # Truncated last packet, e.g. a capture still being written
+            yield (ts_sec * 1_000_000_000 + ts_frac * fraction_ns, source_index, sequence,
+                   caplen, origlen, mm[offset:offset + caplen], link_id, offset - 16)
+            offset += caplen
+            sequence += 1
+            if offset - self._released >= RELEASE_WINDOW:
+                self._release(offset)
+
+    ########################################## pcapng
+    def _iter_blocks(self):
+        mm = self._mm
+        end = len(mm)
+        offset = 0
+        endian = "<"
+        while offset + 12 <= end:
+            block_type = struct.unpack_from(endian + "I", mm, offset)[0]
+            if block_type == PCAPNG_SHB:
+                # The byte-order magic of every section tells its endianness
+                endian = "<" if struct.unpack_from("<I", mm, offset + 8)[0] == PCAPNG_BYTE_ORDER_MAGIC else ">"
+            block_length = struct.unpack_from(endian + "I", mm, offset + 4)[0]
+            if block_length < 12 or offset + block_length > end:
+                break
+            yield block_type, offset, block_length, endian
+            offset += block_length
+            if offset - self._released >= RELEASE_WINDOW:
+                self._release(offset)
+
+    def _iter_block_data(self):
+        # Blocks as (block_type, buffer, position in buffer, block_length, endian, file offset)
+        mm = self._mm
+        for block_type, offset, block_length, endian in self._iter_blocks():
+            yield block_type, mm, offset, block_length, endian, offset
+
+    @staticmethod
+    def _parse_idb(buf, offset, block_length, endian):
+        linktype = struct.unpack_from(endian + "H", buf, offset + 8)[0]
+        tsresol = 6
+        tsoffset = 0
+        option_offset = offset + 16
+        option_end = offset + block_length - 4
+        while option_offset + 4 <= option_end:
+            code, length = struct.unpack_from(endian + "HH", buf, option_offset)
+            if code == 0:
+                break
+            value_offset = option_offset + 4
+            if code == 9 and length >= 1:
+                tsresol = buf[value_offset]
+            elif code == 14 and length >= 8:
+                tsoffset = struct.unpack_from(endian + "q", buf, value_offset)[0]
+            option_offset = value_offset + ((length + 3) & ~3)
+        return linktype, tsresol, tsoffset
+
+    @staticmethod
+    def _timestamp_converter(tsresol, tsoffset):
+        offset_ns = tsoffset * 1_000_000_000
+        if tsresol & 0x80:
+            shift = tsresol & 0x7F
+            return lambda ts: ((ts * 1_000_000_000) >> shift) + offset_ns
+        if tsresol <= 9:
+            factor = 10 ** (9 - tsresol)
+            return lambda ts: ts * factor + offset_ns
+        divisor = 10 ** (tsresol - 9)
+        return lambda ts: ts // divisor + offset_ns
+
+    def _scan_pcapng_interfaces(self, blocks):
+        # Interfaces declared before the first packet, enough to choose the output format
+        section = -1
+        for block_type, buf, position, block_length, endian, _ in blocks:
+            if block_type == PCAPNG_SHB:
+                section += 1
+                interface = 0
+            elif block_type == PCAPNG_IDB:
+                linktype, tsresol, _ = self._parse_idb(buf, position, block_length, endian)
+                self.linktypes[(self.source_index, section, interface)] = linktype
+                self.nanosecond = self.nanosecond or tsresol != 6
+                interface += 1
+            elif block_type in (PCAPNG_EPB, PCAPNG_OBSOLETE_PB):
+                break
+        if section < 0:
+            raise PcapFormatError(f"{self.path} is not a pcap/pcapng file")
+
+    def _iter_pcapng(self):
+        source_index = self.source_index
+        section = -1
+        interfaces = []
+        sequence = 0
+
+        for block_type, buf, position, block_length, endian, offset in self._iter_block_data():
+            if block_type == PCAPNG_SHB:
+                section += 1
+                interfaces = []
+            elif block_type == PCAPNG_IDB:
+                linktype, tsresol, tsoffset = self._parse_idb(buf, position, block_length, endian)
+                link_id = (source_index, section, len(interfaces))
+                self.linktypes[link_id] = linktype
+                interfaces.append((link_id, self._timestamp_converter(tsresol, tsoffset)))
+            elif block_type == PCAPNG_EPB:
+                interface_id, ts_high, ts_low, caplen, origlen = struct.unpack_from(endian + "IIIII", buf, position + 8)
+                link_id, to_ns = interfaces[interface_id]
+                data_offset = position + 28
+                yield (to_ns((ts_high << 32) | ts_low), source_index, sequence, caplen, origlen,
+                       buf[data_offset:data_offset + caplen], link_id, offset)
+                sequence += 1
+            elif block_type == PCAPNG_OBSOLETE_PB:
+                interface_id, _, ts_high, ts_low, caplen, origlen = struct.unpack_from(endian + "HHIIII", buf, position + 8)
+                link_id, to_ns = interfaces[interface_id]
+                data_offset = position + 28
+                yield (to_ns((ts_high << 32) | ts_low), source_index, sequence, caplen, origlen,
+                       buf[data_offset:data_offset + caplen], link_id, offset)
+                sequence += 1
+
+
+class CompressedPcapReader(PcapReader):
+    """
+    Streaming reader of a gzip or zstd compressed pcap or pcapng file.
+
+    Packets are decompressed as the merge consumes them, so no uncompressed
+    copy is ever written to disk. Iterating yields the same tuples as PcapReader,
+    `record_offset` being the offset in the uncompressed stream.
+
+    Parameters:
+    - path: Path of the compressed capture file.
+    - source_index: Position of the file among the merged inputs, used to break timestamp ties.
+    """
+
+    def __init__(self, path, source_index=0):
+        self.path = path
+        self.source_index = source_index
+        self.linktypes = {}
+        self.nanosecond = False
+        self.uncompressed_bytes = 0
+        self._stream = open_decompressed(path)
+        self._head = self._read(4)
+        if len(self._head) == 4 and struct.unpack("<I", self._head)[0] == PCAPNG_SHB:
+            self.format = "pcapng"
+            # Blocks read while looking for the interfaces are replayed when iterating
+            lookahead = []
+            for block in self._read_blocks():
+                lookahead.append(block)
+                if block[0] in (PCAPNG_EPB, PCAPNG_OBSOLETE_PB):
+                    break
+            self._scan_pcapng_interfaces(lookahead)
+            self._blocks = itertools.chain(lookahead, self._read_blocks())
+        else:
+            self.format = "pcap"
+            self._read_pcap_header(self._head + self._read(PCAP_GLOBAL_HEADER.size - 4))
+
+    def close(self):
+        self._stream.close()
+
+    def _read(self, size):
+        chunks = []
+        remaining = size
+        try:
+            while remaining:
+                chunk = self._stream.read(remaining)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                remaining -= len(chunk)
+        except EOFError:
+            pass  # Truncated compressed stream, keep what was decompressed
+        data = b"".join(chunks)
+        self.uncompressed_bytes += len(data)
+        return data
+
+    def _iter_pcap(self):
+        record = struct.Struct(self._endian + "IIII")
+        fraction_ns = 1 if self.nanosecond else 1000
+        link_id = (self.source_index, 0, 0)
+        source_index = self.source_index
+        read = self._read
+        offset = PCAP_GLOBAL_HEADER.size
+        sequence = 0
+
+        while True:
+            header = read(16)
+            if len(header) < 16:
+                break
+            ts_sec, ts_frac, caplen, origlen = record.unpack(header)
+            data = read(caplen)
+            if len(data) < caplen:
+                break  # Truncated last packet
+            yield (ts_sec * 1_000_000_000 + ts_frac * fraction_ns, source_index, sequence,
+                   caplen, origlen, data, link_id, offset)
+            offset += 16 + caplen
+            sequence += 1
+
+    def _read_blocks(self):
+        # Decompress one block at a time, the first 4 bytes were already read to detect the format
+        offset = self.uncompressed_bytes - len(self._head)
+        while True:
+            start = self._head + self._read(12 - len(self._head))
+            self._head = b""
+            if len(start) < 12:
+                return
+            block_type = struct.unpack_from("<I", start, 0)[0]
+            if block_type == PCAPNG_SHB:
+                self._block_endian = "<" if struct.unpack_from("<I", start, 8)[0] == PCAPNG_BYTE_ORDER_MAGIC else ">"
+            endian = self._block_endian
+            block_type, block_length = struct.unpack_from(endian + "II", start, 0)
+            if block_length < 12:
+                return
+            block = start + self._read(block_length - 12)
+            if len(block) < block_length:
+                return
+            yield block_type, block, 0, block_length, endian, offset
+            offset += block_length
+
+    def _iter_block_data(self):
+        return self._blocks
+
+
+def open_capture(path, source_index=0):
+    """
+    Open a capture file with the reader matching it, streaming compressed files.
+
+    Parameters:
+    - path: Path of the pcap/pcapng file, optionally gzip or zstd compressed.
+    - source_index: Position of the file among the merged inputs.
+
+    Returns:
+    A PcapReader or CompressedPcapReader.
+    """
+    if detect_compression(path):
+        return CompressedPcapReader(path, source_index)
+    return PcapReader(path, source_index)
+
+
+class PcapWriter:
+    """
+    Write packets into a classic pcap file when every input shares one link type,
+    or into a pcapng file with one interface per input interface otherwise.
+
+    Parameters:
+    - path: Output file path.
+    - linktypes: Dictionary of {link_id: linktype} known before writing.
+    - nanosecond: Keep nanosecond timestamps instead of microseconds.
+    - snaplen: Snapshot length written to the file header.
+    """
+
+    def __init__(self, path, linktypes, nanosecond=False, snaplen=262144):
+        self.path = path
+        self.linktypes = dict(linktypes)
+        self.nanosecond = nanosecond
+        self.format = "pcap" if len(set(linktypes.values())) <= 1 else "pcapng"
+        self._file = open(path, 'wb', buffering=WRITE_BUFFER_SIZE)
+        self._interface_ids = {}
+        self.packets = 0
+        self.bytes = 0
+        self.position = 0
+        self.interface_block_offsets = []
+
+        if self.format == "pcap":
+            self._linktype = next(iter(linktypes.values()), 1)
+            self._file.write(PCAP_GLOBAL_HEADER.pack(PCAP_MAGIC_NS if nanosecond else PCAP_MAGIC_US,
+                                                     2, 4, 0, 0, snaplen, self._linktype))
+            self.position = PCAP_GLOBAL_HEADER.size
+            self._divisor = 1 if nanosecond else 1000
+        else:
+            shb_body = struct.pack("<IHHq", PCAPNG_BYTE_ORDER_MAGIC, 1, 0, -1)
+            self._write_block(PCAPNG_SHB, shb_body)
+            for link_id in linktypes:
+                self._add_interface(link_id, linktypes[link_id], snaplen)
+
+    def _write_block(self, block_type, body):
+        length = 12 + len(body)
+        self._file.write(struct.pack("<II", block_type, length) + body + struct.pack("<I", length))
+        self.position += length
+
+    def _add_interface(self, link_id, linktype, snaplen=262144):
+        # if_tsresol option: 9 for nanoseconds
+        options = struct.pack("<HHB3x", 9, 1, 9) + struct.pack("<HH", 0, 0)
+        self.interface_block_offsets.append(self.position)
+        self._write_block(PCAPNG_IDB, struct.pack("<HHI", linktype, 0, snaplen) + options)
+        self._interface_ids[link_id] = len(self._interface_ids)
+
+    def write(self, timestamp_ns, caplen, origlen, data, link_id, linktype=None):
+        """Write one packet, returning the file offset of its record."""
+        if self.format == "pcap":
+            if linktype is not None and linktype != self._linktype:
+                raise PcapFormatError(f"Link type {linktype} found mid-file, can't write it into a single pcap")
+            ts_sec, ts_frac = divmod(timestamp_ns, 1_000_000_000)
+            self._file.write(PCAP_RECORD_HEADER.pack(ts_sec, ts_frac // self._divisor, caplen, origlen))
+            self._file.write(data)
+            length = 16 + caplen
+        else:
+            if link_id not in self._interface_ids:
+                self._add_interface(link_id, linktype)
+            padding = b"\x00" * (-caplen % 4)
+            length = 32 + caplen + len(padding)
+            self._file.write(struct.pack("<IIIIIII", PCAPNG_EPB, length, self._interface_ids[link_id],
+                                         timestamp_ns >> 32, timestamp_ns & 0xFFFFFFFF, caplen, origlen))
+            self._file.write(data)
+            self._file.write(padding + struct.pack("<I", length))
+        offset = self.position
+        self.position += length
+        self.packets += 1
+        self.bytes += caplen
+        return offset
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def merge_pcaps(input_files, output_file, deduplicator=None, indexer=None, time_indexer=None):
+    """
+    Merge pcap/pcapng files into one file ordered by timestamp.
+
+    A heap-based k-way merge streams packets from memory-mapped inputs, so
+    memory use only depends on the number of inputs, not on their size.
+    gzip/zstd compressed inputs are decompressed on the fly.
+
+    Parameters:
+    - input_files: List of pcap/pcapng files to merge.
+    - output_file: Path of the merged file.
+    - deduplicator: Optional PacketDeduplicator dropping packets captured by several targets.
+    - indexer: Optional CallIndexer fed with every written packet, saved next to the output.
+    - time_indexer: Optional TimeIndexer fed with the offset and timestamp of every written packet, saved next to the output.
+
+    Returns:
+    A dictionary with the number of packets, input bytes, seconds the merge took,
+    duplicates dropped per input file and the compressed/uncompressed bytes of compressed inputs.
+    """
+    start = time.monotonic()
+    readers = {}
+    try:
+        for index, path in enumerate(input_files):
+            try:
+                readers[index] = open_capture(path, index)
+            except PcapFormatError as e:
+                print(f"Skipping {path}: {e}")
+
+        linktypes = {}
+        for reader in readers.values():
+            linktypes.update(reader.linktypes)
+        nanosecond = any(reader.nanosecond for reader in readers.values())
+
+        with PcapWriter(output_file, linktypes, nanosecond) as writer:
+            write = writer.write
+            for timestamp_ns, source_index, _, caplen, origlen, data, link_id, _ in heapq.merge(*readers.values()):
+                linktype = readers[source_index].linktypes[link_id]
+                if deduplicator and deduplicator.is_duplicate(timestamp_ns, source_index, data, linktype):
+                    continue
+                offset = write(timestamp_ns, caplen, origlen, data, link_id, linktype)
+                if indexer:
+                    indexer.add(offset, data, linktype)
+                if time_indexer:
+                    time_indexer.add(offset, timestamp_ns)
+
+        if indexer:
+            indexer.save(output_file, writer.format, writer.interface_block_offsets)
+        if time_indexer:
+            time_indexer.save(output_file, writer.format, writer.interface_block_offsets)
+
+        compressed = [reader for reader in readers.values() if isinstance(reader, CompressedPcapReader)]
+        return {
+            "packets": writer.packets,
+            "bytes": sum(os.path.getsize(path) for path in input_files),
+            "seconds": time.monotonic() - start,
+            "duplicates": {input_files[index]: count for index, count in deduplicator.dropped.items()} if deduplicator else {},
+            "compression": {
+                "files": len(compressed),
+                "bytes": sum(os.path.getsize(reader.path) for reader in compressed),
+                "uncompressed_bytes": sum(reader.uncompressed_bytes for reader in compressed),
+            },
+        }
+    finally:
+        for reader in readers.values():
+            reader.close()
+
+
+class PacketDeduplicator:
+    """
+    Drop packets already seen from another capture within a short time window.
+
+    The same packet captured on two targets differs in its link-layer header
+    and, when routed, in its IP TTL/hop limit and header checksum, so only the
+    network layer is hashed with those fields masked. Hashes live in a FIFO
+    bounded both by time (`window_ms`) and by count (`max_entries`), so memory
+    stays fixed whatever the capture size.
+
+    Parameters:
+    - window_ms: How far apart in time two copies of a packet can be.
+    - max_entries: Maximum number of hashes remembered at once.
+    - same_source: Also drop repeats within one capture (e.g. seen on two interfaces).
+    """
+
+    def __init__(self, window_ms=50, max_entries=1_000_000, same_source=False):
+        self.window_ns = int(window_ms * 1_000_000)
+        self.max_entries = max_entries
+        self.same_source = same_source
+        self._recent = collections.deque()
+        self._seen = {}
+        self.dropped = collections.Counter()
+
+    def _digest(self, data, linktype):
+        offset = network_layer_offset(linktype, data)
+        if offset is None:
+            return hash(bytes(data))
+        version = data[offset] >> 4 if len(data) > offset else 0
+        if version == 4 and len(data) >= offset + 20:
+            # Mask TTL (byte 8) and header checksum (bytes 10-11)
+            return hash((bytes(data[offset:offset + 8]), bytes(data[offset + 9:offset + 10]), bytes(data[offset + 12:])))
+        if version == 6 and len(data) >= offset + 40:
+            # Mask the hop limit (byte 7)
+            return hash((bytes(data[offset:offset + 7]), bytes(data[offset + 8:])))
+        return hash(bytes(data[offset:]))
+
+    def is_duplicate(self, timestamp_ns, source_index, data, linktype):
+        recent = self._recent
+        seen = self._seen
+        horizon = timestamp_ns - self.window_ns
+        while recent and (recent[0][0] < horizon or len(recent) >= self.max_entries):
+            old_entry = recent.popleft()
+            # Only forget the hash if no newer sighting replaced it
+            if seen.get(old_entry[1]) is old_entry:
+                del seen[old_entry[1]]
+
+        digest = self._digest(data, linktype)
+        first_seen = seen.get(digest)
+        if first_seen is not None and (self.same_source or first_seen[2] != source_index):
+            self.dropped[source_index] += 1
+            return True
+
+        entry = (timestamp_ns, digest, source_index)
+        seen[digest] = entry
+        recent.append(entry)
+        return False
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+MANIFEST_FILE_NAME = ".ecx_manifest.json"
+PARTIAL_SUFFIX = ".part"
+DEFAULT_CHUNKSIZE = 16 * 1024 * 1024
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+class DownloadManifest:
+    """
+    Per-capture record of what has been fetched from S3, stored next to the pcaps.
+
+    Every entry is keyed by object key and holds the object ETag and size, how many
+    leading bytes of the partial file are known to be complete, and whether the
+    download finished.
+    """
+
+    def __init__(self, local_folder):
+        self.path = os.path.join(local_folder, MANIFEST_FILE_NAME)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, 'r') as file:
+                self.entries = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def get(self, key):
+        with self._lock:
+            return dict(self.entries.get(key, {}))
+
+    def update(self, key, **fields):
+        with self._lock:
+            self.entries.setdefault(key, {}).update(fields)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as file:
+                json.dump(self.entries, file, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def _md5_matches(local_path, etag):
+    # Only single-part uploads have the object MD5 as ETag
+    if "-" in etag:
+        return False
+    md5 = hashlib.md5()
+    with open(local_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            md5.update(block)
+    return md5.hexdigest() == etag
+
+
+def is_already_downloaded(local_path, manifest_entry, size, etag):
+    """Check whether the local file is the same object as the one in S3."""
+    if not os.path.exists(local_path) or os.path.getsize(local_path) != size:
+        return False
+    if manifest_entry.get("complete") and manifest_entry.get("etag") == etag:
+        return True
+    return _md5_matches(local_path, etag)
+
+
+def resumable_download(s3_client, bucket_name, key, local_path, manifest, chunksize=DEFAULT_CHUNKSIZE,
+                       max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    Download an S3 object, resuming from the bytes already on disk.
+
+    The object is fetched with ranged GETs of `chunksize` bytes, up to
+    `max_concurrency` at a time, written in place into `<local_path>.part`.
+    The manifest keeps the number of leading bytes known to be complete so an
+    interrupted download restarts from there, as long as the object ETag did
+    not change. Ranged GETs use If-Match so a replaced object is never mixed
+    with the old one.
+
+    Returns:
+    A tuple (local_path, bytes_fetched). bytes_fetched is 0 when the file was already there.
+    """
+    head = s3_client.head_object(Bucket=bucket_name, Key=key)
+    size = head['ContentLength']
+    etag = head['ETag'].strip('"')
+    entry = manifest.get(key)
+
+    if is_already_downloaded(local_path, entry, size, etag):
+        if not entry.get("complete"):
+            manifest.update(key, etag=etag, size=size, completeBytes=size, complete=True)
+        return local_path, 0
+
+    partial_path = local_path + PARTIAL_SUFFIX
+    offset = 0
+    if entry.get("etag") == etag and os.path.exists(partial_path):
+        offset = min(entry.get("completeBytes", 0), os.path.getsize(partial_path))
+    manifest.update(key, etag=etag, size=size, completeBytes=offset, complete=False)
+
+    mode = 'r+b' if offset and os.path.exists(partial_path) else 'wb'
+    with open(partial_path, mode) as file:
+        file.truncate(size)
+
+    ranges = [(start, min(start + chunksize, size) - 1) for start in range(offset, size, chunksize)]
+    done = set()
+    state = {"watermark": offset}
+    lock = threading.Lock()
+
+    def fetch(byte_range):
+        start, end = byte_range
+        body = s3_client.get_object(Bucket=bucket_name, Key=key, Range=f"bytes={start}-{end}", IfMatch=etag)['Body']
+        # A handle per range, positioned writes that work on every platform
+        with open(partial_path, 'r+b') as file:
+            file.seek(start)
+            for block in body.iter_chunks(1024 * 1024):
+                file.write(block)
+            position = file.tell()
+            file.flush()
+            os.fsync(file.fileno())
+        if position != end + 1:
+            raise IOError(f"Short read on {key} bytes {start}-{end}")
+        with lock:
+            done.add(start)
+            # Advance the contiguous watermark over every finished range
+            while state["watermark"] in done:
+                done.discard(state["watermark"])
+                state["watermark"] = min(state["watermark"] + chunksize, size)
+            watermark = state["watermark"]
+        manifest.update(key, completeBytes=watermark)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(ranges)))) as executor:
+        for future in [executor.submit(fetch, byte_range) for byte_range in ranges]:
+            future.result()
+
+    os.replace(partial_path, local_path)
+    manifest.update(key, completeBytes=size, complete=True)
+    return local_path, size - offset
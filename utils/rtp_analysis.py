@@ -0,0 +1,339 @@
+import csv
+import time
+from array import array
+import numpy as np
+from utils.packets import (IPPROTO_TCP, IPPROTO_UDP, LINKTYPE_ETHERNET, LINKTYPE_IPV4, LINKTYPE_IPV6, LINKTYPE_LINUX_SLL,
+                           LINKTYPE_LINUX_SLL2, LINKTYPE_RAW)
+from utils.pcap_merge import PcapReader
+
+
+RTP_REPORT_SUFFIX = ".rtp.csv"
+DEFAULT_MIN_PACKETS = 10
+# Clock rates of the static payload types (RFC 3551), dynamic ones are estimated from the stream
+STATIC_CLOCK_RATES = {0: 8000, 3: 8000, 4: 8000, 5: 8000, 6: 16000, 7: 8000, 8: 8000, 9: 8000, 10: 44100, 11: 44100,
+                      12: 8000, 13: 8000, 14: 90000, 15: 8000, 16: 11025, 17: 22050, 18: 8000, 25: 90000, 26: 90000,
+                      28: 90000, 31: 90000, 32: 90000, 33: 90000, 34: 90000}
+COMMON_CLOCK_RATES = np.array([8000, 16000, 24000, 32000, 44100, 48000, 90000])
+RTCP_TYPES = (200, 207)  # SR, RR, SDES, BYE, APP, RTPFB, PSFB, XR
+JITTER_BLOCK = 256
+REPORT_COLUMNS = ["ssrc", "src", "dst", "payloadType", "clockRate", "packets", "expected", "lost", "lossPercent", "duplicates",
+                  "reordered", "gaps", "maxGap", "maxInterArrivalMs", "jitterMs", "maxJitterMs", "rtcpReports",
+                  "rtcpLossPercent", "rtcpJitterMs", "start", "seconds"]
+
+
+def _be16(buf, pos):
+    return (buf[pos].astype(np.uint32) << 8) | buf[pos + 1]
+
+
+def _be32(buf, pos):
+    return (_be16(buf, pos) << 16) | _be16(buf, pos + 2)
+
+
+def _be64(buf, pos):
+    return (_be32(buf, pos).astype(np.uint64) << np.uint64(32)) | _be32(buf, pos + 4)
+
+
+def packet_columns(reader, buf):
+    # Timestamps, data offsets, captured lengths and link types of every packet, the data stays in the mapped file
+    if reader.format == "pcap":
+        # Only the record offsets need a pass in Python, the record headers are decoded at once
+        offsets = np.frombuffer(reader.record_offsets(), dtype=np.int64)
+        headers = buf[offsets[:, None] + np.arange(16)].view(reader._endian + "u4").astype(np.int64)
+        timestamps = headers[:, 0] * 1_000_000_000 + headers[:, 1] * (1 if reader.nanosecond else 1000)
+        linktypes = np.full(len(offsets), next(iter(reader.linktypes.values())), dtype=np.int64)
+        return timestamps, offsets + 16, headers[:, 2], linktypes
+
+    timestamps, offsets, caplens, links = array('q'), array('q'), array('q'), array('i')
+    link_codes = {}
+    for timestamp_ns, data_offset, caplen, link_id in reader.records():
+        timestamps.append(timestamp_ns)
+        offsets.append(data_offset)
+        caplens.append(caplen)
+        links.append(link_codes.setdefault(link_id, len(link_codes)))
+    code_linktypes = np.array([reader.linktypes[link_id] for link_id in link_codes] or [0], dtype=np.int64)
+    return (np.frombuffer(timestamps, dtype=np.int64), np.frombuffer(offsets, dtype=np.int64),
+            np.frombuffer(caplens, dtype=np.int64), code_linktypes[np.frombuffer(links, dtype=np.int32)])
+
+
+def transport_columns(buf, timestamps, offsets, caplens, linktypes, protocols=(IPPROTO_UDP,), min_payload=8):
+    """
+    Decode the IPv4/IPv6 + UDP/TCP headers of every packet at once.
+
+    Parameters:
+    - protocols: IP protocols of the packets to keep, IPPROTO_UDP and/or IPPROTO_TCP.
+    - min_payload: Packets with a shorter transport payload are left out.
+
+    Returns:
+    A dictionary of arrays for the kept packets: "packet" (index among all the packets), "ts", "protocol",
+    "ipv4", "src_hi"/"src_lo"/"dst_hi"/"dst_lo" (addresses as two 64 bit words, IPv4 in the low one),
+    "sport", "dport", "payload" offset and "length".
+    """
+    l2 = np.select([linktypes == LINKTYPE_LINUX_SLL, linktypes == LINKTYPE_LINUX_SLL2, linktypes == LINKTYPE_ETHERNET,
+                    np.isin(linktypes, (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6))], [16, 20, 14, 0], -1)
+    # 802.1Q/802.1ad tags, up to two
+    for _ in range(2):
+        tagged = (linktypes == LINKTYPE_ETHERNET) & (caplens >= l2 + 4)
+        candidates = np.flatnonzero(tagged)
+        ethertype = _be16(buf, offsets[candidates] + l2[candidates] - 2)
+        l2[candidates[(ethertype == 0x8100) | (ethertype == 0x88A8)]] += 4
+
+    keep = np.flatnonzero((l2 >= 0) & (caplens >= l2 + 28))
+    ip = offsets[keep] + l2[keep]
+    end = offsets[keep] + caplens[keep]
+    version = buf[ip] >> 4
+    ipv4 = version == 4
+    header_length = np.where(ipv4, (buf[ip] & 0x0F).astype(np.int64) * 4, 40)
+    protocol = buf[ip + np.where(ipv4, 9, 6)]
+    fragment = np.where(ipv4, _be16(buf, ip + 6) & 0x1FFF, 0)
+    transport_header = np.where(protocol == IPPROTO_TCP, 20, 8)
+    valid = ((((version == 4) & (header_length >= 20)) | (version == 6)) & np.isin(protocol, protocols) & (fragment == 0)
+             & (ip + header_length + transport_header + min_payload <= end))
+
+    keep, ip, end, ipv4, header_length, protocol = keep[valid], ip[valid], end[valid], ipv4[valid], header_length[valid], protocol[valid]
+    ipv6 = np.flatnonzero(~ipv4)
+    src_hi, src_lo = np.zeros(len(ip), dtype=np.uint64), _be32(buf, ip + 12).astype(np.uint64)
+    dst_hi, dst_lo = np.zeros(len(ip), dtype=np.uint64), _be32(buf, ip + 16).astype(np.uint64)
+    for column, position in ((src_hi, 8), (src_lo, 16), (dst_hi, 24), (dst_lo, 32)):
+        column[ipv6] = _be64(buf, ip[ipv6] + position)
+    transport = ip + header_length
+    payload = transport + 8
+    tcp = np.flatnonzero(protocol == IPPROTO_TCP)
+    payload[tcp] = np.minimum(transport[tcp] + (buf[transport[tcp] + 12] >> 4).astype(np.int64) * 4, end[tcp])
+    return {"packet": keep, "ts": timestamps[keep], "protocol": protocol, "ipv4": ipv4,
+            "src_hi": src_hi, "src_lo": src_lo, "dst_hi": dst_hi, "dst_lo": dst_lo,
+            "sport": _be16(buf, transport), "dport": _be16(buf, transport + 2),
+            "payload": payload, "length": end - payload}
+
+
+def _segment_ids(starts, count):
+    # Stream index of every packet, from the first packet of each stream
+    ids = np.zeros(count, dtype=np.int64)
+    ids[starts[1:]] = 1
+    return np.cumsum(ids)
+
+
+def _unwrap(values, bits, starts, stream):
+    # Extended (unwrapped) sequence numbers/timestamps, relative to the first packet of their stream
+    half = 1 << (bits - 1)
+    delta = np.zeros(len(values), dtype=np.int64)
+    delta[1:] = ((values[1:].astype(np.int64) - values[:-1].astype(np.int64) + half) & ((1 << bits) - 1)) - half
+    delta[starts] = 0
+    total = np.cumsum(delta)
+    return total - total[starts][stream], delta
+
+
+def rfc3550_jitter(transit_delta, starts):
+    """
+    Interarrival jitter of RFC 3550 (J += (|D| - J) / 16) after every packet, restarted at every stream start.
+
+    The filter runs on blocks of JITTER_BLOCK packets as scaled cumulative sums, so only the jitter
+    carried from one block to the next is computed in a loop.
+
+    Parameters:
+    - transit_delta: D(i-1, i) of every packet in timestamp units, 0 for the first packet of a stream.
+    - starts: Index of the first packet of every stream.
+
+    Returns:
+    The jitter after every packet, in timestamp units.
+    """
+    count = len(transit_delta)
+    if not count:
+        return np.zeros(0)
+    decay = 15 / 16
+    padding = -count % JITTER_BLOCK
+    values = np.concatenate([np.abs(transit_delta) / 16, np.zeros(padding)]).reshape(-1, JITTER_BLOCK)
+    resets = np.zeros(count + padding, dtype=bool)
+    resets[starts] = True
+    resets = resets.reshape(-1, JITTER_BLOCK)
+
+    index = np.arange(JITTER_BLOCK)
+    # Last stream start at or before every packet within its block, -1 when the stream began in an earlier block
+    last_reset = np.maximum.accumulate(np.where(resets, index, -1), axis=1)
+    scaled = np.cumsum(values * decay ** -index, axis=1)
+    before_reset = np.where(last_reset > 0, np.take_along_axis(scaled, np.maximum(last_reset - 1, 0), axis=1), 0)
+    local = (scaled - before_reset) * decay ** index
+
+    carried = last_reset < 0
+    carry_in = [0.0]
+    block_decay = decay ** JITTER_BLOCK
+    for block_end, continued in zip(local[:-1, -1].tolist(), carried[:-1, -1].tolist()):
+        carry_in.append(block_end + (carry_in[-1] * block_decay if continued else 0))
+    carry_in = np.array(carry_in)
+    jitter = local + np.where(carried, carry_in[:, None] * decay ** (index + 1), 0)
+    return jitter.reshape(-1)[:count]
+
+
+def _clock_rates(payload_types, ts_span, arrival_span):
+    # Static payload types have a known clock, dynamic ones get the common rate closest to their timestamp rate
+    rates = np.array([STATIC_CLOCK_RATES.get(int(payload_type), 0) for payload_type in payload_types], dtype=np.float64)
+    measured = np.divide(ts_span, arrival_span, out=np.zeros(len(ts_span)), where=arrival_span > 0)
+    closest = COMMON_CLOCK_RATES[np.abs(measured[:, None] - COMMON_CLOCK_RATES[None, :]).argmin(axis=1)]
+    return np.where(rates > 0, rates, np.where(measured > 0, closest, 8000))
+
+
+def _rtcp_reports(buf, columns, rtcp):
+    # First report block of every SR/RR: {reported ssrc: (reports, last fraction lost, max jitter)}
+    payload, length = columns["payload"][rtcp], columns["length"][rtcp]
+    packet_type = buf[payload + 1]
+    report_count = buf[payload] & 0x1F
+    block = payload + np.where(packet_type == 200, 28, 8)
+    has_block = np.isin(packet_type, (200, 201)) & (report_count >= 1) & (block + 24 <= payload + length)
+    block = block[has_block]
+    if not len(block):
+        return {}
+    reported_ssrc = _be32(buf, block)
+    fraction_lost = buf[block + 4]
+    jitter = _be32(buf, block + 12)
+    reports = {}
+    for ssrc, fraction, report_jitter in zip(reported_ssrc.tolist(), fraction_lost.tolist(), jitter.tolist()):
+        count, _, max_jitter = reports.get(ssrc, (0, 0, 0))
+        reports[ssrc] = (count + 1, fraction, max(max_jitter, report_jitter))
+    return reports
+
+
+def _address(hi, lo):
+    if hi == 0 and lo <= 0xFFFFFFFF:
+        return ".".join(str((lo >> shift) & 0xFF) for shift in (24, 16, 8, 0))
+    words = [(hi >> shift) & 0xFFFF for shift in (48, 32, 16, 0)] + [(lo >> shift) & 0xFFFF for shift in (48, 32, 16, 0)]
+    return ":".join(f"{word:x}" for word in words)
+
+
+def analyze_rtp(capture_file, min_packets=DEFAULT_MIN_PACKETS):
+    """
+    Per-stream RTP quality of a capture: loss, RFC 3550 jitter, duplicates, reordering and sequence gaps.
+
+    The capture is decoded into columnar arrays (SSRC, sequence number, RTP timestamp, arrival time...)
+    and every statistic is computed with array operations over all the streams at once. A stream is
+    an SSRC between two UDP endpoints; UDP payloads that look like RTP but make up less than
+    `min_packets` packets are ignored. The loss and jitter reported by RTCP receivers are added
+    to the stream they describe.
+
+    Parameters:
+    - capture_file: Merged pcap/pcapng file (uncompressed).
+    - min_packets: Minimum number of packets of a stream.
+
+    Returns:
+    A dictionary with the number of "packets", "rtpPackets" and "rtcpPackets", the "seconds" the
+    analysis took and the "streams", one dictionary per stream with the REPORT_COLUMNS.
+    """
+    start = time.monotonic()
+    with PcapReader(capture_file) as reader:
+        buf = np.frombuffer(reader._mm, dtype=np.uint8)
+        timestamps, offsets, caplens, linktypes = packet_columns(reader, buf)
+        columns = transport_columns(buf, timestamps, offsets, caplens, linktypes)
+
+        payload, length = columns["payload"], columns["length"]
+        first, second = buf[payload], buf[payload + 1]
+        version_2 = (first >> 6) == 2
+        rtcp = version_2 & (second >= RTCP_TYPES[0]) & (second <= RTCP_TYPES[1])
+        rtp = version_2 & ~rtcp & (length >= 12 + 4 * (first & 0x0F).astype(np.int64))
+        rtcp_reports = _rtcp_reports(buf, columns, rtcp)
+
+        rtp = np.flatnonzero(rtp)
+        rtp_payload = payload[rtp]
+        ssrc = _be32(buf, rtp_payload + 8)
+        seq = _be16(buf, rtp_payload + 2)
+        rtp_timestamp = _be32(buf, rtp_payload + 4)
+        payload_type = second[rtp] & 0x7F
+        del buf
+
+    arrival = columns["ts"][rtp]
+    keys = [columns[name][rtp] for name in ("dst_lo", "dst_hi", "dport", "src_lo", "src_hi", "sport")] + [ssrc]
+    # Group the packets by stream, in arrival order within each stream
+    order = np.lexsort([arrival] + keys)
+    keys = [key[order] for key in keys]
+    arrival, seq, rtp_timestamp, payload_type = arrival[order], seq[order], rtp_timestamp[order], payload_type[order]
+    changed = np.zeros(len(order), dtype=bool)
+    if len(order):
+        changed[0] = True
+        for key in keys:
+            changed[1:] |= key[1:] != key[:-1]
+    starts = np.flatnonzero(changed)
+
+    # Streams too short to be RTP rather than UDP payloads that happen to look like it
+    counts = np.diff(np.append(starts, len(order)))
+    kept_streams = counts >= min_packets
+    kept = np.repeat(kept_streams, counts)
+    keys = [key[kept] for key in keys]
+    arrival, seq, rtp_timestamp, payload_type = arrival[kept], seq[kept], rtp_timestamp[kept], payload_type[kept]
+    counts = counts[kept_streams]
+    if not len(counts):
+        return {"packets": len(offsets), "rtpPackets": len(rtp), "rtcpPackets": int(np.count_nonzero(rtcp)),
+                "streams": [], "seconds": time.monotonic() - start}
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    ends = starts + counts - 1
+    stream = _segment_ids(starts, len(arrival))
+
+    # Sequence numbers: loss, duplicates, reordering and gaps
+    extended, _ = _unwrap(seq, 16, starts, stream)
+    lowest = np.minimum.reduceat(extended, starts)
+    expected = np.maximum.reduceat(extended, starts) - lowest + 1
+    # Stream index in the high bits keeps every stream apart in the running max and the sort
+    position = (stream << 40) + (extended - lowest[stream])
+    reordered = np.zeros(len(position), dtype=bool)
+    reordered[1:] = position[1:] < np.maximum.accumulate(position)[:-1]
+    by_sequence = np.sort(position)
+    sequence_stream = by_sequence >> 40
+    duplicate = np.zeros(len(position), dtype=bool)
+    duplicate[1:] = by_sequence[1:] == by_sequence[:-1]
+    hole = np.zeros(len(position), dtype=np.int64)
+    hole[1:] = np.where(sequence_stream[1:] == sequence_stream[:-1], by_sequence[1:] - by_sequence[:-1] - 1, 0)
+    holes = np.flatnonzero(hole > 0)
+    duplicates = np.bincount(sequence_stream[duplicate], minlength=len(starts))
+    reorders = np.bincount(stream[reordered], minlength=len(starts))
+    gaps = np.bincount(sequence_stream[holes], minlength=len(starts))
+    max_gap = np.zeros(len(starts), dtype=np.int64)
+    np.maximum.at(max_gap, sequence_stream[holes], hole[holes])
+    lost = expected - (counts - duplicates)
+
+    # Timing: clock rate, interarrival gaps and RFC 3550 jitter
+    arrival_s = (arrival - arrival[starts][stream]) / 1e9
+    ts_extended, ts_delta = _unwrap(rtp_timestamp, 32, starts, stream)
+    ts_span = np.maximum.reduceat(ts_extended, starts) - np.minimum.reduceat(ts_extended, starts)
+    clock_rate = _clock_rates(payload_type[starts], ts_span, arrival_s[ends])
+    arrival_delta = np.zeros(len(arrival))
+    arrival_delta[1:] = np.diff(arrival_s)
+    arrival_delta[starts] = 0
+    jitter = rfc3550_jitter(arrival_delta * clock_rate[stream] - ts_delta, starts)
+    max_jitter = np.maximum.reduceat(jitter, starts)
+    max_interarrival = np.maximum.reduceat(arrival_delta, starts)
+
+    streams = []
+    for index, first_packet in enumerate(starts.tolist()):
+        dst_lo, dst_hi, dport, src_lo, src_hi, sport, stream_ssrc = (int(key[first_packet]) for key in keys)
+        rate = float(clock_rate[index])
+        reports, rtcp_fraction, rtcp_jitter = rtcp_reports.get(stream_ssrc, (0, None, None))
+        streams.append({
+            "ssrc": f"0x{stream_ssrc:08x}",
+            "src": f"{_address(src_hi, src_lo)}:{sport}",
+            "dst": f"{_address(dst_hi, dst_lo)}:{dport}",
+            "payloadType": int(payload_type[first_packet]),
+            "clockRate": int(rate),
+            "packets": int(counts[index]),
+            "expected": int(expected[index]),
+            "lost": int(lost[index]),
+            "lossPercent": round(100 * max(int(lost[index]), 0) / int(expected[index]), 3),
+            "duplicates": int(duplicates[index]),
+            "reordered": int(reorders[index]),
+            "gaps": int(gaps[index]),
+            "maxGap": int(max_gap[index]),
+            "maxInterArrivalMs": round(float(max_interarrival[index]) * 1000, 3),
+            "jitterMs": round(float(jitter[ends[index]]) / rate * 1000, 3),
+            "maxJitterMs": round(float(max_jitter[index]) / rate * 1000, 3),
+            "rtcpReports": reports,
+            "rtcpLossPercent": round(rtcp_fraction / 256 * 100, 3) if reports else None,
+            "rtcpJitterMs": round(rtcp_jitter / rate * 1000, 3) if reports else None,
+            "start": int(arrival[first_packet]) / 1e9,
+            "seconds": round(float(arrival_s[ends[index]]), 3),
+        })
+
+    return {"packets": len(offsets), "rtpPackets": len(rtp), "rtcpPackets": int(np.count_nonzero(rtcp)),
+            "streams": streams, "seconds": time.monotonic() - start}
+
+
+def write_rtp_report(streams, report_file):
+    """Write the per-stream summary table of analyze_rtp as CSV."""
+    with open(report_file, 'w', newline='') as output:
+        writer = csv.DictWriter(output, fieldnames=REPORT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(streams)
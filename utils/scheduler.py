@@ -0,0 +1,183 @@
+import asyncio
+import json
+import os
+import signal
+import time
+from datetime import datetime, timezone
+from utils.capture_report import CaptureReport
+
+
+DEFAULT_STOP_POLL_INTERVAL = 1
+
+
+def load_job(job_file_path):
+    """
+    Read a batch job file.
+
+    Parameters:
+    - job_file_path: Path of the JSON job file.
+
+    Returns:
+    The job as a dictionary, or None when the file can't be read.
+    """
+    try:
+        with open(job_file_path, 'r') as job_file:
+            return json.load(job_file)
+    except FileNotFoundError:
+        print(f"Job file not found: {job_file_path}")
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON in job file: {e}")
+    return None
+
+
+def iter_capture_services(capture_services):
+    """Yield (capture type, service name, service config) for every service of the "captureServices" config."""
+    for capture_type, services in capture_services.items():
+        if "type" in services:
+            # A capture type that is itself the service
+            yield capture_type, capture_type, services
+        else:
+            for service, service_config in services.items():
+                yield capture_type, service, service_config
+
+
+def find_capture_service(capture_services, name):
+    """
+    Find a service of the "captureServices" config by name.
+
+    Parameters:
+    - capture_services: The "captureServices" section of the config file.
+    - name: Service name ("PCSCF"), or capture type and service ("SIP Servers/PCSCF").
+
+    Returns:
+    A tuple (service name, service config), or None when there is no such service.
+    """
+    category, _, service = name.rpartition("/")
+    for capture_type, service_name, service_config in iter_capture_services(capture_services):
+        if (not category or capture_type == category) and service_name == service:
+            return service_name, service_config
+    return None
+
+
+def parse_start_at(start_at):
+    """Return the epoch time of an ISO 8601 start time, local time when it has no timezone."""
+    moment = datetime.fromisoformat(start_at.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.astimezone()
+    return moment.astimezone(timezone.utc).timestamp()
+
+
+async def wait_for_stop(duration=None, stop_file=None, poll_interval=DEFAULT_STOP_POLL_INTERVAL):
+    """
+    Wait until the capture has to stop: after `duration` seconds, when `stop_file` exists,
+    or on SIGINT/SIGTERM, whichever comes first.
+
+    Returns:
+    The reason of the stop, "duration", "stop file" or the signal name.
+    """
+    loop = asyncio.get_running_loop()
+    stopped = loop.create_future()
+    handled = []
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(stop_signal, lambda s=stop_signal: stopped.done() or stopped.set_result(s.name))
+            handled.append(stop_signal)
+        except (NotImplementedError, RuntimeError):
+            pass  # No signal handlers outside the main thread or on Windows
+
+    deadline = time.monotonic() + duration if duration else None
+    try:
+        while not stopped.done():
+            if deadline is not None and time.monotonic() >= deadline:
+                return "duration"
+            if stop_file and os.path.exists(stop_file):
+                return "stop file"
+            timeout = poll_interval if deadline is None else min(poll_interval, max(deadline - time.monotonic(), 0))
+            await asyncio.wait([stopped], timeout=timeout)
+        return stopped.result()
+    finally:
+        # A second signal during the stop and collect phases falls back to the default behaviour
+        for stop_signal in handled:
+            loop.remove_signal_handler(stop_signal)
+
+
+class CaptureScheduler:
+    """
+    Run several service captures (EcsCapture/Ec2Capture) as one: every capture is prepared,
+    then all start together once the last one is ready, and all stop on the same trigger.
+
+    Captures failing to prepare or start are reported and left out, the others go on.
+
+    Parameters:
+    - captures: A dictionary of {name: ServiceCapture}.
+    - report: CaptureReport timing the start barrier and the capture itself.
+    """
+
+    def __init__(self, captures, report=None):
+        self.captures = captures
+        self.report = report or CaptureReport("batch")
+        self.failed = {}
+        self.started_at = {}
+
+    async def _phase(self, names, phase, run=None):
+        # Run one phase on every capture at once, keeping the ones that succeeded
+        run = run or (lambda name: getattr(self.captures[name], phase)())
+        results = await asyncio.gather(*(run(name) for name in names), return_exceptions=True)
+        succeeded = []
+        for name, result in zip(names, results):
+            if isinstance(result, BaseException):
+                self.failed[name] = f"{phase} failed: {result}"
+            elif phase in ("prepare", "start") and not result:
+                self.failed[name] = f"{phase} failed on every target"
+            else:
+                succeeded.append(name)
+        return succeeded
+
+    async def run(self, stop, start_at=None):
+        """
+        Capture until `stop` returns.
+
+        Parameters:
+        - stop: Coroutine function waiting for the stop trigger (e.g. wait_for_stop), returning its reason.
+        - start_at: Epoch time to start at, the start barrier waits for it after every capture is ready.
+
+        Returns:
+        A dictionary with the "captures" that completed, the stop "reason" and the
+        "startSkew" in seconds between the first and the last capture started.
+        """
+        reason = None
+        running = []
+        try:
+            ready = await self._phase(list(self.captures), "prepare")
+
+            # Start barrier: nothing starts before every capture is ready
+            if ready and start_at:
+                delay = start_at - time.time()
+                if delay > 0:
+                    print(f"Starting {len(ready)} captures in {delay:.0f}s...")
+                    with self.report.phase("start barrier"):
+                        await asyncio.sleep(delay)
+
+            async def start(name):
+                started = await self.captures[name].start()
+                self.started_at[name] = time.monotonic()
+                return started
+
+            running = await self._phase(ready, "start", start)
+            if running:
+                print(f"Started {len(running)} captures: {', '.join(running)}")
+                with self.report.phase("capturing") as phase:
+                    reason = await stop()
+                    phase["reason"] = reason
+                print(f"Stopping the captures ({reason})...")
+                running = await self._phase(running, "stop")
+                running = await self._phase(running, "collect")
+        finally:
+            await asyncio.gather(*(capture.close() for capture in self.captures.values()), return_exceptions=True)
+
+        for name, error in self.failed.items():
+            print(f"Capture {name}: {error}")
+        # Measured when each capture is confirmed running on its targets
+        start_times = list(self.started_at.values())
+        return {"captures": running, "reason": reason,
+                "startSkew": max(start_times) - min(start_times) if start_times else 0}
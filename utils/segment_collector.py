@@ -0,0 +1,76 @@
+import asyncio
+import re
+
+
+DEFAULT_SEGMENT_POLL_INTERVAL = 15
+
+
+class SegmentCollector:
+    """
+    Download rotated capture segments from S3 while the capture is still running.
+
+    Targets upload every finished segment as `tcpdump_<target>_<capture_id>[<leg>]_<seconds><ring index>.pcap[.gz|.zst]`
+    (see pcapScript/uploadSegment.sh). The collector lists the bucket every
+    `poll_interval` seconds and hands new segments of this capture to the
+    download manager, so only the last segment is left to move at stop.
+
+    Parameters:
+    - downloader: S3DownloadManager of the capture.
+    - targets: ECS task ids or EC2 instance ids being captured.
+    - capture_id: Id of this capture, part of every segment name.
+    - poll_interval: Seconds between two bucket listings.
+    """
+
+    def __init__(self, downloader, targets, capture_id, poll_interval=DEFAULT_SEGMENT_POLL_INTERVAL):
+        self.downloader = downloader
+        self.poll_interval = poll_interval
+        self._prefixes = [f"tcpdump_{target}_{capture_id}" for target in targets]
+        # Optional capture leg (e.g. _sip/_media) between the capture id and the segment timestamp
+        self._pattern = re.compile(r"^tcpdump_.+_%s(_[a-z]+)?_\d+\.pcap(\.gz|\.zst)?$" % re.escape(capture_id))
+        self._seen = set()
+        self._downloads = []
+        self._task = None
+
+    def _list_new_segments(self):
+        keys = []
+        paginator = self.downloader.s3_client.get_paginator('list_objects_v2')
+        for prefix in self._prefixes:
+            for page in paginator.paginate(Bucket=self.downloader.bucket_name, Prefix=prefix):
+                for item in page.get('Contents', []):
+                    key = item['Key']
+                    if key not in self._seen and self._pattern.match(key):
+                        self._seen.add(key)
+                        keys.append(key)
+        return keys
+
+    async def poll(self):
+        """List the bucket once and queue the segments not seen yet. Returns the number queued."""
+        keys = await asyncio.to_thread(self._list_new_segments)
+        for key in keys:
+            self._downloads.append(asyncio.wrap_future(self.downloader.submit(key)))
+        return len(keys)
+
+    async def _run(self):
+        while True:
+            try:
+                queued = await self.poll()
+                if queued:
+                    print(f"Downloading {queued} new capture segments in the background...")
+            except Exception as e:
+                print(f"Error listing capture segments: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def finish(self):
+        """Stop polling, queue the last segments and wait for every download. Returns the number of segments."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.poll()
+        await asyncio.gather(*self._downloads)
+        return len(self._seen)
@@ -0,0 +1,188 @@
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from utils.common import list_capture_files
+from utils.packets import parse_sip, parse_transport
+from utils.pcap_merge import CompressedPcapReader, open_capture
+
+
+LATENCY_PERCENTILES = (50, 90, 95, 99)
+SIP_VERSION = b"SIP/2.0"
+
+# tcpdump_<target>[_<capture_id>][<leg>][_<seconds><ring index>].pcap[N][.gz|.zst]
+_SEGMENT_RE = re.compile(r"_\d{12,}$")
+
+
+def capture_source(capture_file):
+    """Name of the task or instance a per-target capture file comes from, segments of a rotating capture included."""
+    name = os.path.basename(capture_file)
+    name = name[len("tcpdump_"):] if name.startswith("tcpdump_") else name
+    name = re.sub(r"\.pcap(ng)?\d*(\.gz|\.zst)?$", "", name)
+    return _SEGMENT_RE.sub("", name)
+
+
+def _sip_packets(reader):
+    # (timestamp_ns, data) of the packets carrying "SIP/2.0", found with a substring search before any decoding
+    if not isinstance(reader, CompressedPcapReader):
+        mm = reader._mm
+        find = mm.find
+        for timestamp_ns, data_offset, caplen, link_id in reader.records():
+            if find(SIP_VERSION, data_offset, data_offset + caplen) >= 0:
+                yield timestamp_ns, mm[data_offset:data_offset + caplen], link_id
+        return
+    for timestamp_ns, _, _, _, _, data, link_id, _ in reader:
+        if SIP_VERSION in data:
+            yield timestamp_ns, data, link_id
+
+
+def summarize_sip_file(capture_file):
+    """
+    Parse the SIP messages of one per-target capture.
+
+    A message seen again with the same endpoints, Call-ID, CSeq, method and status is counted
+    as a retransmission and left out of the dialogs.
+
+    Returns:
+    A dictionary with the "source" task or instance, the number of SIP "messages",
+    "methods" and "responses" counters, "retransmissions" and the INVITE "dialogs" as
+    {call_id: [first INVITE, first 2xx, last final response, its status]} in nanoseconds.
+    """
+    methods = Counter()
+    responses = Counter()
+    dialogs = {}
+    seen = set()
+    messages = retransmissions = 0
+
+    with open_capture(capture_file) as reader:
+        for timestamp_ns, data, link_id in _sip_packets(reader):
+            transport = parse_transport(data, reader.linktypes[link_id])
+            if transport is None:
+                continue
+            _, src_ip, src_port, dst_ip, dst_port, payload = transport
+            sip = parse_sip(payload)
+            if sip is None:
+                continue
+            messages += 1
+            call_id, method, status = sip["call_id"], sip["method"], sip["status"]
+            key = (src_ip, src_port, dst_ip, dst_port, call_id, sip["cseq"], method, status)
+            if key in seen:
+                retransmissions += 1
+                continue
+            seen.add(key)
+
+            if status is None:
+                methods[method] += 1
+            else:
+                responses[status] += 1
+            if method != "INVITE":
+                continue
+            dialog = dialogs.get(call_id)
+            if status is None:
+                if dialog is None:
+                    dialogs[call_id] = [timestamp_ns, None, None, None]
+            elif dialog is not None and status >= 200:
+                if 200 <= status < 300 and dialog[1] is None:
+                    dialog[1] = timestamp_ns
+                if dialog[2] is None or timestamp_ns >= dialog[2]:
+                    dialog[2], dialog[3] = timestamp_ns, status
+
+    return {"file": capture_file, "source": capture_source(capture_file), "messages": messages,
+            "retransmissions": retransmissions, "methods": methods, "responses": responses, "dialogs": dialogs}
+
+
+def merge_dialogs(dialogs, file_dialogs):
+    """Merge the dialogs of one file into `dialogs`, the same Call-ID seen by several tasks being one call."""
+    for call_id, (invite, answered, final, status) in file_dialogs.items():
+        dialog = dialogs.get(call_id)
+        if dialog is None:
+            dialogs[call_id] = [invite, answered, final, status]
+            continue
+        dialog[0] = min(dialog[0], invite)
+        if answered is not None and (dialog[1] is None or answered < dialog[1]):
+            dialog[1] = answered
+        if final is not None and (dialog[2] is None or final > dialog[2]):
+            dialog[2], dialog[3] = final, status
+
+
+def _latency_stats(latencies_ms):
+    if not len(latencies_ms):
+        return {"count": 0}
+    values = np.percentile(latencies_ms, LATENCY_PERCENTILES)
+    stats = {"count": len(latencies_ms), "meanMs": round(float(np.mean(latencies_ms)), 1)}
+    stats.update({f"p{percentile}Ms": round(float(value), 1) for percentile, value in zip(LATENCY_PERCENTILES, values)})
+    stats["maxMs"] = round(float(np.max(latencies_ms)), 1)
+    return stats
+
+
+def summarize_sip(paths, workers=None):
+    """
+    SIP overview of a capture run, without merging or opening it.
+
+    The per-target captures are parsed in parallel by a process pool, largest first, then the
+    INVITE dialogs are merged across tasks by Call-ID.
+
+    Parameters:
+    - paths: Capture files, or folders of per-target captures (e.g. a run folder under DEFAULT_PCAP_DIR).
+    - workers: Number of processes, the number of CPUs by default.
+
+    Returns:
+    A dictionary with "files", "messages", "retransmissions", "methods" and "responses" counts,
+    the "calls" outcomes, the INVITE to 2xx "setupLatency" percentiles, the failed calls by
+    final status ("failures"), one entry per task or instance ("sources") and "seconds".
+    """
+    start = time.monotonic()
+    capture_files = []
+    for path in paths:
+        capture_files += list_capture_files(path) if os.path.isdir(path) else [path]
+    capture_files.sort(key=os.path.getsize, reverse=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(capture_files) or 1))
+
+    methods, responses, dialogs, sources = Counter(), Counter(), {}, {}
+
+    def add(result):
+        methods.update(result["methods"])
+        responses.update(result["responses"])
+        merge_dialogs(dialogs, result["dialogs"])
+        source = sources.setdefault(result["source"], {"files": 0, "messages": 0, "retransmissions": 0, "errors": 0, "calls": 0})
+        source["files"] += 1
+        source["messages"] += result["messages"]
+        source["retransmissions"] += result["retransmissions"]
+        source["errors"] += sum(count for status, count in result["responses"].items() if status >= 400)
+        source["calls"] += len(result["dialogs"])
+
+    if workers == 1:
+        for capture_file in capture_files:
+            try:
+                add(summarize_sip_file(capture_file))
+            except Exception as e:
+                print(f"Error parsing SIP in {capture_file}: {e}")
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(summarize_sip_file, capture_file): capture_file for capture_file in capture_files}
+            for future in as_completed(futures):
+                try:
+                    add(future.result())
+                except Exception as e:
+                    print(f"Error parsing SIP in {futures[future]}: {e}")
+
+    latencies_ms = np.array([(answered - invite) / 1e6 for invite, answered, _, _ in dialogs.values() if answered is not None])
+    failures = Counter(status for _, answered, _, status in dialogs.values() if answered is None and status is not None)
+    return {
+        "files": len(capture_files),
+        "workers": workers,
+        "messages": sum(source["messages"] for source in sources.values()),
+        "retransmissions": sum(source["retransmissions"] for source in sources.values()),
+        "methods": dict(methods.most_common()),
+        "responses": {str(status): count for status, count in sorted(responses.items())},
+        "calls": {"total": len(dialogs), "answered": len(latencies_ms), "failed": sum(failures.values()),
+                  "noFinalResponse": sum(1 for _, _, final, _ in dialogs.values() if final is None)},
+        "setupLatency": _latency_stats(latencies_ms),
+        "failures": {str(status): count for status, count in failures.most_common()},
+        "sources": dict(sorted(sources.items())),
+        "seconds": time.monotonic() - start,
+    }
@@ -0,0 +1,243 @@
+import json
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from utils.pcap_merge import (PCAP_GLOBAL_HEADER, PCAPNG_BYTE_ORDER_MAGIC, PCAPNG_EPB, PCAPNG_IDB, PCAPNG_OBSOLETE_PB,
+                              PCAPNG_SHB, PcapFormatError, PcapReader)
+
+
+TIME_INDEX_SUFFIX = ".times.json"
+TIME_OFFSETS_SUFFIX = ".times.bin"
+DEFAULT_INDEX_INTERVAL = 1000
+
+
+class TimeIndexer:
+    """
+    Build a sparse timestamp index of a capture while it is written.
+
+    One entry (timestamp, file offset) is kept every `interval` packets, so a time window
+    of the capture can be found with a binary search and at most `interval` packets read
+    on each side of it.
+
+    Parameters:
+    - interval: Number of packets between two entries.
+    """
+
+    def __init__(self, interval=DEFAULT_INDEX_INTERVAL):
+        self.interval = interval
+        self.timestamps = array('q')
+        self.offsets = array('q')
+        self.packets = 0
+        self.last = None
+
+    def add(self, offset, timestamp_ns):
+        if self.packets % self.interval == 0:
+            self.timestamps.append(timestamp_ns)
+            self.offsets.append(offset)
+        self.packets += 1
+        self.last = timestamp_ns
+
+    def save(self, capture_file, file_format, interface_block_offsets=()):
+        """Write the index next to the capture: <capture>.times.json and <capture>.times.bin."""
+        with open(capture_file + TIME_OFFSETS_SUFFIX, 'wb') as offsets_file:
+            self.timestamps.tofile(offsets_file)
+            self.offsets.tofile(offsets_file)
+
+        with open(capture_file + TIME_INDEX_SUFFIX, 'w') as index_file:
+            json.dump({
+                "format": file_format,
+                "captureSize": os.path.getsize(capture_file),
+                "interfaceBlockOffsets": list(interface_block_offsets),
+                "interval": self.interval,
+                "entries": len(self.offsets),
+                "packets": self.packets,
+                "first": self.timestamps[0] if self.timestamps else None,
+                "last": self.last,
+            }, index_file)
+
+
+def build_time_index(capture_file, interval=DEFAULT_INDEX_INTERVAL):
+    """
+    Index an existing capture (e.g. merged with mergecap) in a separate pass.
+
+    Returns:
+    The number of packets indexed.
+    """
+    indexer = TimeIndexer(interval)
+    with PcapReader(capture_file) as reader:
+        interface_block_offsets = []
+        if reader.format == "pcapng":
+            blocks = list(reader._iter_blocks())
+            if sum(block_type == PCAPNG_SHB for block_type, _, _, _ in blocks) > 1:
+                raise PcapFormatError(f"{capture_file} has several pcapng sections, it can't be time indexed")
+            interface_block_offsets = [offset for block_type, offset, _, _ in blocks if block_type == PCAPNG_IDB]
+            for timestamp_ns, data_offset, _, _ in reader.records():
+                indexer.add(data_offset - 28, timestamp_ns)
+        else:
+            # Only the record lengths are read, timestamps are decoded for the indexed records
+            offsets = reader.record_offsets()
+            timestamp = struct.Struct(reader._endian + "II")
+            fraction_ns = 1 if reader.nanosecond else 1000
+            for offset in offsets[::interval]:
+                ts_sec, ts_frac = timestamp.unpack_from(reader._mm, offset)
+                indexer.timestamps.append(ts_sec * 1_000_000_000 + ts_frac * fraction_ns)
+                indexer.offsets.append(offset)
+            indexer.packets = len(offsets)
+            if offsets:
+                ts_sec, ts_frac = timestamp.unpack_from(reader._mm, offsets[-1])
+                indexer.last = ts_sec * 1_000_000_000 + ts_frac * fraction_ns
+    indexer.save(capture_file, reader.format, interface_block_offsets)
+    return indexer.packets
+
+
+def load_time_index(capture_file):
+    """Return the time index of a capture, or None when it is missing or outdated."""
+    try:
+        with open(capture_file + TIME_INDEX_SUFFIX, 'r') as index_file:
+            index = json.load(index_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if index.get("captureSize") != os.path.getsize(capture_file):
+        return None
+    return index
+
+
+def parse_window_time(value, reference_ns=None):
+    """
+    Epoch nanoseconds of a time window bound.
+
+    Parameters:
+    - value: Epoch seconds ("1704967330.5"), ISO 8601 date and time ("2024-01-11T14:02:10"), or a
+      time of day ("14:02:10") taken on the day of `reference_ns`. Local time when no timezone is given.
+    - reference_ns: Epoch nanoseconds giving the day of a time of day, e.g. the first packet of the capture.
+    """
+    try:
+        return int(float(value) * 1_000_000_000)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        if reference_ns is None:
+            raise
+        day = datetime.fromtimestamp(reference_ns / 1e9).date().isoformat()
+        moment = datetime.fromisoformat(f"{day}T{value}")
+    if moment.tzinfo is None:
+        moment = moment.astimezone()
+    return int(moment.timestamp() * 1_000_000) * 1000
+
+
+def _packet_walker(reader, mm, index):
+    # Returns a function giving (timestamp_ns or None for non-packet blocks, next offset) of the record at an offset
+    end = len(mm)
+    if reader.format == "pcap":
+        fraction_ns = 1 if reader.nanosecond else 1000
+        record = struct.Struct(reader._endian + "IIII")
+
+        def next_pcap_record(offset):
+            if offset + 16 > end:
+                return None, end
+            ts_sec, ts_frac, caplen, _ = record.unpack_from(mm, offset)
+            return ts_sec * 1_000_000_000 + ts_frac * fraction_ns, min(offset + 16 + caplen, end)
+        return next_pcap_record
+
+    endian = _pcapng_endian(mm)
+    converters = []
+    for interface_offset in index["interfaceBlockOffsets"]:
+        block_length = struct.unpack_from(endian + "I", mm, interface_offset + 4)[0]
+        _, tsresol, tsoffset = PcapReader._parse_idb(mm, interface_offset, block_length, endian)
+        converters.append(PcapReader._timestamp_converter(tsresol, tsoffset))
+
+    def next_pcapng_block(offset):
+        if offset + 12 > end:
+            return None, end
+        block_type, block_length = struct.unpack_from(endian + "II", mm, offset)
+        next_offset = min(offset + max(block_length, 12), end)
+        if block_type == PCAPNG_EPB:
+            interface_id, ts_high, ts_low = struct.unpack_from(endian + "III", mm, offset + 8)
+        elif block_type == PCAPNG_OBSOLETE_PB:
+            interface_id, _, ts_high, ts_low = struct.unpack_from(endian + "HHII", mm, offset + 8)
+        else:
+            return None, next_offset
+        return converters[interface_id]((ts_high << 32) | ts_low), next_offset
+    return next_pcapng_block
+
+
+def _seek_time(next_record, offset, end, bound, after):
+    # First packet at or after `offset` with a timestamp >= bound (> bound when `after`), and the packets skipped
+    skipped = 0
+    while offset < end:
+        timestamp_ns, next_offset = next_record(offset)
+        if timestamp_ns is not None:
+            if timestamp_ns > bound or (timestamp_ns == bound and not after):
+                break
+            skipped += 1
+        offset = next_offset
+    return offset, skipped
+
+
+def slice_capture(capture_file, start_ns, end_ns, output_file):
+    """
+    Write the packets of a time window of a timestamp-ordered capture (e.g. merged) into a new capture.
+
+    The time index gives the records around both ends of the window with a binary search, only
+    those are read from the memory-mapped capture, and the window is copied as one block.
+
+    Parameters:
+    - capture_file: Capture with a time index next to it.
+    - start_ns: Start of the window, epoch nanoseconds.
+    - end_ns: End of the window (included), epoch nanoseconds.
+    - output_file: Path of the capture to write.
+
+    Returns:
+    A dictionary with the number of packets and bytes written and seconds it took.
+    """
+    start = time.monotonic()
+    index = load_time_index(capture_file)
+    if index is None:
+        raise FileNotFoundError(f"No up-to-date time index for {capture_file}")
+
+    timestamps, offsets = array('q'), array('q')
+    with open(capture_file + TIME_OFFSETS_SUFFIX, 'rb') as offsets_file:
+        timestamps.fromfile(offsets_file, index["entries"])
+        offsets.fromfile(offsets_file, index["entries"])
+
+    with PcapReader(capture_file) as reader, open(output_file, 'wb') as output, memoryview(reader._mm) as view:
+        size = len(view)
+        if reader.format == "pcap":
+            output.write(view[:PCAP_GLOBAL_HEADER.size])
+        else:
+            endian = _pcapng_endian(view)
+            output.write(view[:struct.unpack_from(endian + "I", view, 4)[0]])
+        if not offsets:
+            return {"packets": 0, "bytes": 0, "seconds": time.monotonic() - start}
+        next_record = _packet_walker(reader, view, index)
+
+        # Entry i is packet i * interval: start from the last entry before the window, stop after the last one in it
+        first_entry = max(bisect_left(timestamps, start_ns) - 1, 0)
+        start_offset, skipped = _seek_time(next_record, offsets[first_entry], size, start_ns, False)
+        first_packet = first_entry * index["interval"] + skipped
+
+        last_entry = max(bisect_right(timestamps, end_ns) - 1, 0)
+        if offsets[last_entry] > start_offset:
+            scan_offset, scan_packet = offsets[last_entry], last_entry * index["interval"]
+        else:
+            scan_offset, scan_packet = start_offset, first_packet
+        end_offset, skipped = _seek_time(next_record, scan_offset, size, end_ns, True)
+
+        if reader.format == "pcapng":
+            # Interfaces declared before the window, the ones declared inside it come with the copied blocks
+            for interface_offset in index["interfaceBlockOffsets"]:
+                if interface_offset < start_offset:
+                    block_length = struct.unpack_from(endian + "I", view, interface_offset + 4)[0]
+                    output.write(view[interface_offset:interface_offset + block_length])
+        output.write(view[start_offset:end_offset])
+
+    return {"packets": scan_packet + skipped - first_packet, "bytes": end_offset - start_offset, "seconds": time.monotonic() - start}
+
+
+def _pcapng_endian(buf):
+    return "<" if struct.unpack_from("<I", buf, 8)[0] == PCAPNG_BYTE_ORDER_MAGIC else ">"